@@ -0,0 +1,50 @@
+"""
+Compare updating instances of many schemas one save() at a time against
+bulk_update().
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.bulk_update
+"""
+from __future__ import print_function, unicode_literals
+
+import django
+
+django.setup()
+
+from django.db import transaction  # NOQA isort:skip
+
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import UnmanagedBar, UnmanagedFoo  # NOQA isort:skip
+
+from .utils import compare, create_tenant_schemas, test_database  # NOQA isort:skip
+
+
+def save(bars):
+    with transaction.atomic():
+        for bar in bars:
+            bar.save(update_fields=['foo'])
+
+
+def main(tenants=10, rows=2000):
+    with test_database():
+        table_schemas_list = create_tenant_schemas(tenants)
+        bars = []
+        for table_schemas in table_schemas_list:
+            SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).copy_from(
+                (UnmanagedFoo(pk=pk) for pk in (1, 2)), fields=['id']
+            )
+            SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).copy_from(
+                (UnmanagedBar(pk=pk, foo_id=1) for pk in range(1, rows + 1)), fields=['id', 'foo']
+            )
+            bars.extend(SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas))
+        for bar in bars:
+            bar.foo_id = 2
+        queryset = SchemaQuerySet(UnmanagedBar)
+        compare([
+            ('save', lambda: save(bars)),
+            ('bulk_update', lambda: queryset.bulk_update(bars, ['foo'])),
+            ('bulk_update batch=1000', lambda: queryset.bulk_update(bars, ['foo'], batch_size=1000)),
+        ], number=1, repeat=3, unit='%d rows' % len(bars))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare the compilation time of schema queries against vanilla ones.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.compilation
+"""
+from __future__ import print_function, unicode_literals
+
+from functools import partial
+
+import django
+
+django.setup()
+
+from django.db import connection  # NOQA isort:skip
+from django.db.models import sql  # NOQA isort:skip
+
+from schema_query.query import SchemaQuery  # NOQA isort:skip
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import Bar, UnmanagedBar, UnmanagedFoo, UnmanagedFooSubclass  # NOQA isort:skip
+
+from .utils import compare  # NOQA isort:skip
+
+TABLE_SCHEMAS = {
+    UnmanagedFoo._meta.db_table: 'schema',
+    UnmanagedBar._meta.db_table: 'schema',
+    UnmanagedBar.foos.through._meta.db_table: 'schema',
+    UnmanagedFooSubclass._meta.db_table: 'schema',
+}
+
+
+def compile_query(query_factory, model):
+    query = query_factory(model)
+    query.add_filter(('foo__m2m_bars__foo__id__gt', 0))
+    query.add_select_related(['foo'])
+    query.add_ordering('-pk')
+    return query.get_compiler(connection=connection).as_sql()
+
+
+def compile_retargeted(queryset, table_schemas):
+    return queryset.retarget(table_schemas).query.get_compiler(connection=connection).as_sql()
+
+
+def main(number=2000, repeat=5):
+    queryset = SchemaQuerySet(UnmanagedBar, table_schemas=TABLE_SCHEMAS).filter(
+        foo__m2m_bars__foo__id__gt=0,
+    ).select_related('foo').order_by('-pk')
+    other_table_schemas = dict.fromkeys(TABLE_SCHEMAS, 'other')
+    benchmarks = [
+        ('sql.Query', lambda: compile_query(sql.Query, Bar)),
+        ('SchemaQuery', lambda: compile_query(partial(SchemaQuery, table_schemas=TABLE_SCHEMAS), UnmanagedBar)),
+        # Only the first compilation is a template cache miss.
+        ('retarget', lambda: compile_retargeted(queryset, other_table_schemas)),
+    ]
+    compare(benchmarks, number=number, repeat=repeat, unit='query')
+
+
+if __name__ == '__main__':
+    main()
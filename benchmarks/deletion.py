@@ -0,0 +1,62 @@
+"""
+Compare cascading deletions loading instances against set based ones.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.deletion
+"""
+from __future__ import print_function, unicode_literals
+
+import time
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction  # NOQA isort:skip
+from django.db.models import signals  # NOQA isort:skip
+
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import UnmanagedBar, UnmanagedFoo  # NOQA isort:skip
+
+from .utils import create_tenant_schemas, test_database  # NOQA isort:skip
+
+
+def receiver(sender, instance, **kwargs):
+    pass
+
+
+def load(table_schemas, parents, children):
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE %s.bar' % table_schemas[UnmanagedBar._meta.db_table])
+    SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).copy_from(
+        (UnmanagedFoo(pk=pk) for pk in range(1, parents + 1)), fields=['id']
+    )
+    through = UnmanagedBar.foos.through
+    SchemaQuerySet(through, table_schemas=table_schemas).copy_from(
+        (through(bar_id=pk, foo_id=pk % parents + 1) for pk in range(1, children + 1)), fields=['bar', 'foo']
+    )
+    SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).copy_from(
+        (UnmanagedBar(pk=pk, foo_id=pk % parents + 1) for pk in range(1, children + 1)), fields=['id', 'foo']
+    )
+
+
+def main(parents=10, children=100000):
+    with test_database():
+        table_schemas, = create_tenant_schemas(1)
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas)
+        for name, instances in (('set', False), ('instances', True)):
+            load(table_schemas, parents, children)
+            if instances:
+                # A receiver requires the deleted instances to be loaded.
+                signals.post_delete.connect(receiver, sender=UnmanagedFoo)
+            try:
+                start = time.time()
+                with transaction.atomic():
+                    deleted, _ = queryset.delete()
+                elapsed = time.time() - start
+            finally:
+                signals.post_delete.disconnect(receiver, sender=UnmanagedFoo)
+            print('%-12s %8d rows %8.2f s' % (name, deleted, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare the peak memory of loading a schema queryset at once against chunked
+iteration over a server-side cursor.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.iteration
+"""
+from __future__ import print_function, unicode_literals
+
+import time
+import tracemalloc
+
+import django
+
+django.setup()
+
+from django.db import transaction  # NOQA isort:skip
+
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import UnmanagedBar, UnmanagedFoo  # NOQA isort:skip
+
+from .utils import create_tenant_schemas, test_database  # NOQA isort:skip
+
+
+def consume(iterable):
+    count = 0
+    for _ in iterable:
+        count += 1
+    return count
+
+
+def measure(name, func):
+    tracemalloc.start()
+    start = time.time()
+    try:
+        with transaction.atomic():
+            count = func()
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    print('%-32s %8d rows %8.2f s %10.1f KiB peak' % (name, count, elapsed, peak / 1024.0))
+
+
+def main(rows=100000, chunk_size=2000):
+    with test_database():
+        table_schemas, = create_tenant_schemas(1)
+        foos = SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas)
+        foos.copy_from((UnmanagedFoo(pk=pk) for pk in range(1, rows + 1)), fields=['id'])
+        bars = SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas)
+        bars.copy_from((UnmanagedBar(pk=pk, foo_id=pk) for pk in range(1, rows + 1)), fields=['id', 'foo'])
+        querysets = [
+            ('instances', bars.all()),
+            ('select_related', bars.select_related('foo')),
+            ('values', bars.values('pk', 'foo_id')),
+        ]
+        for name, queryset in querysets:
+            measure('%s list()' % name, lambda: len(list(queryset.all())))
+            measure('%s iterator()' % name, lambda: consume(queryset.iterator(chunk_size=chunk_size)))
+
+
+if __name__ == '__main__':
+    main()
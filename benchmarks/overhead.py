@@ -0,0 +1,188 @@
+"""
+Compare the overhead of schema querysets and models against vanilla ones on
+the same data for a range of schema and row counts.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.overhead
+
+The schema to vanilla time ratios are compared against the baseline stored
+for the running Django version in benchmarks/baselines and the run fails when
+one of them regressed by more than the tolerance. Use --save to store the
+ratios of the current run as the new baseline.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import django
+
+django.setup()
+
+from django.db import connection  # NOQA isort:skip
+
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import Bar, Foo, UnmanagedBar, UnmanagedFoo  # NOQA isort:skip
+
+from .utils import compare, create_tenant_schemas, test_database  # NOQA isort:skip
+
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# The vanilla models are bound to the tables of the template schema.
+TEMPLATE_TABLE_SCHEMAS = {
+    UnmanagedFoo._meta.db_table: 'schema',
+    UnmanagedBar._meta.db_table: 'schema',
+    UnmanagedBar.foos.through._meta.db_table: 'schema',
+}
+
+
+def load(table_schemas_list, rows):
+    """
+    Replace the rows of the tables of each of the schemas by rows foo and bar.
+    """
+    for table_schemas in table_schemas_list:
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE %s' % ', '.join(
+                '"%s"."%s"' % (schema, table) for table, schema in sorted(table_schemas.items())
+            ))
+        SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).copy_from(
+            (UnmanagedFoo(pk=pk) for pk in range(1, rows + 1)), fields=['id']
+        )
+        SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).copy_from(
+            (UnmanagedBar(pk=pk, foo_id=pk) for pk in range(1, rows + 1)), fields=['id', 'foo']
+        )
+        # The primary keys were copied explicitly.
+        with connection.cursor() as cursor:
+            for model in (UnmanagedFoo, UnmanagedBar):
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [
+                    '"%s"."%s"' % (table_schemas[model._meta.db_table], model._meta.db_table), rows,
+                ])
+
+
+def vanilla_querysets():
+    return Foo.objects.all(), Bar.objects.all(), Bar.foos.through.objects.all()
+
+
+def schema_querysets(table_schemas):
+    return (
+        SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas),
+        SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas),
+        SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=table_schemas),
+    )
+
+
+# Each benchmark factory receives a callable returning the (foo, bar, through)
+# querysets to use and the row count and returns a (stmt, setup) tuple.
+
+def compilation(querysets, rows):
+    def stmt():
+        queryset = querysets()[1].filter(foo__m2m_bars__foo__id__gt=0).select_related('foo').order_by('-pk')
+        return queryset.query.get_compiler(connection=connection).as_sql()
+    return stmt, 'pass'
+
+
+def cloning(querysets, rows):
+    queryset = querysets()[1].filter(foo__gt=0)
+    return lambda: queryset.all().filter(pk=1), 'pass'
+
+
+def iteration(querysets, rows):
+    return lambda: list(querysets()[0]), 'pass'
+
+
+def create_save(querysets, rows):
+    def stmt():
+        obj = querysets()[0].create()
+        obj.save()
+    return stmt, 'pass'
+
+
+def cascade_deletion(querysets, rows):
+    state = {}
+
+    def setup():
+        foos, bars, throughs = querysets()
+        foo = foos.create()
+        bars = bars.bulk_create([bars.model(foo=foo) for _ in range(rows)])
+        throughs.bulk_create([throughs.model(bar_id=bar.pk, foo=foo) for bar in bars])
+        state['queryset'] = foos.filter(pk=foo.pk)
+
+    def stmt():
+        state['queryset'].delete()
+    return stmt, setup
+
+
+BENCHMARKS = (
+    ('compilation', compilation, lambda rows: 200),
+    ('cloning', cloning, lambda rows: 1000),
+    ('iteration', iteration, lambda rows: max(1, 10000 // rows)),
+    ('create_save', create_save, lambda rows: 100),
+    ('cascade_deletion', cascade_deletion, lambda rows: 1),
+)
+
+
+def baseline_path():
+    return os.path.join(BASELINES_DIR, 'django-%d.%d.json' % django.VERSION[:2])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--schemas', default='1,10', help='comma separated schema counts')
+    parser.add_argument('--rows', default='10,1000', help='comma separated row counts')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative ratio regression')
+    parser.add_argument('--save', action='store_true', help='store the ratios of this run as the baseline')
+    args = parser.parse_args(argv)
+    schema_counts = [int(count) for count in args.schemas.split(',')]
+    row_counts = [int(count) for count in args.rows.split(',')]
+
+    path = baseline_path()
+    baseline = {}
+    if os.path.exists(path):
+        with open(path) as fp:
+            baseline = json.load(fp)
+
+    ratios = {}
+    regressions = []
+    print('%-44s %12s %12s %7s %9s' % ('benchmark', 'vanilla us', 'schema us', 'ratio', 'baseline'))
+    with test_database():
+        table_schemas_list = create_tenant_schemas(max(schema_counts))
+        for rows, schema_count in itertools.product(row_counts, schema_counts):
+            # The schema querysets go through the tenant schemas in turn.
+            tenants = itertools.cycle(table_schemas_list[:schema_count])
+            for name, factory, number in BENCHMARKS:
+                load([TEMPLATE_TABLE_SCHEMAS] + table_schemas_list[:schema_count], rows)
+                results = compare([
+                    ('vanilla',) + factory(vanilla_querysets, rows),
+                    ('schema',) + factory(lambda: schema_querysets(next(tenants)), rows),
+                ], number=number(rows), repeat=args.repeat, verbose=False)
+                key = '%s/schemas=%d/rows=%d' % (name, schema_count, rows)
+                ratio = ratios[key] = round(results['schema'] / results['vanilla'], 3)
+                expected = baseline.get(key)
+                status = ''
+                if expected is not None and ratio > expected * (1 + args.tolerance):
+                    regressions.append(key)
+                    status = ' REGRESSION'
+                print('%-44s %12.1f %12.1f %7.2f %9s%s' % (
+                    key, results['vanilla'] * 1e6, results['schema'] * 1e6, ratio,
+                    '-' if expected is None else '%.2f' % expected, status,
+                ))
+
+    if args.save:
+        baseline.update(ratios)
+        if not os.path.isdir(BASELINES_DIR):
+            os.makedirs(BASELINES_DIR)
+        with open(path, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        print('Saved %d ratios to %s' % (len(ratios), path))
+    if regressions:
+        print('%d regression(s) above %d%% of the baseline.' % (len(regressions), args.tolerance * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
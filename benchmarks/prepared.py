@@ -0,0 +1,48 @@
+"""
+Compare primary key lookups with and without server-side prepared statements.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.prepared
+"""
+from __future__ import print_function, unicode_literals
+
+import django
+
+django.setup()
+
+from schema_query.prepared import PreparedStatements  # NOQA isort:skip
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import UnmanagedFoo  # NOQA isort:skip
+
+from .utils import compare, create_tenant_schemas, test_database  # NOQA isort:skip
+
+
+def lookups(querysets, lookups_per_tenant):
+    for queryset in querysets:
+        for pk in range(1, lookups_per_tenant + 1):
+            queryset.get(pk=pk)
+
+
+def main(tenants=20, rows=100, lookups_per_tenant=10):
+    with test_database():
+        table_schemas_list = create_tenant_schemas(tenants)
+        for table_schemas in table_schemas_list:
+            SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).bulk_create(
+                [UnmanagedFoo(pk=pk) for pk in range(1, rows + 1)]
+            )
+        prepared_statements = PreparedStatements(maxsize=tenants)
+        querysets = [
+            SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas) for table_schemas in table_schemas_list
+        ]
+        prepared_querysets = [queryset.prepare(prepared_statements) for queryset in querysets]
+        compare([
+            ('unprepared', lambda: lookups(querysets, lookups_per_tenant)),
+            ('prepared', lambda: lookups(prepared_querysets, lookups_per_tenant)),
+        ], number=5, unit='run')
+        info = prepared_statements.info()
+        print('%d statements prepared, %d generic plans, %.1f ms of planning saved' % (
+            info['prepared'], info['generic_plans'], info['planning_time_saved'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
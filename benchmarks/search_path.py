@@ -0,0 +1,53 @@
+"""
+Compare schema qualified table names against search path resolution.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.search_path
+"""
+from __future__ import print_function, unicode_literals
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction  # NOQA isort:skip
+from django.test.utils import CaptureQueriesContext  # NOQA isort:skip
+
+from schema_query.queryset import SchemaQuerySet  # NOQA isort:skip
+from tests.models import UnmanagedFoo  # NOQA isort:skip
+
+from .utils import compare, create_tenant_schemas, test_database  # NOQA isort:skip
+
+
+def lookups(table_schemas_list, search_path, lookups_per_tenant):
+    for table_schemas in table_schemas_list:
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas, search_path=search_path)
+        with transaction.atomic():
+            for pk in range(1, lookups_per_tenant + 1):
+                queryset.get(pk=pk)
+
+
+def main(tenants=20, rows=100, lookups_per_tenant=10):
+    with test_database():
+        table_schemas_list = create_tenant_schemas(tenants)
+        for table_schemas in table_schemas_list:
+            SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).bulk_create(
+                [UnmanagedFoo(pk=pk) for pk in range(1, rows + 1)]
+            )
+        for search_path in (False, True):
+            with CaptureQueriesContext(connection) as ctx:
+                lookups(table_schemas_list, search_path, lookups_per_tenant)
+            selects = {
+                query['sql'].split(' WHERE ')[0] for query in ctx.captured_queries
+                if query['sql'].startswith('SELECT')
+            }
+            print('search_path=%s: %d statements, %d distinct SELECT texts' % (
+                search_path, len(ctx.captured_queries), len(selects)
+            ))
+        compare([
+            ('qualified', lambda: lookups(table_schemas_list, False, lookups_per_tenant)),
+            ('search_path', lambda: lookups(table_schemas_list, True, lookups_per_tenant)),
+        ], number=5, unit='run')
+
+
+if __name__ == '__main__':
+    main()
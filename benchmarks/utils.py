@@ -0,0 +1,66 @@
+from __future__ import print_function, unicode_literals
+
+import timeit
+from contextlib import contextmanager
+
+from django.db import connection
+
+from tests.models import UnmanagedBar, UnmanagedFoo, UnmanagedFooSubclass
+
+TABLES = (
+    UnmanagedFoo._meta.db_table,
+    UnmanagedFooSubclass._meta.db_table,
+    UnmanagedBar._meta.db_table,
+    UnmanagedBar.foos.through._meta.db_table,
+)
+
+
+@contextmanager
+def test_database():
+    """
+    Create the test database and the tables of the template schema.
+    """
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def create_tenant_schemas(count, template='schema'):
+    """
+    Create count tenant schemas with tables like the template schema ones and
+    return their table schemas mappings.
+    """
+    table_schemas_list = []
+    with connection.cursor() as cursor:
+        for index in range(count):
+            schema = 'tenant_%d' % index
+            cursor.execute('CREATE SCHEMA %s' % schema)
+            for table in TABLES:
+                cursor.execute('CREATE TABLE %s.%s (LIKE %s.%s INCLUDING ALL)' % (schema, table, template, table))
+            table_schemas_list.append(dict.fromkeys(TABLES, schema))
+    return table_schemas_list
+
+
+def compare(benchmarks, number, repeat=5, unit='op', verbose=True):
+    """
+    Time each of the (name, callable[, setup]) benchmarks, interleaving their
+    runs so they are equally affected by noise, and report them against the
+    first. The optional setup callable is run before each batch of number
+    calls and isn't timed.
+    """
+    timings = {benchmark[0]: [] for benchmark in benchmarks}
+    for _ in range(repeat):
+        for benchmark in benchmarks:
+            name, stmt = benchmark[:2]
+            setup = benchmark[2] if len(benchmark) > 2 else 'pass'
+            timings[name].append(timeit.timeit(stmt, setup=setup, number=number) / number)
+    baseline = min(timings[benchmarks[0][0]])
+    results = {}
+    for benchmark in benchmarks:
+        name = benchmark[0]
+        best = results[name] = min(timings[name])
+        if verbose:
+            print('%-24s %10.1f us/%s  %.2fx' % (name, best * 1e6, unit, best / baseline))
+    return results
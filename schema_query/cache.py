@@ -0,0 +1,244 @@
+from __future__ import unicode_literals
+
+import hashlib
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+# Result caches invalidated by the writes of schema queries.
+result_caches = weakref.WeakSet()
+
+
+class LRUCache(object):
+    """
+    Thread-safe bounded mapping evicting its least recently used entries and
+    keeping track of its hits and misses.
+
+    When maxweight is specified entries are also evicted until the sum of the
+    weights they were set with fits in it.
+    """
+
+    def __init__(self, maxsize, maxweight=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self.hits = self.misses = 0
+            self.weight = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, weight=0):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[1]
+            self._entries[key] = (value, weight)
+            self.weight += weight
+            while len(self._entries) > self.maxsize or (
+                    self.maxweight is not None and self.weight > self.maxweight):
+                self.weight -= self._entries.popitem(last=False)[1][1]
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'maxsize': self.maxsize,
+            'currsize': len(self._entries),
+        }
+
+
+def result_size(result):
+    """
+    Return the approximate size in bytes of a list of rows chunks or of a row.
+    """
+    if result is None:
+        return 0
+    if isinstance(result, tuple):
+        return sys.getsizeof(result) + sum(sys.getsizeof(value) for value in result)
+    return sys.getsizeof(result) + sum(
+        sys.getsizeof(chunk) + sum(result_size(row) for row in chunk) for chunk in result
+    )
+
+
+def initial_generation():
+    return int(time.time() * 1000000)
+
+
+class ResultCache(object):
+    """
+    Cache of the rows retrieved by schema queries keyed by their compiled SQL
+    and parameters, bounded to maxsize entries and maxbytes of rows in
+    process and optionally backed by the backend Django cache.
+
+    Each (schema, table) pair has a generation which is part of the keys of
+    the results reading from it and is bumped once a write to the table is
+    committed. The generations are kept in the backend when specified so that
+    writes from any process invalidate the entries. Only the writes performed
+    through schema querysets and models are tracked.
+    """
+
+    def __init__(self, maxsize=1024, maxbytes=16 * 1024 * 1024, backend=None, timeout=None,
+                 key_prefix='schema_query'):
+        self.entries = LRUCache(maxsize, maxweight=maxbytes)
+        self.backend = backend
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self._generations = {}
+        self._lock = threading.Lock()
+        result_caches.add(self)
+
+    def __repr__(self):
+        return '<%s: %r>' % (self.__class__.__name__, self.info())
+
+    @property
+    def backend_cache(self):
+        if self.backend is None:
+            return None
+        return caches[self.backend]
+
+    def generation_key(self, alias, schema, table):
+        return '%s:generation:%s:%s:%s' % (self.key_prefix, alias, schema, table)
+
+    def generations(self, alias, tables):
+        tables = sorted(tables)
+        backend_cache = self.backend_cache
+        if backend_cache is None:
+            return tuple(self._generations.get((alias,) + table, 0) for table in tables)
+        keys = [self.generation_key(alias, *table) for table in tables]
+        generations = backend_cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                # Start evicted generations anew so that they don't collide
+                # with the ones of the entries cached before their eviction.
+                generations[key] = backend_cache.get_or_set(key, initial_generation, None)
+        return tuple(generations[key] for key in keys)
+
+    def key(self, alias, tables, sql, params, result_type):
+        """
+        Return the key of the results of sql executed against alias which
+        reads from the (schema, table) pairs of tables.
+        """
+        # Search path queries share the same SQL across schemas.
+        tables = sorted(tables)
+        key = repr((alias, result_type, sql, tuple(params), tables, self.generations(alias, tables)))
+        return '%s:result:%s' % (self.key_prefix, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key, default=None):
+        result = self.entries.get(key, self)
+        if result is not self:
+            return result
+        backend_cache = self.backend_cache
+        if backend_cache is not None:
+            result = backend_cache.get(key, self)
+            if result is not self:
+                self.entries.set(key, result, result_size(result))
+                return result
+        return default
+
+    def set(self, key, result):
+        self.entries.set(key, result, result_size(result))
+        backend_cache = self.backend_cache
+        if backend_cache is not None:
+            backend_cache.set(key, result, self.timeout)
+
+    def invalidate(self, alias, tables):
+        """
+        Invalidate the entries reading from any of the (schema, table) pairs of
+        tables.
+        """
+        backend_cache = self.backend_cache
+        if backend_cache is None:
+            with self._lock:
+                for table in tables:
+                    key = (alias,) + table
+                    self._generations[key] = self._generations.get(key, 0) + 1
+            return
+        for table in tables:
+            key = self.generation_key(alias, *table)
+            try:
+                backend_cache.incr(key)
+            except ValueError:
+                backend_cache.add(key, initial_generation(), None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def info(self):
+        return dict(self.entries.info(), bytes=self.entries.weight)
+
+
+_default_result_cache = []
+
+
+def default_result_cache():
+    """
+    Return the in-process result cache used by querysets unless specified.
+    """
+    if not _default_result_cache:
+        _default_result_cache.append(ResultCache())
+    return _default_result_cache[0]
+
+
+def written_tables(connection):
+    """
+    Return the (schema, table) pairs written by the current transaction of
+    connection.
+    """
+    state = getattr(connection, 'schema_written_tables', None)
+    if state is None or state[0] is not connection.run_on_commit:
+        return frozenset()
+    return state[1]
+
+
+def invalidate_tables(connection, tables):
+    """
+    Invalidate the cached results reading from any of the (schema, table)
+    pairs of tables once the current transaction is committed.
+
+    Until then, results reading from them aren't cached nor retrieved from
+    the cache within the transaction as they might not be visible outside of
+    it.
+    """
+    if not result_caches:
+        return
+    tables = frozenset(table for table in tables if table[0])
+    if not tables:
+        return
+    if connection.in_atomic_block:
+        # The list of commit hooks is replaced by a new one on commit and
+        # rollback which makes it a cheap way of identifying the current
+        # transaction.
+        state = getattr(connection, 'schema_written_tables', None)
+        if state is None or state[0] is not connection.run_on_commit:
+            state = connection.schema_written_tables = (connection.run_on_commit, set())
+        state[1].update(tables)
+    alias = connection.alias
+
+    def invalidate():
+        for result_cache in list(result_caches):
+            result_cache.invalidate(alias, tables)
+    connection.on_commit(invalidate)
@@ -0,0 +1,196 @@
+from __future__ import unicode_literals
+
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.db.models.sql.compiler import (
+    SQLAggregateCompiler, SQLDeleteCompiler, SQLInsertCompiler,
+    SQLUpdateCompiler,
+)
+from django.db.models.sql.constants import MULTI, SINGLE
+from django.utils.lru_cache import lru_cache
+
+from .cache import LRUCache, invalidate_tables, written_tables
+from .expressions import SCHEMA_TAG
+from .instrumentation import is_instrumented, tag_statement
+from .options import qualified_table_name
+from .search_path import set_search_path
+
+# Compiled SQL of retargeted queries keyed by their shape.
+template_cache = LRUCache(maxsize=512)
+
+# Compiler state set by as_sql() which is relied upon when processing results.
+TEMPLATE_COMPILER_STATE = ('select', 'klass_info', 'annotation_col_map', 'col_count', 'has_extra_select')
+
+STATEMENT_KINDS = (
+    ('insert', SQLInsertCompiler),
+    ('update', SQLUpdateCompiler),
+    ('delete', SQLDeleteCompiler),
+)
+
+
+def retarget_sql(sql, source_table_schemas, target_table_schemas):
+    """
+    Substitute the schema qualified table names of source_table_schemas in sql
+    by the ones of target_table_schemas.
+    """
+    for table, schema in source_table_schemas.items():
+        target_schema = target_table_schemas.get(table)
+        if target_schema:
+            target = qualified_table_name(target_schema, table)
+        else:
+            target = '"%s"' % table
+        sql = sql.replace(qualified_table_name(schema, table), target)
+    return sql
+
+
+def read_tables(sql, query):
+    """
+    Return the (schema, table) pairs of the query's table schemas mappings sql
+    reads from.
+    """
+    tables = set()
+    for table_schemas in query.get_table_schemas_list():
+        for table, schema in table_schemas.items():
+            if schema and (query.search_path or qualified_table_name(schema, table) in sql):
+                tables.add((schema, table))
+    return tables
+
+
+def schema_literal(schema):
+    if schema is None:
+        return 'NULL'
+    return "'%s'" % schema.replace("'", "''").replace('%', '%%')
+
+
+class SchemaCompiler(object):
+    statement_kind = 'select'
+
+    def execute_sql(self, *args, **kwargs):
+        search_path = self.query.get_search_path()
+        if search_path is None:
+            return self.execute_schema_sql(*args, **kwargs)
+        connection = self.connection
+        if connection.in_atomic_block:
+            set_search_path(connection, search_path)
+            return self.execute_schema_sql(*args, **kwargs)
+        # SET LOCAL is only effective within a transaction which server-side
+        # cursors can't outlive.
+        if kwargs.get('chunked_fetch'):
+            kwargs['chunked_fetch'] = False
+        with transaction.atomic(using=connection.alias, savepoint=False):
+            set_search_path(connection, search_path)
+            return self.execute_schema_sql(*args, **kwargs)
+
+    def execute_schema_sql(self, *args, **kwargs):
+        if not is_instrumented(self.connection):
+            result = super(SchemaCompiler, self).execute_sql(*args, **kwargs)
+        else:
+            with tag_statement(self.connection, self.statement_kind, self.query.get_table_schemas_list()):
+                result = super(SchemaCompiler, self).execute_sql(*args, **kwargs)
+        if self.statement_kind != 'select':
+            table = self.query.model._meta.db_table
+            invalidate_tables(self.connection, [
+                (table_schemas.get(table), table) for table_schemas in self.query.get_table_schemas_list()
+            ])
+        return result
+
+
+class SchemaSQLCompiler(SchemaCompiler):
+    # EXECUTE statement of the prepared form of the query being executed.
+    prepared_sql = None
+
+    def execute_schema_sql(self, *args, **kwargs):
+        prepared_statements = self.query.prepared_statements
+        chunked_fetch = args[1] if len(args) > 1 else kwargs.get('chunked_fetch', False)
+        # Server-side cursors can't be declared for an EXECUTE statement.
+        if prepared_statements is None or chunked_fetch:
+            return super(SchemaSQLCompiler, self).execute_schema_sql(*args, **kwargs)
+        try:
+            sql, params = self.as_sql()
+        except EmptyResultSet:
+            return super(SchemaSQLCompiler, self).execute_schema_sql(*args, **kwargs)
+        self.prepared_sql = prepared_statements.prepare(
+            self.connection, sql, params, self.query.get_search_path(),
+        )
+        try:
+            return super(SchemaSQLCompiler, self).execute_schema_sql(*args, **kwargs)
+        finally:
+            self.prepared_sql = None
+
+    def execute_sql(self, result_type=MULTI, *args, **kwargs):
+        result_cache = self.query.result_cache
+        chunked_fetch = args[0] if args else kwargs.get('chunked_fetch', False)
+        if (result_cache is None or result_type not in (MULTI, SINGLE) or chunked_fetch or
+                self.query.select_for_update):
+            return super(SchemaSQLCompiler, self).execute_sql(result_type, *args, **kwargs)
+        try:
+            sql, params = self.as_sql()
+        except EmptyResultSet:
+            return super(SchemaSQLCompiler, self).execute_sql(result_type, *args, **kwargs)
+        tables = read_tables(sql, self.query)
+        # Writes of the current transaction might not be visible outside of it.
+        if not written_tables(self.connection).isdisjoint(tables):
+            return super(SchemaSQLCompiler, self).execute_sql(result_type, *args, **kwargs)
+        key = result_cache.key(self.connection.alias, tables, sql, params, result_type)
+        result = result_cache.get(key, result_cache)
+        if result is result_cache:
+            result = super(SchemaSQLCompiler, self).execute_sql(result_type, *args, **kwargs)
+            if result_type == MULTI:
+                result = list(result)
+            result_cache.set(key, result)
+        return iter(result) if result_type == MULTI else result
+
+    def as_template_sql(self, *args, **kwargs):
+        """
+        Return the SQL compiled against the query's table schemas from the
+        template cache when it was already compiled for another mapping.
+        """
+        template_key = self.query.template_key
+        if template_key is None:
+            return super(SchemaSQLCompiler, self).as_sql(*args, **kwargs)
+        key = (template_key, self.connection.alias, args, tuple(sorted(kwargs.items())))
+        template = template_cache.get(key)
+        if template is None:
+            sql, params = super(SchemaSQLCompiler, self).as_sql(*args, **kwargs)
+            state = {name: getattr(self, name) for name in TEMPLATE_COMPILER_STATE if hasattr(self, name)}
+            template_cache.set(key, (sql, params, state))
+        else:
+            sql, params, state = template
+            self.__dict__.update(state)
+        return sql, params
+
+    def as_sql(self, *args, **kwargs):
+        if self.prepared_sql is not None:
+            return self.prepared_sql
+        across_table_schemas = self.query.across_table_schemas
+        if not across_table_schemas:
+            return super(SchemaSQLCompiler, self).as_sql(*args, **kwargs)
+        sql, params = self.as_template_sql(*args, **kwargs)
+        # Compile the query once and expand it for each table schemas mapping;
+        # a single mapping retargets the query.
+        db_table = self.query.model._meta.db_table
+        parts = []
+        for table_schemas in across_table_schemas:
+            part = retarget_sql(sql, self.query.table_schemas, table_schemas)
+            part = part.replace(SCHEMA_TAG, schema_literal(table_schemas.get(db_table)))
+            parts.append(part)
+        if len(parts) == 1:
+            return parts[0], params
+        return ' UNION ALL '.join('(%s)' % part for part in parts), tuple(params) * len(parts)
+
+
+@lru_cache()
+def schema_compiler_class_factory(compiler_class):
+    if issubclass(compiler_class, SchemaCompiler):
+        return compiler_class
+    attrs = {}
+    if issubclass(compiler_class, (SQLInsertCompiler, SQLDeleteCompiler, SQLUpdateCompiler, SQLAggregateCompiler)):
+        mixin = SchemaCompiler
+        for kind, base in STATEMENT_KINDS:
+            if issubclass(compiler_class, base):
+                attrs['statement_kind'] = kind
+    else:
+        mixin = SchemaSQLCompiler
+    return type(
+        str('Schema%s' % compiler_class.__name__), (mixin, compiler_class), attrs
+    )
@@ -0,0 +1,22 @@
+from __future__ import unicode_literals
+
+
+class TableSchemas(dict):
+    """
+    Immutable mapping of table names to schemas which can be safely shared by
+    querysets and instances.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("'%s' object is immutable." % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+
+def freeze_table_schemas(table_schemas):
+    if isinstance(table_schemas, TableSchemas):
+        return table_schemas
+    return TableSchemas(table_schemas)
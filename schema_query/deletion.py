@@ -4,12 +4,18 @@ from collections import Counter
 from functools import partial
 from operator import attrgetter
 
-from django.db import transaction
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
 from django.db.models import signals
 from django.db.models.deletion import Collector
 from django.utils import six
 
+from .cache import invalidate_tables
+from .compiler import schema_literal
+from .instrumentation import tag_statement
+from .options import qualified_table_name
 from .query import SchemaDeleteQuery, SchemaUpdateQuery
+from .search_path import set_search_path
 
 
 class Collector(Collector):
@@ -89,3 +95,410 @@ class Collector(Collector):
             for instance in instances:
                 setattr(instance, model._meta.pk.attname, None)
         return sum(deleted_counter.values()), dict(deleted_counter)
+
+
+class InstancesRequired(Exception):
+    pass
+
+
+class SetDelete(object):
+    def __init__(self, alias, model, column, source=None, source_column=None):
+        self.alias = alias
+        self.model = model
+        self.column = column
+        self.source = source
+        self.source_column = source_column
+        self.returning = [model._meta.pk.column]
+
+
+class SetUpdate(SetDelete):
+    pass
+
+
+class SetCollector(object):
+    """
+    Cascades a deletion through a single statement chaining data-modifying
+    CTEs instead of loading the instances to delete and their related objects.
+
+    Only CASCADE, SET_NULL and DO_NOTHING relations are supported and models
+    with pre_delete, post_delete or m2m_changed receivers require their
+    instances to be loaded; collect() returns False in these cases.
+    """
+
+    def __init__(self, using, table_schemas):
+        self.using = using
+        self.table_schemas = table_schemas
+        self.nodes = []
+        self.queryset = None
+        self.follow_related = True
+        # (node, field) of the relations to collected rows which aren't
+        # followed.
+        self.unfollowed = []
+
+    def requires_instances(self, model):
+        # Mirrors the checks of Collector.can_fast_delete().
+        return any(
+            signal.has_listeners(sender)
+            for signal in (signals.pre_delete, signals.post_delete, signals.m2m_changed)
+            for sender in {model, model._meta.concrete_model}
+        ) or any(hasattr(field, 'bulk_related_objects') for field in model._meta.private_fields)
+
+    def collect(self, objs, keep_parents=False):
+        """
+        Collects the deletions cascading from the objs queryset or list of
+        instances and returns whether they can be performed as a set.
+        """
+        if isinstance(objs, models.QuerySet):
+            queryset = objs
+        else:
+            model = type(objs[0])
+            queryset = model._base_manager.get_queryset(table_schemas=self.table_schemas).using(self.using)
+            queryset = queryset.filter(pk__in=[obj.pk for obj in objs])
+        self.nodes = []
+        self.unfollowed = []
+        self.queryset = queryset
+        try:
+            self.add_delete(queryset.model, queryset.model._meta.pk.column, keep_parents=keep_parents)
+            self.check_updates()
+        except InstancesRequired:
+            self.nodes = []
+            return False
+        return True
+
+    def add_delete(self, model, column, source=None, source_column=None, parent_link=None, keep_parents=False,
+                   path=()):
+        model = model._meta.concrete_model
+        if model in path or self.requires_instances(model):
+            raise InstancesRequired
+        node = SetDelete('d%d' % len(self.nodes), model, column, source, source_column)
+        self.nodes.append(node)
+        path += (model,)
+        opts = model._meta
+        if not keep_parents:
+            for parent, ptr in opts.parents.items():
+                if ptr is None or ptr is parent_link:
+                    continue
+                if ptr.column not in node.returning:
+                    node.returning.append(ptr.column)
+                self.add_delete(
+                    parent, ptr.target_field.column, node, ptr.column, parent_link=ptr, path=path,
+                )
+        for related in opts.get_fields(include_parents=False, include_hidden=True):
+            if not (related.auto_created and not related.concrete and (related.one_to_one or related.one_to_many)):
+                continue
+            field = related.field
+            if field is parent_link:
+                continue
+            on_delete = field.remote_field.on_delete
+            if on_delete is models.DO_NOTHING:
+                continue
+            if not self.follow_related:
+                self.unfollowed.append((node, field))
+                continue
+            target_column = field.target_field.column
+            if target_column not in node.returning:
+                node.returning.append(target_column)
+            if on_delete is models.CASCADE:
+                self.add_delete(
+                    related.related_model, field.column, node, target_column,
+                    parent_link=field if field.remote_field.parent_link else None, path=path,
+                )
+            elif on_delete is models.SET_NULL:
+                self.nodes.append(SetUpdate(
+                    'u%d' % len(self.nodes), related.related_model._meta.concrete_model, field.column,
+                    node, target_column,
+                ))
+            else:
+                raise InstancesRequired
+
+    def check_updates(self):
+        # A row can't be reliably modified twice by the same statement.
+        updated = Counter(node.model for node in self.nodes if isinstance(node, SetUpdate))
+        deleted = {node.model for node in self.nodes if not isinstance(node, SetUpdate)}
+        if any(count > 1 or model in deleted for model, count in updated.items()):
+            raise InstancesRequired
+
+    def table_name(self, model):
+        db_table = model._meta.db_table
+        schema = self.table_schemas.get(db_table)
+        if schema:
+            return qualified_table_name(schema, db_table)
+        return connections[self.using].ops.quote_name(db_table)
+
+    def written_tables(self, table_schemas):
+        """
+        Return the (schema, table) pairs written by the collected deletions
+        against table_schemas.
+        """
+        tables = {node.model._meta.db_table for node in self.nodes}
+        return [(table_schemas.get(table), table) for table in tables]
+
+    def as_root_sql(self):
+        query = self.queryset.values('pk').query
+        return query.get_compiler(using=self.using).as_sql()
+
+    def node_condition(self, node, root_sql, prefix=''):
+        """
+        Returns the condition selecting the rows of node whose source rows are
+        selected by root_sql or by the CTE of their source node.
+        """
+        quote_name = connections[self.using].ops.quote_name
+        if node.source is None:
+            return '%s IN (%s)' % (quote_name(node.column), root_sql)
+        source_alias = quote_name(prefix + node.source.alias)
+        return '%s IN (SELECT %s.%s FROM %s)' % (
+            quote_name(node.column), source_alias, quote_name(node.source_column), source_alias,
+        )
+
+    def as_ctes(self, root_sql, prefix=''):
+        """
+        Returns the data-modifying CTEs of the collected deletions where the
+        rows to delete are selected by root_sql, along with the (alias, label)
+        of the deleting ones.
+        """
+        quote_name = connections[self.using].ops.quote_name
+        ctes = []
+        deletes = []
+        for node in self.nodes:
+            alias = quote_name(prefix + node.alias)
+            condition = self.node_condition(node, root_sql, prefix)
+            if isinstance(node, SetUpdate):
+                statement = 'UPDATE %s SET %s = NULL WHERE %s' % (
+                    self.table_name(node.model), quote_name(node.column), condition,
+                )
+            else:
+                statement = 'DELETE FROM %s WHERE %s RETURNING %s' % (
+                    self.table_name(node.model), condition, ', '.join(map(quote_name, node.returning)),
+                )
+                deletes.append((alias, node.model._meta.label))
+            ctes.append('%s AS (%s)' % (alias, statement))
+        return ctes, deletes
+
+    def as_sql(self):
+        root_sql, params = self.as_root_sql()
+        ctes, deletes = self.as_ctes(root_sql)
+        sql = 'WITH %s SELECT %s' % (', '.join(ctes), ', '.join(
+            '(SELECT COUNT(*) FROM %s)' % alias for alias, _ in deletes
+        ))
+        return sql, params, deletes
+
+    def delete(self):
+        deleted_counter = Counter()
+        try:
+            sql, params, deletes = self.as_sql()
+        except EmptyResultSet:
+            return 0, {self.queryset.model._meta.label: 0}
+        connection = connections[self.using]
+        with transaction.atomic(using=self.using, savepoint=False):
+            search_path = self.queryset.query.get_search_path()
+            if search_path is not None:
+                set_search_path(connection, search_path)
+            with tag_statement(connection, 'delete', [self.table_schemas]), connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                counts = cursor.fetchone()
+            invalidate_tables(connection, self.written_tables(self.table_schemas))
+        for (_, label), count in zip(deletes, counts):
+            deleted_counter[label] += count
+        return sum(deleted_counter.values()), dict(deleted_counter)
+
+
+class SetCopier(SetCollector):
+    """
+    Copies or moves the rows of a queryset, along with the ones of its model's
+    parents, to the same tables of target_table_schemas through a single
+    statement chaining data-modifying CTEs.
+
+    When related is True the rows a deletion would cascade to follow along.
+    Moves set the relations to the moved rows to NULL where a deletion would
+    and, when related is False, are refused if rows of other relations
+    reference the moved rows. Rows keep their primary key and no signals are
+    sent.
+    """
+
+    def __init__(self, using, table_schemas, target_table_schemas, related=False, move=False):
+        super(SetCopier, self).__init__(using, table_schemas)
+        self.target_table_schemas = target_table_schemas
+        self.follow_related = related
+        self.move = move
+        # (node, field) of the relations whose rows would be left referencing
+        # moved rows.
+        self.dependents = []
+
+    def requires_instances(self, model):
+        return False
+
+    def collect(self, queryset, keep_parents=False):
+        collected = super(SetCopier, self).collect(queryset, keep_parents=keep_parents)
+        if collected and self.move:
+            collected = self.collect_unfollowed()
+        if not collected:
+            raise ValueError(
+                "Cannot copy %s rows along relations other than CASCADE, SET_NULL and DO_NOTHING ones or "
+                "along cycles." % queryset.model._meta.label
+            )
+        for node in self.nodes:
+            if isinstance(node, SetUpdate):
+                continue
+            db_table = node.model._meta.db_table
+            target_schema = self.target_table_schemas.get(db_table)
+            if not target_schema:
+                raise ValueError("The target table schemas don't map %r." % db_table)
+            if target_schema == self.table_schemas.get(db_table):
+                raise ValueError("Cannot copy %r rows to their own schema." % db_table)
+            node.returning = [field.column for field in node.model._meta.local_concrete_fields]
+        return True
+
+    def collect_unfollowed(self):
+        """
+        Sets the unfollowed SET_NULL relations to the moved rows to NULL and
+        records the other ones as dependents, or returns False if the updates
+        can't be performed by a single statement.
+        """
+        self.dependents = []
+        for node, field in self.unfollowed:
+            if field.remote_field.on_delete is models.SET_NULL:
+                self.nodes.append(SetUpdate(
+                    'u%d' % len(self.nodes), field.model._meta.concrete_model, field.column,
+                    node, field.target_field.column,
+                ))
+            else:
+                self.dependents.append((node, field))
+        try:
+            self.check_updates()
+        except InstancesRequired:
+            self.nodes = []
+            return False
+        return True
+
+    def copied_nodes(self):
+        return [node for node in self.nodes if not isinstance(node, SetUpdate)]
+
+    def select_ctes(self, root_sql, prefix=''):
+        """
+        Returns the CTEs selecting the collected rows where the root ones are
+        selected by root_sql.
+        """
+        quote_name = connections[self.using].ops.quote_name
+        return [
+            '%s AS (SELECT %s FROM %s WHERE %s)' % (
+                quote_name(prefix + node.alias), ', '.join(map(quote_name, node.returning)),
+                self.table_name(node.model), self.node_condition(node, root_sql, prefix),
+            ) for node in self.copied_nodes()
+        ]
+
+    def dependents_cte(self, prefix):
+        """
+        Returns the CTE selecting the label of the dependents whose rows
+        reference the rows selected by select_ctes(root_sql, prefix).
+        """
+        quote_name = connections[self.using].ops.quote_name
+        selects = []
+        for node, field in self.dependents:
+            source_alias = quote_name(prefix + node.alias)
+            selects.append('(SELECT %s FROM %s WHERE %s IN (SELECT %s.%s FROM %s) LIMIT 1)' % (
+                schema_literal('%s.%s' % (field.model._meta.label, field.name)), self.table_name(field.model),
+                quote_name(field.column), source_alias, quote_name(field.target_field.column), source_alias,
+            ))
+        return '"dependents" ("label") AS (%s)' % ' UNION ALL '.join(selects)
+
+    def as_sql(self):
+        """
+        Returns the SQL copying, or moving, the collected rows along with its
+        params and the (alias, label) of the CTEs inserting them. When moves
+        have dependents, their labels referencing the rows to move are
+        selected by a last column and nothing is moved if there are any.
+        """
+        root_sql, params = self.as_root_sql()
+        quote_name = connections[self.using].ops.quote_name
+        if not self.move:
+            ctes = self.select_ctes(root_sql)
+        elif not self.dependents:
+            ctes, _ = self.as_ctes(root_sql)
+        else:
+            ctes = self.select_ctes(root_sql, 'c') + [self.dependents_cte('c')]
+            ctes.extend(self.as_ctes(
+                'SELECT * FROM (%s) "root" WHERE NOT EXISTS (SELECT 1 FROM "dependents")' % root_sql,
+            )[0])
+            params = tuple(params) * 2
+        inserts = []
+        for node in self.copied_nodes():
+            db_table = node.model._meta.db_table
+            alias = quote_name('i' + node.alias)
+            columns = ', '.join(map(quote_name, node.returning))
+            ctes.append('%s AS (INSERT INTO %s (%s) SELECT %s FROM %s RETURNING 1)' % (
+                alias, qualified_table_name(self.target_table_schemas[db_table], db_table),
+                columns, columns, quote_name(node.alias),
+            ))
+            inserts.append((alias, node.model._meta.label))
+        counts = ['(SELECT COUNT(*) FROM %s)' % alias for alias, _ in inserts]
+        if self.move and self.dependents:
+            counts.append('ARRAY(SELECT "label" FROM "dependents")')
+        sql = 'WITH %s SELECT %s' % (', '.join(ctes), ', '.join(counts))
+        return sql, params, inserts
+
+    def sequence_sql(self):
+        """
+        Returns the statements advancing the sequences of the auto-incremented
+        primary keys of the target tables past the copied ones.
+        """
+        quote_name = connections[self.using].ops.quote_name
+        statements = []
+        for node in self.copied_nodes():
+            pk = node.model._meta.pk
+            if not isinstance(pk, models.AutoField):
+                continue
+            db_table = node.model._meta.db_table
+            table = qualified_table_name(self.target_table_schemas[db_table], db_table)
+            # nextval() keeps sequences from going backwards at the cost of a
+            # value.
+            statements.append(
+                "SELECT setval(s.seq, GREATEST((SELECT MAX(%s) FROM %s), nextval(s.seq))) "
+                "FROM (SELECT pg_get_serial_sequence('%s', '%s') AS seq) s WHERE s.seq IS NOT NULL" % (
+                    quote_name(pk.column), table, table.replace("'", "''"), pk.column,
+                )
+            )
+        return statements
+
+    def written_tables(self):
+        tables = {node.model._meta.db_table for node in self.copied_nodes()}
+        written = [(self.target_table_schemas.get(table), table) for table in tables]
+        if self.move:
+            written.extend(super(SetCopier, self).written_tables(self.table_schemas))
+        return written
+
+    def copy(self):
+        """
+        Copies, or moves, the collected rows and returns the total number of
+        copied rows and a dict of the number of copied rows per model label.
+        """
+        try:
+            sql, params, inserts = self.as_sql()
+        except EmptyResultSet:
+            return 0, {self.queryset.model._meta.label: 0}
+        connection = connections[self.using]
+        copied_counter = Counter()
+        with transaction.atomic(using=self.using, savepoint=False):
+            search_path = self.queryset.query.get_search_path()
+            if search_path is not None:
+                set_search_path(connection, search_path)
+            kind = 'delete' if self.move else 'insert'
+            with tag_statement(connection, kind, [self.table_schemas, self.target_table_schemas]), \
+                    connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                counts = cursor.fetchone()
+                dependents = counts[len(inserts):]
+                if any(counts[:len(inserts)]):
+                    for statement in self.sequence_sql():
+                        cursor.execute(statement)
+            if not any(dependents):
+                invalidate_tables(connection, self.written_tables())
+        # Raised outside of the atomic block as nothing was written.
+        if any(dependents):
+            raise ValueError(
+                "Cannot move %s rows referenced by %s without related=True." % (
+                    self.queryset.model._meta.label, ', '.join(sorted(dependents[0])),
+                )
+            )
+        for (_, label), count in zip(inserts, counts):
+            copied_counter[label] += count
+        return sum(copied_counter.values()), dict(copied_counter)
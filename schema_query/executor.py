@@ -0,0 +1,97 @@
+from __future__ import unicode_literals
+
+import threading
+
+from django.db import connections
+from django.utils.six.moves import queue
+
+DEFAULT_MAX_WORKERS = 4
+
+_DONE = object()
+
+
+class SchemaExecutionError(Exception):
+    """
+    Raised when the execution against one or many table schemas mappings
+    failed. The errors attribute holds (table_schemas, exception) pairs.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(SchemaExecutionError, self).__init__(
+            'Execution failed for %d table schemas mapping(s): %s' % (
+                len(errors), '; '.join('%r: %r' % (table_schemas, exc) for table_schemas, exc in errors)
+            )
+        )
+
+
+def execute_across_schemas(queryset, table_schemas_list, operation=list, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Concurrently evaluate operation(queryset) against each of the table schemas
+    mappings on a bounded pool of threads and yield (table_schemas, result)
+    pairs as they complete.
+
+    Each worker thread uses its own connections to the databases the
+    retargeted querysets are routed to which are closed once it's done.
+    Scheduling stops on the first failure and SchemaExecutionError is raised
+    once the in-flight executions are completed.
+    """
+    # Validated eagerly rather than on the first iteration.
+    if max_workers < 1:
+        raise ValueError('max_workers must be greater than 0.')
+    return _execute_across_schemas(queryset, table_schemas_list, operation, max_workers)
+
+
+def _execute_across_schemas(queryset, table_schemas_list, operation, max_workers):
+    tasks = queue.Queue()
+    for table_schemas in table_schemas_list:
+        tasks.put(table_schemas)
+    results = queue.Queue()
+    failed = threading.Event()
+
+    def worker():
+        # Retargeted querysets are routed to the database of their schemas.
+        used = set()
+        try:
+            while not failed.is_set():
+                try:
+                    table_schemas = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    retargeted = queryset.retarget(table_schemas)
+                    used.add(retargeted.db)
+                    result = operation(retargeted)
+                except Exception as exc:
+                    failed.set()
+                    results.put((table_schemas, None, exc))
+                else:
+                    results.put((table_schemas, result, None))
+        finally:
+            for using in used:
+                connections[using].close()
+            results.put(_DONE)
+
+    workers = [threading.Thread(target=worker) for _ in range(min(max_workers, tasks.qsize()))]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    errors = []
+    try:
+        running = len(workers)
+        while running:
+            item = results.get()
+            if item is _DONE:
+                running -= 1
+                continue
+            table_schemas, result, exc = item
+            if exc is not None:
+                errors.append((table_schemas, exc))
+            elif not errors:
+                yield table_schemas, result
+    finally:
+        failed.set()
+        for thread in workers:
+            thread.join()
+    if errors:
+        raise SchemaExecutionError(errors)
@@ -0,0 +1,173 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .instrumentation import SchemaInstrumentation, statement_kind
+
+ExplainedStatement = namedtuple('ExplainedStatement', [
+    'kind', 'schemas', 'fingerprint', 'duration', 'sql', 'plan', 'analyzed', 'timestamp',
+])
+
+# Statements whose plan is retrieved by re-running them.
+ANALYZED_STATEMENTS = ('select', 'execute')
+EXPLAINED_STATEMENTS = ANALYZED_STATEMENTS + ('with', 'insert', 'update', 'delete')
+
+
+def fingerprint(sql, schemas):
+    """
+    Return a fingerprint of the shape of sql shared by its executions against
+    any schema.
+    """
+    for schema in schemas:
+        sql = sql.replace('"%s".' % schema, '')
+    return hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]
+
+
+class ExplainSampler(SchemaInstrumentation):
+    """
+    Execute wrapper retrieving the plan of the schema queries slower than
+    threshold seconds and keeping the maxlen most recent ones.
+
+    SELECT statements are re-run through EXPLAIN (ANALYZE, BUFFERS) and writes
+    are only planned through EXPLAIN. At most one statement is explained every
+    interval seconds, the same shape is explained at most once per schema
+    every shape_interval seconds and only a sample_rate fraction of the
+    eligible statements is explained.
+    """
+
+    def __init__(self, threshold=0.5, maxlen=100, interval=1.0, shape_interval=60.0, sample_rate=1.0):
+        # The statements recorded without going through execute wrappers, e.g.
+        # COPY, can't be explained.
+        super(ExplainSampler, self).__init__(lambda statement: None)
+        self.threshold = threshold
+        self.interval = interval
+        self.shape_interval = shape_interval
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=maxlen)
+        self.last_explained = None
+        self.shapes_explained = {}
+        self.skipped = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        tag = getattr(connection, 'schema_statement', None)
+        start = default_timer()
+        result = execute(sql, params, many, context)
+        duration = default_timer() - start
+        if tag is None or many or duration < self.threshold or not tag[1]:
+            return result
+        kind, schemas = tag
+        # Cross-schema queries start with a parenthesized SELECT.
+        sql_kind = statement_kind(sql.lstrip('('))
+        if sql_kind not in EXPLAINED_STATEMENTS:
+            return result
+        shape = fingerprint(sql, schemas)
+        if not self.acquire(schemas, shape):
+            return result
+        analyze = kind == 'select' and sql_kind in ANALYZED_STATEMENTS
+        plan = self.explain(connection, sql, params, analyze)
+        if plan is not None:
+            self.record(ExplainedStatement(kind, schemas, shape, duration, sql, plan, analyze, time.time()))
+        return result
+
+    def acquire(self, schemas, shape):
+        """
+        Return whether a statement of shape against schemas can be explained
+        now according to the rate limits.
+        """
+        now = default_timer()
+        with self.lock:
+            if (random.random() >= self.sample_rate or
+                    (self.last_explained is not None and now - self.last_explained < self.interval)):
+                self.skipped += 1
+                return False
+            key = (schemas, shape)
+            last_explained = self.shapes_explained.get(key)
+            if last_explained is not None and now - last_explained < self.shape_interval:
+                self.skipped += 1
+                return False
+            self.last_explained = self.shapes_explained[key] = now
+            # Forget the shapes which can be explained again.
+            if len(self.shapes_explained) > 10 * self.samples.maxlen:
+                self.shapes_explained = {
+                    key: last for key, last in self.shapes_explained.items() if now - last < self.shape_interval
+                }
+            return True
+
+    def explain(self, connection, sql, params, analyze):
+        """
+        Return the text plan of sql or None if it couldn't be explained, e.g.
+        because the transaction is aborted.
+        """
+        options = '(ANALYZE, BUFFERS)' if analyze else ''
+        Error = connection.Database.Error
+        in_transaction = not connection.get_autocommit()
+        # A raw cursor isn't wrapped by the instrumentation and doesn't
+        # overwrite the results of the explained statement.
+        with connection.connection.cursor() as cursor:
+            try:
+                if in_transaction:
+                    cursor.execute('SAVEPOINT schema_query_explain')
+                cursor.execute('EXPLAIN %s %s' % (options, sql), params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if in_transaction:
+                    cursor.execute('RELEASE SAVEPOINT schema_query_explain')
+            except Error:
+                if in_transaction:
+                    try:
+                        cursor.execute('ROLLBACK TO SAVEPOINT schema_query_explain')
+                        cursor.execute('RELEASE SAVEPOINT schema_query_explain')
+                    except Error:
+                        pass
+                return None
+        return plan
+
+    def record(self, statement):
+        with self.lock:
+            self.samples.append(statement)
+
+    def snapshot(self):
+        """
+        Return the explained statements from the oldest to the most recent.
+        """
+        with self.lock:
+            return list(self.samples)
+
+    def dump(self, fileobj):
+        """
+        Write the explained statements to fileobj as JSON lines.
+        """
+        for statement in self.snapshot():
+            fileobj.write(json.dumps(dict(statement._asdict(), schemas=list(statement.schemas))) + '\n')
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.shapes_explained.clear()
+            self.last_explained = None
+            self.skipped = 0
+
+
+@contextmanager
+def explain_slow_queries(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Explain the slow schema queries executed by the current thread's
+    connection within the block with an ExplainSampler built from kwargs.
+    """
+    sampler = ExplainSampler(**kwargs)
+    connection = connections[using]
+    sampler.install(connection)
+    try:
+        yield sampler
+    finally:
+        sampler.uninstall(connection)
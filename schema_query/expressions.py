@@ -0,0 +1,26 @@
+from __future__ import unicode_literals
+
+from django.db.models import CharField, Expression
+
+# Alias of the SchemaTag annotation of cross-schema querysets.
+SCHEMA_TAG_ALIAS = 'schema'
+
+# Placeholder compiled in place of a SchemaTag and substituted by the schema
+# the row originates from once the query is expanded across schemas.
+SCHEMA_TAG = '/* schema_tag */ NULL'
+
+
+class SchemaTag(Expression):
+    """
+    Annotation tagging each row of a cross-schema query with the schema of the
+    queryset's model table.
+    """
+
+    def __init__(self):
+        super(SchemaTag, self).__init__(output_field=CharField())
+
+    def as_sql(self, compiler, connection):
+        return SCHEMA_TAG, []
+
+    def get_group_by_cols(self):
+        return []
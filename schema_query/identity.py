@@ -0,0 +1,176 @@
+from __future__ import unicode_literals
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.utils.lru_cache import lru_cache
+
+_local = threading.local()
+
+
+def identity_key(obj):
+    """
+    Return the (schema, concrete model, pk) key of obj or None if it isn't
+    bound to a schema.
+    """
+    table_schemas = getattr(obj._state, 'table_schemas', None)
+    if not table_schemas or obj.pk is None:
+        return None
+    opts = obj._meta
+    return table_schemas.get(opts.db_table), opts.concrete_model, obj.pk
+
+
+class IdentityMap(object):
+    """
+    Map of the schema model instances loaded within a scope keyed by their
+    schema, concrete model and primary key.
+
+    Instances are registered as they are iterated over and retrieved by the
+    forward many-to-one and one-to-one descriptors of schema models instead
+    of querying the database again. When maxsize is specified the least
+    recently used instances are evicted once it's exceeded.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self._instances = OrderedDict()
+
+    def __len__(self):
+        return len(self._instances)
+
+    def __contains__(self, obj):
+        key = identity_key(obj)
+        return key is not None and self._instances.get(key) is obj
+
+    def get(self, schema, model, pk):
+        key = (schema, model._meta.concrete_model, pk)
+        obj = self._instances.get(key)
+        if obj is None or not isinstance(obj, model):
+            return None
+        if self.maxsize is not None:
+            self._instances[key] = self._instances.pop(key)
+        return obj
+
+    def add(self, obj, replace=False):
+        """
+        Register obj unless an instance of the same row already is, or replace
+        it. Returns the registered instance.
+        """
+        key = identity_key(obj)
+        if key is None:
+            return obj
+        if not replace:
+            registered = self._instances.get(key)
+            if registered is not None:
+                return registered
+        self._instances.pop(key, None)
+        self._instances[key] = obj
+        if self.maxsize is not None and len(self._instances) > self.maxsize:
+            self._instances.popitem(last=False)
+        return obj
+
+    def discard(self, obj):
+        key = identity_key(obj)
+        if key is not None and self._instances.get(key) is obj:
+            del self._instances[key]
+
+    def evict(self, schema=None, model=None):
+        """
+        Evict the instances of schema and/or model, or all of them.
+        """
+        if schema is None and model is None:
+            self._instances.clear()
+            return
+        concrete_model = model and model._meta.concrete_model
+        for key in list(self._instances):
+            if (schema is None or key[0] == schema) and (model is None or key[1] is concrete_model):
+                del self._instances[key]
+
+    def clear(self):
+        self._instances.clear()
+
+
+def current_identity_map():
+    """
+    Return the identity map of the innermost identity_map() scope of the
+    current thread or None.
+    """
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def identity_map(maxsize=None):
+    """
+    Register the schema model instances loaded by the current thread within
+    the block in a new identity map.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    instance = IdentityMap(maxsize)
+    stack.append(instance)
+    try:
+        yield instance
+    finally:
+        stack.pop()
+
+
+def evict_schemas(table_schemas_list):
+    """
+    Evict the instances of the schemas of table_schemas_list from the current
+    identity map, e.g. once rows of them were written in bulk.
+    """
+    current = current_identity_map()
+    if current is None:
+        return
+    for table_schemas in table_schemas_list:
+        for schema in set(table_schemas.values()):
+            current.evict(schema)
+
+
+class IdentityMapMiddleware(object):
+    """
+    Scope an identity map to each request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map():
+            return self.get_response(request)
+
+
+class IdentityMapDescriptorMixin(object):
+    """
+    Forward related descriptor retrieving the related instance from the
+    current identity map when it's referenced by primary key.
+    """
+
+    def get_object(self, instance):
+        current = current_identity_map()
+        if current is None:
+            return super(IdentityMapDescriptorMixin, self).get_object(instance)
+        field = self.field
+        table_schemas = getattr(instance._state, 'table_schemas', None)
+        related_model = field.remote_field.model
+        if table_schemas and len(field.foreign_related_fields) == 1 and field.target_field.primary_key:
+            obj = current.get(
+                table_schemas.get(related_model._meta.db_table),
+                related_model,
+                field.get_local_related_value(instance)[0],
+            )
+            if obj is not None:
+                return obj
+        return current.add(super(IdentityMapDescriptorMixin, self).get_object(instance))
+
+
+@lru_cache()
+def identity_map_descriptor_class_factory(descriptor_class):
+    if issubclass(descriptor_class, IdentityMapDescriptorMixin):
+        return descriptor_class
+    return type(
+        str('IdentityMap%s' % descriptor_class.__name__), (IdentityMapDescriptorMixin, descriptor_class), {}
+    )
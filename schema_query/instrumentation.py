@@ -0,0 +1,199 @@
+from __future__ import unicode_literals
+
+import bisect
+import threading
+import weakref
+from collections import namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+# Upper bounds, in seconds, of the latency histogram buckets; the last bucket
+# holds the statements slower than the last bound.
+LATENCY_BUCKETS = (.001, .005, .01, .05, .1, .5, 1.0, 5.0)
+
+SchemaStatement = namedtuple('SchemaStatement', ['kind', 'schemas', 'duration', 'rows', 'sql'])
+
+
+def schemas_of(table_schemas_list):
+    """
+    Return the distinct schemas of the table_schemas mappings.
+    """
+    schemas = []
+    for table_schemas in table_schemas_list:
+        for schema in table_schemas.values():
+            if schema not in schemas:
+                schemas.append(schema)
+    return tuple(schemas)
+
+
+def statement_kind(sql):
+    return sql.split(None, 1)[0].lower() if sql else ''
+
+
+def is_instrumented(connection):
+    return getattr(connection, 'schema_instrumented', 0) > 0
+
+
+@contextmanager
+def tag_statement(connection, kind, table_schemas_list):
+    """
+    Tag the statements executed by connection within the block with kind and
+    the schemas of table_schemas_list for the installed instrumentations.
+    """
+    if not is_instrumented(connection):
+        yield
+        return
+    previous = getattr(connection, 'schema_statement', None)
+    connection.schema_statement = (kind, schemas_of(table_schemas_list))
+    try:
+        yield
+    finally:
+        connection.schema_statement = previous
+
+
+def record_statement(connection, statement):
+    """
+    Record a statement which wasn't executed through the connection's execute
+    wrappers, e.g. COPY, with its installed instrumentations.
+    """
+    for wrapper in connection.execute_wrappers:
+        if isinstance(wrapper, SchemaInstrumentation):
+            wrapper.sink(statement)
+
+
+class SchemaInstrumentation(object):
+    """
+    Execute wrapper passing a SchemaStatement to sink for every statement
+    executed by the connections it's installed on.
+
+    Statements issued by schema queries are tagged with their kind and the
+    schemas of their table schemas mappings while the others have no schemas
+    and a kind inferred from their SQL.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __call__(self, execute, sql, params, many, context):
+        tag = getattr(context['connection'], 'schema_statement', None)
+        start = default_timer()
+        rows = None
+        try:
+            result = execute(sql, params, many, context)
+            rows = context['cursor'].rowcount
+            return result
+        finally:
+            duration = default_timer() - start
+            if tag is None:
+                kind, schemas = statement_kind(sql), ()
+            else:
+                kind, schemas = tag
+            self.sink(SchemaStatement(kind, schemas, duration, rows if rows is None or rows >= 0 else None, sql))
+
+    def install(self, connection):
+        if django.VERSION < (2, 0):
+            raise ImproperlyConfigured('Schema instrumentation requires Django 2.0+ execute wrappers.')
+        if self in connection.execute_wrappers:
+            return
+        connection.execute_wrappers.append(self)
+        connection.schema_instrumented = getattr(connection, 'schema_instrumented', 0) + 1
+
+    def uninstall(self, connection):
+        if self not in connection.execute_wrappers:
+            return
+        connection.execute_wrappers.remove(self)
+        connection.schema_instrumented -= 1
+
+
+@contextmanager
+def instrument(sink, using=DEFAULT_DB_ALIAS):
+    """
+    Pass the statements executed by the current thread's connection within the
+    block to sink.
+    """
+    instrumentation = SchemaInstrumentation(sink)
+    connection = connections[using]
+    instrumentation.install(connection)
+    try:
+        yield instrumentation
+    finally:
+        instrumentation.uninstall(connection)
+
+
+def install(sink, using=DEFAULT_DB_ALIAS):
+    """
+    Pass the statements executed by every connection to the using database to
+    sink, including the ones created by other threads later on. Returns a
+    callable uninstalling the instrumentation from all of these connections.
+    """
+    instrumentation = SchemaInstrumentation(sink)
+    # The connections of other threads go away along with them.
+    instrumented = weakref.WeakSet()
+    lock = threading.Lock()
+
+    def install_on(connection):
+        with lock:
+            instrumentation.install(connection)
+            instrumented.add(connection)
+
+    def receiver(sender, connection, **kwargs):
+        if connection.alias == using:
+            install_on(connection)
+    install_on(connections[using])
+    connection_created.connect(receiver, weak=False)
+
+    def uninstall():
+        connection_created.disconnect(receiver)
+        with lock:
+            for connection in list(instrumented):
+                instrumentation.uninstall(connection)
+            instrumented.clear()
+    return uninstall
+
+
+class SchemaStats(object):
+    """
+    Sink aggregating the count, duration, rows and latency histogram of the
+    recorded statements per schema and statement kind in process.
+
+    Statements involving many schemas are accounted for in each of them and
+    the ones involving none under None.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def __call__(self, statement):
+        bucket = bisect.bisect_left(self.buckets, statement.duration)
+        with self.lock:
+            for schema in statement.schemas or (None,):
+                key = (schema, statement.kind)
+                stats = self.stats.get(key)
+                if stats is None:
+                    stats = self.stats[key] = {
+                        'count': 0, 'duration': 0.0, 'rows': 0, 'histogram': [0] * (len(self.buckets) + 1),
+                    }
+                stats['count'] += 1
+                stats['duration'] += statement.duration
+                stats['rows'] += statement.rows or 0
+                stats['histogram'][bucket] += 1
+
+    def snapshot(self):
+        """
+        Return a copy of the statistics keyed by (schema, kind).
+        """
+        with self.lock:
+            return {
+                key: dict(stats, histogram=list(stats['histogram'])) for key, stats in self.stats.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from ...provisioning import (
+    DEFAULT_BATCH_SIZE, ProvisioningError, provision_schemas, warm_pool,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates schemas holding the tables of the schema models, copied from a '
+        'template schema or created from the models definition.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', help='Names of the schemas to create.')
+        parser.add_argument(
+            '--template', help='Schema to copy the tables, indexes, constraints and sequences from.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of schemas created per transaction.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1, help='Number of concurrent database connections.',
+        )
+        parser.add_argument(
+            '--warm-pool', type=int, default=0, metavar='COUNT',
+            help='Number of empty schemas to create to be claimed later on.',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS, help='Nominates a database to create the schemas in.',
+        )
+
+    def handle(self, *args, **options):
+        schemas = options['schemas']
+        pool_size = options['warm_pool']
+        if not schemas and not pool_size:
+            raise CommandError('Specify schemas to create or a --warm-pool size.')
+        kwargs = {
+            'template': options['template'],
+            'using': options['database'],
+            'batch_size': options['batch_size'],
+            'max_workers': options['workers'],
+        }
+        try:
+            if schemas:
+                provision_schemas(schemas, **kwargs)
+            if pool_size:
+                schemas = schemas + warm_pool(pool_size, **kwargs)
+        except (LookupError, ProvisioningError) as exc:
+            raise CommandError(exc)
+        if options['verbosity'] >= 1:
+            self.stdout.write('Provisioned %d schema(s).' % len(schemas))
@@ -1,8 +1,16 @@
 from __future__ import unicode_literals
 
 from django.db import models, router
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor,
+)
+from django.db.models.signals import class_prepared
 
-from .deletion import Collector
+from .datastructures import freeze_table_schemas
+from .deletion import Collector, SetCollector
+from .identity import (
+    current_identity_map, evict_schemas, identity_map_descriptor_class_factory,
+)
 from .queryset import SchemaQuerySet
 
 
@@ -17,9 +25,16 @@ class SchemaModel(models.Model):
     def save(self, *args, **kwargs):
         table_schemas = kwargs.pop('table_schemas', getattr(self._state, 'table_schemas', None))
         assert table_schemas
-        self._save_table_schemas = table_schemas
+        self._save_table_schemas = table_schemas = freeze_table_schemas(table_schemas)
+        if len(args) < 3 and kwargs.get('using') is None:
+            # Let routers pick the database holding the schemas.
+            kwargs['using'] = router.db_for_write(self.__class__, instance=self, table_schemas=table_schemas)
         saved = super(SchemaModel, self).save(*args, **kwargs)
         self._state.table_schemas = table_schemas
+        identity_map = current_identity_map()
+        if identity_map is not None:
+            # The saved instance holds the latest state of the row.
+            identity_map.add(self, replace=True)
         return saved
 
     def _do_insert(self, manager, *args, **kwargs):
@@ -43,6 +58,30 @@ class SchemaModel(models.Model):
             (self._meta.object_name, self._meta.pk.attname)
         )
 
+        # Rows related to the instance might be deleted as well.
+        evict_schemas([table_schemas])
+        collector = SetCollector(table_schemas=table_schemas, using=using)
+        if collector.collect([self], keep_parents=keep_parents):
+            deleted = collector.delete()
+            setattr(self, self._meta.pk.attname, None)
+            return deleted
         collector = Collector(table_schemas=table_schemas, using=using)
         collector.collect([self], keep_parents=keep_parents)
         return collector.delete()
+
+
+def install_identity_map_descriptors(sender, **kwargs):
+    """
+    Have the forward related descriptors of schema models look up the current
+    identity map before querying.
+    """
+    if not issubclass(sender, SchemaModel):
+        return
+    for field in sender._meta.local_fields:
+        descriptor = sender.__dict__.get(field.name)
+        # ForwardManyToOneDescriptor.get_object() exists since Django 1.11.
+        if isinstance(descriptor, ForwardManyToOneDescriptor):
+            descriptor.__class__ = identity_map_descriptor_class_factory(descriptor.__class__)
+
+
+class_prepared.connect(install_identity_map_descriptors)
@@ -1,10 +1,48 @@
 from __future__ import unicode_literals
 
+from django.db.models.options import Options
+from django.utils.lru_cache import lru_cache
+
+
+def qualified_table_name(schema, table):
+    return '"%s"."%s"' % (schema, table)
+
+
+class SchemaOptions(Options):
+    """
+    Flat copy of a model's options pointing at a schema qualified table.
+    """
 
-class SchemaOptions(object):
     def __init__(self, schema, opts):
-        self.db_table = '"%s"."%s"' % (schema, opts.db_table)
-        self.__opts = opts
+        self.copy(schema, opts)
+
+    def copy(self, schema, opts):
+        # Copy the state of the original options instead of proxying attribute
+        # access to them as the compiler retrieves them a lot. The state is
+        # swapped at once as other threads might be using these options.
+        if opts.apps.models_ready:
+            # The relation tree is only ever populated on the model options.
+            opts._relation_tree
+        state = dict(opts.__dict__)
+        state['db_table'] = qualified_table_name(schema, opts.db_table)
+        self.__dict__ = state
+
+    def is_expired(self, opts):
+        # Options._expire_cache() always resets the fields cache.
+        return self._get_fields_cache is not opts._get_fields_cache
+
+
+@lru_cache(maxsize=1024)
+def _schema_options(schema, opts):
+    return SchemaOptions(schema, opts)
+
 
-    def __getattr__(self, name):
-        return getattr(self.__opts, name)
+def schema_options(schema, opts):
+    """
+    Return the interned SchemaOptions of opts for schema, copied again if the
+    cached properties of opts were expired since.
+    """
+    schema_opts = _schema_options(schema, opts)
+    if schema_opts.is_expired(opts):
+        schema_opts.copy(schema, opts)
+    return schema_opts
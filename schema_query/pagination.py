@@ -0,0 +1,249 @@
+from __future__ import unicode_literals
+
+import base64
+import heapq
+import json
+from collections import OrderedDict, namedtuple
+from functools import total_ordering
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from django.utils import six
+
+from .expressions import SCHEMA_TAG_ALIAS
+
+Page = namedtuple('Page', ['objects', 'next_token'])
+
+
+@total_ordering
+class Descending(object):
+    """
+    Wrapper reversing the ordering of a value.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    __hash__ = None
+
+
+def merge(streams, key):
+    """
+    Lazily merge the iterables of streams, each sorted by key, into a single
+    sorted stream.
+    """
+    heap = []
+    for index, stream in enumerate(streams):
+        iterator = iter(stream)
+        for obj in iterator:
+            heap.append((key(obj), index, obj, iterator))
+            break
+    heapq.heapify(heap)
+    while heap:
+        _, index, obj, iterator = heap[0]
+        yield obj
+        for obj in iterator:
+            heapq.heapreplace(heap, (key(obj), index, obj, iterator))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def ordering_fields(queryset):
+    """
+    Return the (field, descending) pairs queryset is ordered by, ending with
+    its primary key. Foreign keys are only supported by their column.
+    """
+    opts = queryset.model._meta
+    query = queryset.query
+    if query.extra_order_by:
+        raise ValueError("Cannot merge across schemas with extra() ordering.")
+    ordering = query.order_by or (opts.ordering if query.default_ordering else ())
+    fields = []
+    for name in ordering:
+        if not isinstance(name, six.string_types) or name == '?':
+            raise ValueError("Cannot merge across schemas on ordering %r." % (name,))
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.concrete or (
+                field.is_relation and not field.primary_key and name != field.attname):
+            raise ValueError("Cannot merge across schemas on ordering %r." % name)
+        fields.append((field, descending))
+        if field.primary_key:
+            break
+    else:
+        # Primary keys make the ordering total within each schema.
+        fields.append((opts.pk, False))
+    return fields
+
+
+class MergedAcrossSchemas(object):
+    """
+    Ordered view of a queryset evaluated against many table schemas mappings.
+
+    Each slice or page is retrieved by a single UNION ALL query limiting the
+    rows of each schema to the ones that can make it in, and the per-schema
+    results are merged lazily. Iteration retrieves chunk_size rows at a time
+    the same way pages are. Rows are totally ordered by the queryset's
+    ordering, its primary key and the schema of its model's table, with nulls
+    sorting last in ascending order like they do in PostgreSQL.
+    """
+    chunk_size = GET_ITERATOR_CHUNK_SIZE
+
+    def __init__(self, queryset, table_schemas_list):
+        if queryset._fields is not None:
+            raise TypeError("Cannot merge across schemas after .values() or .values_list().")
+        if not queryset.query.can_filter():
+            raise TypeError("Cannot merge across schemas once a slice has been taken.")
+        self.queryset = queryset
+        self.table_schemas_list = tuple(table_schemas_list)
+        self.ordering = ordering_fields(queryset)
+
+    def __repr__(self):
+        return '<%s: %s across %d schemas>' % (
+            self.__class__.__name__, self.queryset.model._meta.label, len(self.table_schemas_list),
+        )
+
+    def key(self, obj):
+        key = []
+        for field, descending in self.ordering:
+            value = getattr(obj, field.attname)
+            # Nulls sort last in ascending order like they do in PostgreSQL.
+            value = (value is None, value)
+            key.append(Descending(value) if descending else value)
+        key.append(getattr(obj, SCHEMA_TAG_ALIAS))
+        return tuple(key)
+
+    def _merged(self, limit=None, position=None):
+        queryset = self.queryset.across_schemas(self.table_schemas_list)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+        queryset = queryset.order_by(*[
+            '%s%s' % ('-' if descending else '', 'pk' if field.primary_key else field.attname)
+            for field, descending in self.ordering
+        ])
+        if limit is not None:
+            # Pushed down to each schema.
+            queryset = queryset[:limit]
+        streams = OrderedDict()
+        for obj in queryset:
+            streams.setdefault(getattr(obj, SCHEMA_TAG_ALIAS), []).append(obj)
+        # The order of the rows of each part of a UNION ALL isn't guaranteed.
+        for stream in streams.values():
+            stream.sort(key=self.key)
+        return merge(streams.values(), self.key)
+
+    def _after(self, position):
+        values, schema = position
+        keys = [
+            ('pk' if field.primary_key else field.attname, descending, field.null, value)
+            for (field, descending), value in zip(self.ordering, values)
+        ]
+        keys.append((SCHEMA_TAG_ALIAS, False, False, schema))
+        condition = Q()
+        for index, (name, descending, null, value) in enumerate(keys):
+            if value is None:
+                # Nothing follows nulls in ascending order.
+                if not descending:
+                    continue
+                term = Q(**{'%s__isnull' % name: False})
+            else:
+                term = Q(**{'%s__%s' % (name, 'lt' if descending else 'gt'): value})
+                if null and not descending:
+                    term |= Q(**{'%s__isnull' % name: True})
+            for previous, _, _, previous_value in keys[:index]:
+                if previous_value is None:
+                    term &= Q(**{'%s__isnull' % previous: True})
+                else:
+                    term &= Q(**{previous: previous_value})
+            condition |= term
+        return condition
+
+    def _position(self, obj):
+        return [getattr(obj, field.attname) for field, _ in self.ordering], getattr(obj, SCHEMA_TAG_ALIAS)
+
+    def __iter__(self):
+        position = None
+        while True:
+            objs = list(islice(self._merged(self.chunk_size, position), self.chunk_size))
+            for obj in objs:
+                yield obj
+            if len(objs) < self.chunk_size:
+                return
+            position = self._position(objs[-1])
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None:
+                raise ValueError("Merged querysets don't support slice steps.")
+            start = k.start or 0
+            if start < 0 or (k.stop is not None and k.stop < 0):
+                raise ValueError("Negative indexing is not supported.")
+            if k.stop is not None and k.stop <= start:
+                return []
+            return list(islice(self._merged(k.stop), start, k.stop))
+        if not isinstance(k, six.integer_types):
+            raise TypeError
+        if k < 0:
+            raise ValueError("Negative indexing is not supported.")
+        objs = self[k:k + 1]
+        if not objs:
+            raise IndexError('list index out of range')
+        return objs[0]
+
+    def page(self, size, token=None):
+        """
+        Return the page of size objects following the position encoded in
+        token, or the first one, along with the token of the next page or None
+        if it's the last one.
+
+        Each page costs the same regardless of its depth provided the ordering
+        is supported by an index of each schema.
+        """
+        position = None if token is None else self.decode_token(token)
+        objs = list(islice(self._merged(size + 1, position), size + 1))
+        next_token = None
+        if len(objs) > size:
+            objs = objs[:size]
+            next_token = self.encode_token(objs[-1])
+        return Page(objs, next_token)
+
+    def encode_token(self, obj):
+        """
+        Return an opaque token encoding the position of obj.
+        """
+        values, schema = self._position(obj)
+        position = [schema, [field.get_prep_value(value) for (field, _), value in zip(self.ordering, values)]]
+        token = json.dumps(position, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_token(self, token):
+        """
+        Return the (values, schema) position encoded in token.
+        """
+        try:
+            token = base64.urlsafe_b64decode(str(token + '=' * (-len(token) % 4)))
+            schema, values = json.loads(token.decode('utf-8'))
+            if len(values) != len(self.ordering) or not isinstance(schema, six.string_types):
+                raise ValueError
+            values = [field.to_python(value) for (field, _), value in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise ValueError("Invalid pagination token.")
+        return values, schema
@@ -0,0 +1,86 @@
+from __future__ import unicode_literals
+
+from binascii import hexlify
+
+from django.db import models
+from django.utils import six
+
+COPY_FORMATS = ('text', 'csv', 'binary')
+
+# Characters which must be escaped in COPY text format columns.
+COPY_TEXT_ESCAPES = {
+    ord('\\'): '\\\\',
+    ord('\n'): '\\n',
+    ord('\r'): '\\r',
+    ord('\t'): '\\t',
+}
+
+
+def text_value(value, field):
+    """
+    Return the text representation of a non-NULL database prepared value of
+    field.
+    """
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(field, models.BinaryField):
+        # psycopg2.Binary
+        value = getattr(value, 'adapted', value)
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        return '\\x' + hexlify(bytes(value)).decode('ascii')
+    if isinstance(value, (list, tuple)):
+        return array_literal(value, getattr(field, 'base_field', None))
+    if hasattr(value, 'adapted') and hasattr(value, 'dumps'):
+        # psycopg2.extras.Json
+        value = value.dumps(value.adapted)
+    if isinstance(value, bytes):
+        # Native strings on Python 2.
+        value = value.decode('utf-8')
+    return six.text_type(value)
+
+
+def array_literal(values, base_field):
+    """
+    Return the array input representation of the values of an ArrayField.
+    """
+    items = []
+    for value in values:
+        if value is None:
+            items.append('NULL')
+        elif isinstance(value, (list, tuple)):
+            items.append(array_literal(value, base_field))
+        else:
+            items.append('"%s"' % text_value(value, base_field).replace('\\', '\\\\').replace('"', '\\"'))
+    return '{%s}' % ','.join(items)
+
+
+def copy_text(value, field=None):
+    """
+    Format a database prepared value of field as a COPY text format column.
+    """
+    if value is None:
+        return '\\N'
+    return text_value(value, field).translate(COPY_TEXT_ESCAPES)
+
+
+class IterableReader(object):
+    """
+    Read-only file-like object lazily consuming an iterable of strings.
+    """
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.iterator)
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self.buffer = self.buffer, ''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
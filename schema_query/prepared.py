@@ -0,0 +1,202 @@
+from __future__ import unicode_literals
+
+import itertools
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from .cache import LRUCache
+
+PLACEHOLDER_RE = re.compile(r'%([%s])')
+
+# Prepared statements of every connection share the same namespace.
+statement_names = itertools.count(1)
+
+
+def placeholders_sql(sql):
+    """
+    Return sql with its %s placeholders numbered as PREPARE expects them and
+    its %% escapes unescaped, along with the number of placeholders.
+    """
+    count = itertools.count(1)
+
+    def replace(match):
+        return '%' if match.group(1) == '%' else '$%d' % next(count)
+    sql = PLACEHOLDER_RE.sub(replace, sql)
+    return sql, next(count) - 1
+
+
+def execute_sql(name, params):
+    """
+    Return the SQL executing the prepared statement name with params.
+    """
+    if not params:
+        return 'EXECUTE %s' % name, ()
+    return 'EXECUTE %s (%s)' % (name, ', '.join(['%s'] * len(params))), tuple(params)
+
+
+class ConnectionStatements(object):
+    """
+    Statements prepared on a database session, from the least to the most
+    recently used, along with the number of executions of the statement texts
+    that aren't prepared yet.
+    """
+
+    def __init__(self, maxsize):
+        self.statements = OrderedDict()
+        self.executions = LRUCache(maxsize=maxsize * 4)
+        self.unpreparable = set()
+        self.stats = {'prepared': 0, 'deallocated': 0, 'executions': 0, 'failures': 0}
+
+
+class PreparedStatements(object):
+    """
+    Server-side prepared statements of the statement texts executed at least
+    threshold times on each connection.
+
+    Each connection keeps the maxsize most recently used statements prepared
+    and deallocates the least recently used one when it's exceeded. Statements
+    are keyed by their search path as well since it resolves the tables they
+    refer to. The planning time of each statement is measured when it's
+    prepared to estimate the time saved by the executions of its generic plan.
+    """
+
+    def __init__(self, maxsize=100, threshold=2):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # Keyed by DB-API connection so that statements are forgotten along
+        # with the session they were prepared in once it's closed.
+        self._connections = weakref.WeakKeyDictionary()
+
+    def connection_statements(self, connection, create=False):
+        if connection.connection is None:
+            return None
+        with self._lock:
+            statements = self._connections.get(connection.connection)
+            if statements is None and create:
+                statements = self._connections[connection.connection] = ConnectionStatements(self.maxsize)
+            return statements
+
+    def prepare(self, connection, sql, params, search_path=None):
+        """
+        Return the (sql, params) executing the statement sql with params in its
+        prepared form, preparing it if it's used frequently enough, or None.
+        """
+        connection.ensure_connection()
+        statements = self.connection_statements(connection, create=True)
+        key = (search_path, sql)
+        entry = statements.statements.pop(key, None)
+        if entry is None:
+            if key in statements.unpreparable:
+                return None
+            executions = statements.executions.get(key, 0) + 1
+            if executions < self.threshold:
+                statements.executions.set(key, executions)
+                return None
+            entry = self._prepare(connection, statements, key, params)
+            if entry is None:
+                return None
+        statements.statements[key] = entry
+        statements.stats['executions'] += 1
+        return execute_sql(entry['name'], params)
+
+    def _prepare(self, connection, statements, key, params):
+        prepare_sql, count = placeholders_sql(key[1])
+        if count != len(params):
+            statements.unpreparable.add(key)
+            return None
+        name = 'schema_query_%d' % next(statement_names)
+        prepared = False
+        try:
+            # A failure must not abort the transaction the statement belongs to.
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute('PREPARE %s AS %s' % (name, prepare_sql))
+                prepared = True
+                cursor.execute('EXPLAIN (FORMAT JSON, SUMMARY) %s' % key[1], params)
+                planning_time = cursor.fetchone()[0][0]['Planning Time']
+        except DatabaseError:
+            # Prepared statements outlive the rollback of their transaction.
+            if prepared:
+                self._deallocate(connection, name)
+            statements.unpreparable.add(key)
+            statements.stats['failures'] += 1
+            return None
+        while len(statements.statements) >= self.maxsize:
+            _, evicted = statements.statements.popitem(last=False)
+            if self._deallocate(connection, evicted['name']):
+                statements.stats['deallocated'] += 1
+        statements.stats['prepared'] += 1
+        return {'name': name, 'sql': key[1], 'search_path': key[0], 'planning_time': planning_time}
+
+    def _deallocate(self, connection, name):
+        # A failure, e.g. when the statement was deallocated by other means,
+        # must not abort the current transaction either.
+        try:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute('DEALLOCATE %s' % name)
+        except DatabaseError:
+            return False
+        return True
+
+    def info(self, using=DEFAULT_DB_ALIAS):
+        """
+        Return the statistics of the statements prepared on the current
+        thread's connection to the using database, including the planning time
+        in milliseconds saved by the executions of their generic plans.
+        """
+        connection = connections[using]
+        statements = self.connection_statements(connection)
+        if statements is None:
+            return {
+                'prepared': 0, 'deallocated': 0, 'executions': 0, 'failures': 0, 'currsize': 0,
+                'maxsize': self.maxsize, 'generic_plans': 0, 'planning_time_saved': 0.0,
+            }
+        generic_plans = {}
+        # Plan counters were added in PostgreSQL 14.
+        if connection.pg_version >= 140000 and statements.statements:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT name, generic_plans FROM pg_prepared_statements WHERE name = ANY(%s)',
+                    [[entry['name'] for entry in statements.statements.values()]],
+                )
+                generic_plans = dict(cursor.fetchall())
+        return dict(
+            statements.stats,
+            currsize=len(statements.statements),
+            maxsize=self.maxsize,
+            generic_plans=sum(generic_plans.values()),
+            planning_time_saved=sum(
+                entry['planning_time'] * generic_plans.get(entry['name'], 0)
+                for entry in statements.statements.values()
+            ),
+        )
+
+    def clear(self, using=DEFAULT_DB_ALIAS):
+        """
+        Deallocate the statements prepared on the current thread's connection
+        to the using database.
+        """
+        connection = connections[using]
+        statements = self.connection_statements(connection)
+        if statements is None:
+            return
+        with self._lock:
+            del self._connections[connection.connection]
+        for entry in statements.statements.values():
+            self._deallocate(connection, entry['name'])
+
+
+_default_prepared_statements = []
+
+
+def default_prepared_statements():
+    """
+    Return the in-process PreparedStatements used when none is specified.
+    """
+    if not _default_prepared_statements:
+        _default_prepared_statements.append(PreparedStatements())
+    return _default_prepared_statements[0]
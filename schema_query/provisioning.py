@@ -0,0 +1,257 @@
+from __future__ import unicode_literals
+
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.db import (
+    DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, connections, transaction,
+)
+from django.utils.six.moves import queue
+from psycopg2 import errorcodes
+
+from .registry import default_registry
+
+DEFAULT_BATCH_SIZE = 50
+
+POOL_PREFIX = 'pool_'
+
+OWNED_SEQUENCES_SQL = """
+SELECT s.relname, t.relname, a.attname
+FROM pg_catalog.pg_class s
+INNER JOIN pg_catalog.pg_namespace n ON n.oid = s.relnamespace
+INNER JOIN pg_catalog.pg_depend d ON (
+    d.classid = 'pg_catalog.pg_class'::regclass AND d.objid = s.oid AND d.deptype = 'a'
+    AND d.refclassid = 'pg_catalog.pg_class'::regclass
+)
+INNER JOIN pg_catalog.pg_class t ON t.oid = d.refobjid
+INNER JOIN pg_catalog.pg_attribute a ON a.attrelid = t.oid AND a.attnum = d.refobjsubid
+WHERE s.relkind = 'S' AND n.nspname = %s AND t.relname = ANY(%s)
+ORDER BY t.relname, a.attnum
+"""
+
+SEQUENCE_DEFAULTS_SQL = """
+SELECT c.relname, a.attname, pg_catalog.pg_get_expr(d.adbin, d.adrelid)
+FROM pg_catalog.pg_attrdef d
+INNER JOIN pg_catalog.pg_class c ON c.oid = d.adrelid
+INNER JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+INNER JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum = d.adnum
+WHERE n.nspname = %s AND c.relname = ANY(%s)
+AND pg_catalog.pg_get_expr(d.adbin, d.adrelid) LIKE 'nextval(%%'
+ORDER BY c.relname, a.attnum
+"""
+
+FOREIGN_KEYS_SQL = """
+SELECT c.relname, con.conname, pg_catalog.pg_get_constraintdef(con.oid)
+FROM pg_catalog.pg_constraint con
+INNER JOIN pg_catalog.pg_class c ON c.oid = con.conrelid
+INNER JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE con.contype = 'f' AND n.nspname = %s AND c.relname = ANY(%s)
+ORDER BY c.relname, con.conname
+"""
+
+
+class ProvisioningError(Exception):
+    """
+    Raised when the provisioning of one or many batches of schemas failed. The
+    errors attribute holds (schemas, exception) pairs.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(ProvisioningError, self).__init__(
+            'Provisioning failed for %d batch(es): %s' % (
+                len(errors), '; '.join('%s: %r' % (', '.join(schemas), exc) for schemas, exc in errors)
+            )
+        )
+
+
+@contextmanager
+def local_search_path(cursor, schema):
+    """
+    Resolve unqualified names against schema within the block and restore the
+    search path of the current transaction afterwards.
+    """
+    cursor.execute("SELECT pg_catalog.current_setting('search_path')")
+    previous = cursor.fetchone()[0]
+    cursor.execute('SET LOCAL search_path TO %s' % cursor.db.ops.quote_name(schema))
+    try:
+        yield
+    finally:
+        cursor.execute("SELECT pg_catalog.set_config('search_path', %s, true)", [previous])
+
+
+def template_statements(connection, template, tables):
+    """
+    Return the statements creating the tables of the template schema, along
+    with their indexes, constraints and sequences, in the schema unqualified
+    names resolve to.
+    """
+    quote_name = connection.ops.quote_name
+    tables = sorted(tables)
+    with transaction.atomic(using=connection.alias, savepoint=False), connection.cursor() as cursor:
+        # Have the catalog functions print template objects unqualified.
+        with local_search_path(cursor, template):
+            cursor.execute(OWNED_SEQUENCES_SQL, [template, tables])
+            sequences = cursor.fetchall()
+            cursor.execute(SEQUENCE_DEFAULTS_SQL, [template, tables])
+            defaults = cursor.fetchall()
+            cursor.execute(FOREIGN_KEYS_SQL, [template, tables])
+            foreign_keys = cursor.fetchall()
+    statements = ['CREATE SEQUENCE %s' % quote_name(sequence) for sequence, _, _ in sequences]
+    statements.extend(
+        'CREATE TABLE %s (LIKE %s.%s INCLUDING ALL)' % (quote_name(table), quote_name(template), quote_name(table))
+        for table in tables
+    )
+    # Copied defaults keep referring to the template's sequences.
+    statements.extend(
+        'ALTER TABLE %s ALTER COLUMN %s SET DEFAULT %s' % (quote_name(table), quote_name(column), default)
+        for table, column, default in defaults
+    )
+    statements.extend(
+        'ALTER SEQUENCE %s OWNED BY %s.%s' % (quote_name(sequence), quote_name(table), quote_name(column))
+        for sequence, table, column in sequences
+    )
+    statements.extend(
+        'ALTER TABLE %s ADD CONSTRAINT %s %s' % (quote_name(table), quote_name(name), definition)
+        for table, name, definition in foreign_keys
+    )
+    return statements
+
+
+def model_statements(connection, models):
+    """
+    Return the statements creating the tables of models in the schema
+    unqualified names resolve to.
+    """
+    with connection.schema_editor(collect_sql=True) as editor:
+        for model in sorted(models, key=lambda model: model._meta.db_table):
+            if not model._meta.auto_created:
+                editor.create_model(model)
+    return [statement.rstrip(';') for statement in editor.collected_sql]
+
+
+def provision_batch(connection, schemas, statements):
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias, savepoint=False), connection.cursor() as cursor:
+        sql = []
+        for schema in schemas:
+            sql.append('CREATE SCHEMA %s' % quote_name(schema))
+            sql.append('SET LOCAL search_path TO %s' % quote_name(schema))
+            sql.extend(statements)
+        cursor.execute("SELECT pg_catalog.current_setting('search_path')")
+        previous = cursor.fetchone()[0]
+        # Send the whole batch in a single round trip.
+        cursor.execute(';\n'.join(sql))
+        cursor.execute("SELECT pg_catalog.set_config('search_path', %s, true)", [previous])
+
+
+def provision_schemas(schemas, template=None, registry=None, using=DEFAULT_DB_ALIAS,
+                      batch_size=DEFAULT_BATCH_SIZE, max_workers=1):
+    """
+    Create each of the schemas with the tables of the registry's models and
+    return their table schemas mappings.
+
+    The tables, indexes, constraints and sequences are copied from the
+    template schema when specified or created from the models' definition
+    otherwise. Schemas are created by batches of batch_size per transaction,
+    concurrently on max_workers connections, and are registered once created
+    in registry, the default one of the using database unless specified.
+    """
+    if registry is None:
+        registry = default_registry(using)
+    schemas = list(schemas)
+    connection = connections[using]
+    if template is None:
+        statements = model_statements(connection, registry.models)
+    else:
+        statements = template_statements(connection, template, registry.tables)
+    batches = [schemas[start:start + batch_size] for start in range(0, len(schemas), batch_size)]
+    if max_workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            provision_batch(connection, batch, statements)
+    else:
+        run_batches(batches, statements, using, max_workers)
+    if schemas:
+        registry.discover(schemas)
+    return registry.table_schemas_list(schemas)
+
+
+def run_batches(batches, statements, using, max_workers):
+    tasks = queue.Queue()
+    for batch in batches:
+        tasks.put(batch)
+    errors = []
+    failed = threading.Event()
+
+    def worker():
+        try:
+            while not failed.is_set():
+                try:
+                    batch = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    provision_batch(connections[using], batch, statements)
+                except Exception as exc:
+                    failed.set()
+                    errors.append((batch, exc))
+        finally:
+            connections[using].close()
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max_workers, len(batches)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise ProvisioningError(errors)
+
+
+def warm_pool(count, template=None, registry=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Provision count empty schemas to be claimed later on and return their
+    names.
+    """
+    schemas = ['%s%s' % (POOL_PREFIX, uuid.uuid4().hex) for _ in range(count)]
+    provision_schemas(schemas, template=template, registry=registry, using=using, **kwargs)
+    return schemas
+
+
+def claim_schema(schema, template=None, registry=None, using=DEFAULT_DB_ALIAS):
+    """
+    Rename a pooled schema to schema, or provision it if the pool is empty, and
+    return its table schemas mapping.
+    """
+    if registry is None:
+        registry = default_registry(using)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nspname FROM pg_catalog.pg_namespace WHERE nspname LIKE %s ORDER BY nspname",
+            [POOL_PREFIX.replace('_', '\\_') + '%'],
+        )
+        candidates = [row[0] for row in cursor.fetchall()]
+    for candidate in candidates:
+        try:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                # Skip the candidates being claimed concurrently, then the ones
+                # claimed since they were listed.
+                cursor.execute('SELECT pg_catalog.pg_try_advisory_xact_lock(pg_catalog.hashtext(%s))', [candidate])
+                if not cursor.fetchone()[0]:
+                    continue
+                cursor.execute('SELECT 1 FROM pg_catalog.pg_namespace WHERE nspname = %s', [candidate])
+                if cursor.fetchone() is None:
+                    continue
+                cursor.execute('ALTER SCHEMA %s RENAME TO %s' % (quote_name(candidate), quote_name(schema)))
+        except DatabaseError as exc:
+            # The schema was created meanwhile, possibly concurrently.
+            pgcode = getattr(exc.__cause__, 'pgcode', None)
+            if isinstance(exc, IntegrityError) or pgcode == errorcodes.DUPLICATE_SCHEMA:
+                raise ValueError('Schema %r already exists.' % schema)
+            raise
+        registry.discover([candidate, schema])
+        return registry.table_schemas(schema)
+    return provision_schemas([schema], template=template, registry=registry, using=using)[0]
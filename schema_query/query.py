@@ -1,40 +1,88 @@
 from __future__ import unicode_literals
 
 import django
+from django.db import connections, transaction
 from django.db.models import sql
 from django.utils.lru_cache import lru_cache
 
-from .options import SchemaOptions
+from .compiler import schema_compiler_class_factory
+from .options import qualified_table_name, schema_options
+from .search_path import search_path_for, set_search_path
 
 
 class SchemaQuery(sql.Query):
     def __init__(self, *args, **kwargs):
         self.table_schemas = kwargs.pop('table_schemas', {})
+        self.across_table_schemas = kwargs.pop('across_table_schemas', None)
+        # Identifies queries sharing the same shape; see SchemaQuerySet.retarget().
+        self.template_key = kwargs.pop('template_key', None)
+        # Leave table names unqualified and resolve them through the search
+        # path of the transaction instead.
+        self.search_path = kwargs.pop('search_path', False)
+        # ResultCache the rows of the query are retrieved from; see
+        # SchemaQuerySet.cache().
+        self.result_cache = kwargs.pop('result_cache', None)
+        # PreparedStatements the query is executed through; see
+        # SchemaQuerySet.prepare().
+        self.prepared_statements = kwargs.pop('prepared_statements', None)
         super(SchemaQuery, self).__init__(*args, **kwargs)
 
     def get_meta(self):
         opts = super(SchemaQuery, self).get_meta()
+        if self.search_path:
+            return opts
         schema = self.table_schemas.get(opts.db_table)
         if schema:
-            return SchemaOptions(schema, opts)
+            return schema_options(schema, opts)
         return opts
 
     def join(self, join, *args, **kwargs):
-        schema = self.table_schemas.get(join.table_name)
+        schema = None if self.search_path else self.table_schemas.get(join.table_name)
         if schema:
-            join.table_name = '"%s"."%s"' % (schema, join.table_name)
+            join.table_name = qualified_table_name(schema, join.table_name)
         return super(SchemaQuery, self).join(join, *args, **kwargs)
 
+    def get_table_schemas_list(self):
+        return self.across_table_schemas or (self.table_schemas,)
+
+    def get_search_path(self):
+        if not self.search_path:
+            return None
+        if self.across_table_schemas:
+            return search_path_for(self.across_table_schemas[0])
+        return search_path_for(self.table_schemas)
+
+    def get_compiler(self, *args, **kwargs):
+        compiler = super(SchemaQuery, self).get_compiler(*args, **kwargs)
+        compiler.__class__ = schema_compiler_class_factory(compiler.__class__)
+        return compiler
+
+    def get_aggregation(self, using, *args, **kwargs):
+        search_path = self.get_search_path()
+        if search_path is None:
+            return super(SchemaQuery, self).get_aggregation(using, *args, **kwargs)
+        # The aggregation might be performed by a non-schema outer query.
+        with transaction.atomic(using=using, savepoint=False):
+            set_search_path(connections[using], search_path)
+            return super(SchemaQuery, self).get_aggregation(using, *args, **kwargs)
+
     if django.VERSION >= (2, 0):
         def clone(self):
             clone = super(SchemaQuery, self).clone()
             clone.__class__ = schema_query_class_factory(self.__class__)
             clone.table_schemas = self.table_schemas
+            clone.template_key = None
             return clone
     else:
         def clone(self, klass=None, *args, **kwargs):
             klass = schema_query_class_factory(klass or self.__class__)
-            return super(SchemaQuery, self).clone(klass=klass, *args, table_schemas=self.table_schemas, **kwargs)
+            kwargs.setdefault('table_schemas', self.table_schemas)
+            kwargs.setdefault('across_table_schemas', self.across_table_schemas)
+            kwargs.setdefault('template_key', None)
+            kwargs.setdefault('search_path', self.search_path)
+            kwargs.setdefault('result_cache', self.result_cache)
+            kwargs.setdefault('prepared_statements', self.prepared_statements)
+            return super(SchemaQuery, self).clone(klass=klass, *args, **kwargs)
 
     def chain(self, klass=None):
         klass = schema_query_class_factory(klass or self.__class__)
@@ -1,20 +1,138 @@
 from __future__ import unicode_literals
 
+import copy
+import threading
+from collections import OrderedDict
 from functools import partial
+from itertools import chain
+from timeit import default_timer
 
-from django.db import models
+import django
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, router, transaction
+from django.db.models import sql
+from psycopg2.extensions import encodings
 
-from .deletion import Collector
+from .cache import default_result_cache, invalidate_tables
+from .compiler import retarget_sql, schema_literal
+from .datastructures import freeze_table_schemas
+from .deletion import Collector, SetCollector, SetCopier
+from .expressions import SCHEMA_TAG, SCHEMA_TAG_ALIAS, SchemaTag
+from .identity import current_identity_map, evict_schemas
+from .instrumentation import (
+    SchemaStatement, is_instrumented, record_statement, schemas_of,
+    tag_statement,
+)
 from .managers import SchemaBaseManager
+from .options import qualified_table_name, schema_options
+from .pagination import MergedAcrossSchemas
+from .pgcopy import COPY_FORMATS, IterableReader, copy_text
+from .prepared import default_prepared_statements
 from .query import SchemaDeleteQuery, SchemaInsertQuery, SchemaQuery
+from .routers import group_by_database
+from .search_path import set_search_path
+
+# Guards the assignment of the template key of retargeted querysets.
+template_key_lock = threading.Lock()
+
+# Estimates below which estimated_count() counts records exactly.
+ESTIMATED_COUNT_THRESHOLD = 1000
+
+# Scales the number of rows of each table recorded by the latest VACUUM or
+# ANALYZE to its current number of pages like the planner does. NULL, i.e. an
+# exact count, is returned for the tables never vacuumed nor analyzed, which
+# have -1 rows recorded since PostgreSQL 14, and for the tables without
+# recorded pages, which have no row density to scale: the ones that were empty
+# when analyzed and, before PostgreSQL 14, the ones never vacuumed nor
+# analyzed.
+ESTIMATED_COUNTS_SQL = (
+    "SELECT CASE WHEN c.reltuples < 0 OR c.relpages = 0 THEN NULL "
+    "ELSE c.reltuples / c.relpages * "
+    "(pg_relation_size(c.oid) / current_setting('block_size')::integer) END "
+    "FROM unnest(%s::text[]) WITH ORDINALITY AS t(name, ordinality) "
+    "LEFT JOIN pg_class c ON c.oid = to_regclass(t.name) ORDER BY t.ordinality"
+)
+
+
+def related_cached_objects(obj):
+    """
+    Return the related instances cached on obj, e.g. by select_related().
+    """
+    if django.VERSION >= (2, 0):
+        values = obj._state.fields_cache.values()
+    else:
+        values = [value for name, value in vars(obj).items() if name.endswith('_cache')]
+    return [value for value in values if isinstance(value, models.Model)]
+
+
+def set_table_schemas(obj, table_schemas):
+    obj._state.table_schemas = table_schemas
+    for related_obj in related_cached_objects(obj):
+        if getattr(related_obj._state, 'table_schemas', None) is not table_schemas:
+            set_table_schemas(related_obj, table_schemas)
+
+
+def prefetch_related_objects(model_instances, *related_lookups):
+    """
+    Populate prefetched object caches for each group of model_instances sharing
+    the same table schemas, retargeting the querysets of Prefetch lookups to
+    the group's table schemas.
+    """
+    groups = OrderedDict()
+    for obj in model_instances:
+        table_schemas = getattr(getattr(obj, '_state', None), 'table_schemas', None)
+        key = frozenset(table_schemas.items()) if table_schemas else None
+        groups.setdefault(key, (table_schemas, []))[1].append(obj)
+    for table_schemas, instances in groups.values():
+        lookups = related_lookups
+        if table_schemas:
+            lookups = [retarget_prefetch(lookup, table_schemas) for lookup in related_lookups]
+        models.query.prefetch_related_objects(instances, *lookups)
+
+
+def retarget_prefetch(lookup, table_schemas):
+    queryset = getattr(lookup, 'queryset', None)
+    if not isinstance(queryset, SchemaQuerySet) or queryset._table_schemas == table_schemas:
+        return lookup
+    lookup = copy.copy(lookup)
+    if queryset._table_schemas:
+        lookup.queryset = queryset.retarget(table_schemas)
+    else:
+        # Leave the queryset of the lookup untouched by _add_hints().
+        lookup.queryset = queryset._clone(table_schemas=table_schemas)
+        lookup.queryset.query.table_schemas = lookup.queryset._table_schemas
+    return lookup
 
 
 class SchemaIterableClass(models.query.ModelIterable):
     def __iter__(self):
-        table_schemas = self.queryset._table_schemas
+        query = self.queryset.query
         iterator = super(SchemaIterableClass, self).__iter__()
+        # A single immutable mapping is shared by all the yielded instances.
+        table_schemas = self.queryset._table_schemas
+        tagged_table_schemas = None
+        if isinstance(query.annotations.get(SCHEMA_TAG_ALIAS), SchemaTag):
+            db_table = self.queryset.model._meta.db_table
+            tagged_table_schemas = {
+                table_schemas.get(db_table): freeze_table_schemas(table_schemas)
+                for table_schemas in query.across_table_schemas
+            }
+        identity_map = current_identity_map()
+        if not query.select_related and tagged_table_schemas is None and identity_map is None:
+            for obj in iterator:
+                obj._state.table_schemas = table_schemas
+                yield obj
+            return
         for obj in iterator:
-            obj._state.table_schemas = table_schemas
+            if tagged_table_schemas is not None:
+                table_schemas = tagged_table_schemas[getattr(obj, SCHEMA_TAG_ALIAS)]
+            # Instances retrieved through select_related() belong to the same
+            # table schemas.
+            set_table_schemas(obj, table_schemas)
+            if identity_map is not None:
+                identity_map.add(obj)
+                for related_obj in related_cached_objects(obj):
+                    identity_map.add(related_obj)
             yield obj
 
 
@@ -22,18 +140,309 @@ class SchemaQuerySet(models.QuerySet):
     base_manager_class = SchemaBaseManager
 
     def __init__(self, model=None, query=None, *args, **kwargs):
-        self._table_schemas = kwargs.pop('table_schemas', {})
+        self._table_schemas = freeze_table_schemas(kwargs.pop('table_schemas', {}))
+        search_path = kwargs.pop('search_path', False)
         if query is None:
-            query = SchemaQuery(model, table_schemas=self._table_schemas)
+            query = SchemaQuery(model, table_schemas=self._table_schemas, search_path=search_path)
         super(SchemaQuerySet, self).__init__(model=model, query=query, *args, **kwargs)
         self._iterable_class = SchemaIterableClass
 
     def _clone(self, **kwargs):
         table_schemas = kwargs.pop('table_schemas', self._table_schemas)
         clone = super(SchemaQuerySet, self)._clone(**kwargs)
-        clone._table_schemas = table_schemas
+        clone._table_schemas = freeze_table_schemas(table_schemas)
+        return clone
+
+    @property
+    def db(self):
+        """
+        Return the database used if this query is executed now.
+        """
+        if self._db:
+            return self._db
+        # Let routers pick the database holding the schemas.
+        hints = dict(self._hints, table_schemas_list=self.query.get_table_schemas_list())
+        if self._for_write:
+            return router.db_for_write(self.model, **hints)
+        return router.db_for_read(self.model, **hints)
+
+    def _database_groups(self, for_write=False):
+        """
+        Return the across schemas mappings grouped by the database they are
+        routed to when they span many databases.
+        """
+        across_table_schemas = self.query.across_table_schemas
+        if self._db or not across_table_schemas or len(across_table_schemas) < 2 or not router.routers:
+            return None
+        groups = group_by_database(self.model, across_table_schemas, for_write=for_write or self._for_write)
+        if len(groups) < 2:
+            return None
+        return groups
+
+    def _for_database(self, db, table_schemas_list):
+        clone = self.using(db)
+        clone.query.across_table_schemas = tuple(table_schemas_list)
         return clone
 
+    def _fetch_all(self):
+        if self._result_cache is None:
+            groups = self._database_groups()
+            if groups is not None:
+                # Each group fetches its prefetched objects from its database.
+                self._result_cache = list(chain.from_iterable(
+                    self._for_database(db, table_schemas_list) for db, table_schemas_list in groups.items()
+                ))
+                self._prefetch_done = True
+        super(SchemaQuerySet, self)._fetch_all()
+
+    def iterator(self, *args, **kwargs):
+        groups = self._database_groups()
+        if groups is None:
+            return super(SchemaQuerySet, self).iterator(*args, **kwargs)
+        return chain.from_iterable(
+            self._for_database(db, table_schemas_list).iterator(*args, **kwargs)
+            for db, table_schemas_list in groups.items()
+        )
+
+    def count(self):
+        groups = self._database_groups() if self._result_cache is None else None
+        if groups is None:
+            return super(SchemaQuerySet, self).count()
+        return sum(
+            self._for_database(db, table_schemas_list).count() for db, table_schemas_list in groups.items()
+        )
+
+    def exists(self):
+        groups = self._database_groups() if self._result_cache is None else None
+        if groups is None:
+            return super(SchemaQuerySet, self).exists()
+        return any(
+            self._for_database(db, table_schemas_list).exists() for db, table_schemas_list in groups.items()
+        )
+
+    def aggregate(self, *args, **kwargs):
+        if self._database_groups() is not None:
+            raise TypeError("Cannot aggregate across schemas of many databases.")
+        return super(SchemaQuerySet, self).aggregate(*args, **kwargs)
+
+    def _across_databases_writes(self, method, *args):
+        """
+        Call method on each group of the across schemas mappings routed to the
+        same database and combine their number of affected rows, or return
+        None if they all live in the same database.
+        """
+        groups = self._database_groups(for_write=True)
+        if groups is None:
+            return None
+        total = 0
+        counts = {}
+        for db, table_schemas_list in groups.items():
+            group_total, group_counts = getattr(self._for_database(db, table_schemas_list), method)(*args)
+            total += group_total
+            counts.update(group_counts)
+        self._result_cache = None
+        return total, counts
+
+    def estimated_count(self, threshold=ESTIMATED_COUNT_THRESHOLD):
+        """
+        Returns an estimate of the number of records in the current QuerySet
+        read from the catalog statistics of its model's table. Records are
+        counted exactly when the estimate is below threshold, when the table
+        wasn't analyzed yet or was empty when it was, or when the QuerySet is
+        filtered, distinct, grouped or annotated.
+
+        After across_schemas(), the estimates of every schema are read by a
+        single catalog query and the exact counts by a single query per
+        database, and a tuple of the total and a dict of the number of records
+        per schema is returned.
+        """
+        if self._is_across_schemas():
+            groups = self._database_groups()
+            if groups is None:
+                return self._estimated_counts(self.query.across_table_schemas, threshold)
+            total = 0
+            counts = {}
+            for db, table_schemas_list in groups.items():
+                group_total, group_counts = self._for_database(db, table_schemas_list)._estimated_counts(
+                    table_schemas_list, threshold,
+                )
+                total += group_total
+                counts.update(group_counts)
+            return total, counts
+        self._not_support_across_schemas('estimated_count')
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        _, counts = self._estimated_counts([self._table_schemas], threshold)
+        return counts[self._table_schemas.get(self.model._meta.db_table)]
+
+    def _estimated_counts(self, table_schemas_list, threshold):
+        opts = self.model._meta
+        query = self.query
+        schemas = [table_schemas.get(opts.db_table) for table_schemas in table_schemas_list]
+        estimates = [None] * len(schemas)
+        # Any of these might change the number of records, e.g. values() and
+        # annotate() counting groups; the schema tag doesn't.
+        annotations = [
+            alias for alias, annotation in query.annotations.items()
+            if alias != SCHEMA_TAG_ALIAS or not isinstance(annotation, SchemaTag)
+        ]
+        unfiltered = (
+            not query.where and not query.distinct and not query.group_by and not annotations and
+            query.can_filter() and not getattr(query, 'combinator', None)
+        )
+        if unfiltered and all(schemas):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(ESTIMATED_COUNTS_SQL, [[
+                    schema_options(schema, opts).db_table for schema in schemas
+                ]])
+                estimates = [
+                    None if estimate is None or estimate < threshold else int(round(estimate))
+                    for estimate, in cursor.fetchall()
+                ]
+        exact = [table_schemas for table_schemas, estimate in zip(table_schemas_list, estimates) if estimate is None]
+        exact_counts = iter(self._exact_counts(exact))
+        counts = OrderedDict(
+            (schema, next(exact_counts) if estimate is None else estimate)
+            for schema, estimate in zip(schemas, estimates)
+        )
+        return sum(counts.values()), counts
+
+    def _exact_counts(self, table_schemas_list):
+        """
+        Returns the number of records of the current QuerySet evaluated against
+        each of the table_schemas mappings through a single query.
+        """
+        if not table_schemas_list:
+            return []
+        source = self._without_schema_tag() if self._is_across_schemas() else self._clone()
+        query = source.query
+        if query.search_path:
+            # Table names are resolved by the search path of each mapping.
+            return [source.retarget(table_schemas).count() for table_schemas in table_schemas_list]
+        if query.can_filter():
+            query.clear_ordering(force_empty=True)
+        try:
+            sql, params = query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return [0] * len(table_schemas_list)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute('SELECT %s' % ', '.join(
+                '(SELECT COUNT(*) FROM (%s) subquery)' % retarget_sql(sql, query.table_schemas, table_schemas)
+                for table_schemas in table_schemas_list
+            ), tuple(params) * len(table_schemas_list))
+            return list(cursor.fetchone())
+
+    def _not_support_across_schemas(self, operation_name):
+        if self.query.across_table_schemas is not None:
+            raise TypeError("Cannot call %s() after across_schemas() or retarget()." % operation_name)
+
+    def retarget(self, table_schemas):
+        """
+        Returns a new QuerySet instance that evaluates the current one against
+        table_schemas instead of the mapping it was built with. Only the tables
+        qualified by the latter are retargeted and the returned QuerySet can't
+        write to them.
+
+        Retargeted copies of a queryset share the same shape and are only
+        compiled once; subsequent evaluations retrieve their SQL from the
+        template cache and substitute the schema qualified table names.
+        """
+        template_key = self.query.template_key
+        if template_key is None:
+            # The key only identifies the shape of the query; querysets are
+            # retargeted concurrently by execute_across_schemas().
+            with template_key_lock:
+                if self.query.template_key is None:
+                    self.query.template_key = object()
+                template_key = self.query.template_key
+        clone = self._clone(table_schemas=table_schemas)
+        clone.query.template_key = template_key
+        clone.query.across_table_schemas = (table_schemas,)
+        return clone
+
+    def across_schemas(self, table_schemas_list):
+        """
+        Returns a new QuerySet instance that evaluates the current one against
+        each of the table_schemas mappings in a single UNION ALL query.
+
+        Rows are annotated with the schema of the model's table they originate
+        from and instances have their table schemas set accordingly. Ordering
+        and slicing are applied per schema. update() and delete() write to all
+        the schemas in a single statement.
+        """
+        if self.query.search_path:
+            raise TypeError("Cannot use across_schemas() on a search path queryset.")
+        table_schemas_list = tuple(table_schemas_list)
+        if not table_schemas_list:
+            return self.none()
+        db_table = self.model._meta.db_table
+        schemas = [table_schemas.get(db_table) for table_schemas in table_schemas_list]
+        if len(set(schemas)) != len(schemas):
+            raise ValueError(
+                "Each table schemas mapping must target a distinct schema for %r." % db_table
+            )
+        if SCHEMA_TAG_ALIAS in {field.name for field in self.model._meta.get_fields()}:
+            raise ValueError("The %r schema tag conflicts with a field on the model." % SCHEMA_TAG_ALIAS)
+        clone = self._clone()
+        clone.query.across_table_schemas = table_schemas_list
+        clone.query.add_annotation(SchemaTag(), SCHEMA_TAG_ALIAS)
+        return clone
+
+    def cache(self, result_cache=None):
+        """
+        Returns a new QuerySet instance whose rows are retrieved from
+        result_cache, or the default in-process one, when they were already
+        fetched by a query with the same SQL and parameters.
+
+        Entries are invalidated by the writes performed through schema
+        querysets and models to the tables they read from in their schema,
+        including copy_from(), copy_to_schema() and move_to(). Writes performed
+        otherwise, e.g. through plain managers, raw cursors or other database
+        clients, aren't tracked and leave stale entries behind until they are
+        evicted or expire.
+        """
+        clone = self._clone()
+        clone.query.result_cache = result_cache or default_result_cache()
+        return clone
+
+    def prepare(self, prepared_statements=None):
+        """
+        Returns a new QuerySet instance executed through server-side prepared
+        statements of prepared_statements, or the default in-process ones,
+        once its SQL was executed frequently enough on a connection.
+        """
+        clone = self._clone()
+        clone.query.prepared_statements = prepared_statements or default_prepared_statements()
+        return clone
+
+    def merge_across_schemas(self, table_schemas_list):
+        """
+        Returns the current QuerySet evaluated against each of the
+        table_schemas mappings as a single stream ordered by its ordering.
+
+        Slicing it or retrieving one of its keyset pages limits the rows of each
+        schema in the database and merges them lazily.
+        """
+        return MergedAcrossSchemas(self, table_schemas_list)
+
+    def _add_hints(self, **hints):
+        # The hints and the query are shared with the querysets this one was
+        # cloned from or built with, e.g. the queryset of a Prefetch lookup.
+        self._hints = dict(self._hints, **hints)
+        # Related descriptors build their prefetch querysets before providing
+        # the instance they originate from; adopt its table schemas.
+        instance = hints.get('instance')
+        if not self._table_schemas and instance is not None:
+            table_schemas = getattr(instance._state, 'table_schemas', None)
+            if table_schemas:
+                query = self.query.clone()
+                query.table_schemas = table_schemas
+                self._table_schemas, self.query = table_schemas, query
+
+    def _prefetch_related_objects(self):
+        prefetch_related_objects(self._result_cache, *self._prefetch_related_lookups)
+        self._prefetch_done = True
+
     def as_manager(cls):
         # Obligatory copy-pasta of QuerySet.as_manager because the latter
         # doesn't allow specifying a custom base manager class.
@@ -53,9 +462,435 @@ class SchemaQuerySet(models.QuerySet):
         obj.save(force_insert=True, using=self.db, table_schemas=self._table_schemas)
         return obj
 
+    def _is_across_schemas(self):
+        return isinstance(self.query.annotations.get(SCHEMA_TAG_ALIAS), SchemaTag)
+
+    def _without_schema_tag(self):
+        """
+        Returns a clone of an across_schemas() queryset evaluated against the
+        table schemas mapping it was built with.
+        """
+        clone = self._clone(table_schemas=self.query.table_schemas)
+        query = clone.query
+        query.across_table_schemas = None
+        del query.annotations[SCHEMA_TAG_ALIAS]
+        if query.annotation_select_mask is not None:
+            query.set_annotation_mask(query.annotation_select_mask - {SCHEMA_TAG_ALIAS})
+        return clone
+
+    def _across_schemas_writes(self, kind, ctes_for, params, tables=()):
+        """
+        Runs the kind data-modifying CTEs returned by ctes_for(prefix), along
+        with the aliases of the ones to count, for each of the across table
+        schemas mappings in a single statement. Returns the total number of affected
+        rows and a dict of the number of affected rows per schema.
+        """
+        across_table_schemas = self.query.across_table_schemas
+        db_table = self.model._meta.db_table
+        schemas = [table_schemas.get(db_table) for table_schemas in across_table_schemas]
+        if ctes_for is None:
+            return 0, dict.fromkeys(schemas, 0)
+        ctes = []
+        counts = []
+        for index, table_schemas in enumerate(across_table_schemas):
+            # The CTEs are compiled against the queryset's mapping.
+            schema_ctes, aliases = ctes_for('s%d_' % index)
+            ctes.extend(
+                retarget_sql(cte, self.query.table_schemas, table_schemas).replace(
+                    SCHEMA_TAG, schema_literal(table_schemas.get(db_table))
+                ) for cte in schema_ctes
+            )
+            counts.append(' + '.join('(SELECT COUNT(*) FROM %s)' % alias for alias in aliases))
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db, savepoint=False):
+            with tag_statement(connection, kind, across_table_schemas), connection.cursor() as cursor:
+                cursor.execute(
+                    'WITH %s SELECT %s' % (', '.join(ctes), ', '.join(counts)),
+                    tuple(params) * len(across_table_schemas),
+                )
+                counts = cursor.fetchone()
+            invalidate_tables(connection, [
+                (table_schemas.get(table), table) for table_schemas in across_table_schemas for table in tables
+            ])
+        evict_schemas(across_table_schemas)
+        self._result_cache = None
+        return sum(counts), dict(zip(schemas, counts))
+
+    def update(self, **kwargs):
+        """
+        Updates all elements in the current QuerySet, setting all the given
+        fields to the appropriate values.
+
+        After across_schemas(), the elements of each table schemas mapping are
+        updated by a single statement per database which returns the total
+        number of updated rows and a dict of the number of updated rows per
+        schema.
+        """
+        if self._is_across_schemas():
+            return (
+                self._across_databases_writes('_update_across_schemas', kwargs) or
+                self._update_across_schemas(kwargs)
+            )
+        self._not_support_across_schemas('update')
+        rows = super(SchemaQuerySet, self).update(**kwargs)
+        evict_schemas(self.query.get_table_schemas_list())
+        return rows
+    update.alters_data = True
+
+    def _update_across_schemas(self, values):
+        assert self.query.can_filter(), \
+            "Cannot update a query once a slice has been taken."
+        self._for_write = True
+        source = self._without_schema_tag()
+        if django.VERSION >= (2, 0):
+            query = source.query.chain(sql.UpdateQuery)
+        else:
+            query = source.query.clone(sql.UpdateQuery)
+        query.add_update_values(values)
+        if query.related_updates:
+            raise TypeError("Cannot update fields of a parent model across schemas.")
+        # Clear any annotations so that they won't be present in subqueries.
+        query._annotations = None
+        try:
+            update_sql, params = query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            update_sql = None
+        if not update_sql:
+            return self._across_schemas_writes('update', None, ())
+        quote_name = connections[self.db].ops.quote_name
+
+        def ctes_for(prefix):
+            alias = quote_name(prefix + 'u')
+            return ['%s AS (%s RETURNING 1)' % (alias, update_sql)], [alias]
+        return self._across_schemas_writes('update', ctes_for, params, [self.model._meta.db_table])
+
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Inserts each of the instances into the database in batches of multi-row
+        INSERT and sets their table schemas.
+        """
+        self._not_support_across_schemas('bulk_create')
+        objs = super(SchemaQuerySet, self).bulk_create(objs, batch_size=batch_size)
+        for obj in objs:
+            obj._state.table_schemas = self._table_schemas
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        """
+        Updates the given fields of each of the instances in their own table
+        schemas mapping through batches of UPDATE ... FROM (VALUES ...) and
+        returns the number of updated rows, summed over the tables of
+        multi-table inherited models.
+
+        Instances are grouped by table schemas mapping so that instances of
+        many schemas only take a few statements. No signals are sent.
+        """
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError('Batch size must be a positive integer.')
+        if not fields:
+            raise ValueError('Field names must be given to bulk_update().')
+        objs = tuple(objs)
+        if any(obj.pk is None for obj in objs):
+            raise ValueError('All bulk_update() objects must have a primary key set.')
+        opts = self.model._meta
+        fields = [opts.get_field(name) for name in fields]
+        if any(not field.concrete or field.many_to_many for field in fields):
+            raise ValueError('bulk_update() can only be used with concrete fields.')
+        if any(field.primary_key for field in fields):
+            raise ValueError('bulk_update() cannot be used with primary key fields.')
+        if not objs:
+            return 0
+        # Fields of multi-table inherited parents are updated in their table.
+        model_fields = OrderedDict()
+        for field in fields:
+            model_fields.setdefault(field.model._meta.concrete_model, []).append(field)
+        groups = OrderedDict()
+        for obj in objs:
+            table_schemas = getattr(obj._state, 'table_schemas', None) or self._table_schemas
+            groups.setdefault(frozenset(table_schemas.items()), (table_schemas, []))[1].append(obj)
+        table_schemas_list = [table_schemas for table_schemas, _ in groups.values()]
+        self._for_write = True
+        if self._db is not None:
+            databases = {self._db: table_schemas_list}
+        else:
+            databases = group_by_database(self.model, table_schemas_list, for_write=True)
+        rows = 0
+        for db, db_table_schemas_list in databases.items():
+            connection = connections[db]
+            max_batch_size = connection.ops.bulk_batch_size(['pk', 'pk'] + fields, objs)
+            db_batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+            with transaction.atomic(using=db, savepoint=False):
+                for table_schemas in db_table_schemas_list:
+                    group_objs = groups[frozenset(table_schemas.items())][1]
+                    with tag_statement(connection, 'update', [table_schemas]), connection.cursor() as cursor:
+                        for model, update_fields in model_fields.items():
+                            for start in range(0, len(group_objs), db_batch_size):
+                                sql, params = self._bulk_update_sql(
+                                    connection, table_schemas, model, update_fields,
+                                    group_objs[start:start + db_batch_size],
+                                )
+                                cursor.execute(sql, params)
+                                rows += cursor.rowcount
+                    invalidate_tables(connection, [
+                        (table_schemas.get(model._meta.db_table), model._meta.db_table) for model in model_fields
+                    ])
+        evict_schemas(table_schemas_list)
+        return rows
+    bulk_update.alters_data = True
+
+    def _bulk_update_sql(self, connection, table_schemas, model, fields, objs):
+        quote_name = connection.ops.quote_name
+        opts = model._meta
+        schema = table_schemas.get(opts.db_table)
+        table = qualified_table_name(schema, opts.db_table) if schema else quote_name(opts.db_table)
+        columns = [opts.pk] + fields
+        rows = []
+        params = []
+        for index, obj in enumerate(objs):
+            if index == 0:
+                # The types of the VALUES columns are inferred from the first row.
+                placeholders = ['%%s::%s' % field.rel_db_type(connection) for field in columns]
+            else:
+                placeholders = ['%s'] * len(columns)
+            rows.append('(%s)' % ', '.join(placeholders))
+            params.append(opts.pk.get_db_prep_value(getattr(obj, opts.pk.attname), connection))
+            params.extend(field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields)
+        sql = 'UPDATE %s SET %s FROM (VALUES %s) AS "v" (%s) WHERE %s.%s = "v".%s' % (
+            table,
+            ', '.join('%s = "v".%s' % (quote_name(field.column), quote_name(field.column)) for field in fields),
+            ', '.join(rows),
+            ', '.join(quote_name(field.column) for field in columns),
+            table, quote_name(opts.pk.column), quote_name(opts.pk.column),
+        )
+        return sql, params
+
+    def upsert(self, defaults=None, **kwargs):
+        """
+        Inserts an object with the given kwargs and defaults or updates the
+        existing one with the given kwargs with defaults through a single
+        INSERT ... ON CONFLICT DO UPDATE statement. Returns a tuple of (object,
+        created), where created is a boolean specifying whether an object was
+        created.
+
+        The fields of kwargs must be covered by a unique constraint of the
+        table. Without defaults the existing object is left untouched through
+        ON CONFLICT DO NOTHING and retrieved by a second query, like
+        get_or_create() would.
+        """
+        self._not_support_across_schemas('upsert')
+        defaults = defaults or {}
+        if not kwargs:
+            raise ValueError('Conflict fields must be given to upsert().')
+        self._for_write = True
+        opts = self.model._meta
+        obj = self.model(**dict(kwargs, **defaults))
+        conflict_fields = [opts.pk if name == 'pk' else opts.get_field(name) for name in kwargs]
+        update_fields = [opts.get_field(name) for name in defaults]
+        rows = self._upsert([obj], self._upsert_fields(obj.pk is None), conflict_fields, update_fields)
+        if not rows:
+            # DO NOTHING doesn't return the conflicting row.
+            return self.get(**kwargs), False
+        (values, created), = rows
+        self._set_upserted(obj, values)
+        return obj, created
+    upsert.alters_data = True
+
+    def bulk_upsert(self, objs, conflict_fields, update_fields=None, batch_size=None):
+        """
+        Inserts each of the instances or, when they conflict with an existing
+        row on conflict_fields, updates the existing row with their
+        update_fields, in batches of INSERT ... ON CONFLICT statements. Returns
+        the list of instances with their primary key and table schemas set.
+
+        Without update_fields conflicting instances are skipped through ON
+        CONFLICT DO NOTHING and their primary key is left unset.
+        """
+        self._not_support_across_schemas('bulk_upsert')
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError('Batch size must be a positive integer.')
+        if not conflict_fields:
+            raise ValueError('Conflict fields must be given to bulk_upsert().')
+        objs = list(objs)
+        if not objs:
+            return objs
+        self._for_write = True
+        connection = connections[self.db]
+        opts = self.model._meta
+        conflict_fields = [opts.pk if name == 'pk' else opts.get_field(name) for name in conflict_fields]
+        update_fields = [opts.get_field(name) for name in update_fields or ()]
+        with transaction.atomic(using=self.db, savepoint=False):
+            for has_pk in (False, True):
+                group = [obj for obj in objs if (obj.pk is not None) is has_pk]
+                if not group:
+                    continue
+                fields = self._upsert_fields(not has_pk)
+                group_batch_size = min(batch_size or len(group), connection.ops.bulk_batch_size(fields, group))
+                for start in range(0, len(group), group_batch_size):
+                    batch = group[start:start + group_batch_size]
+                    rows = self._upsert(batch, fields, conflict_fields, update_fields)
+                    upserted = {
+                        tuple(field.to_python(values[field.attname]) for field in conflict_fields): values
+                        for values, _ in rows
+                    }
+                    for obj in batch:
+                        values = upserted.get(tuple(
+                            field.to_python(getattr(obj, field.attname)) for field in conflict_fields
+                        ))
+                        if values is not None:
+                            self._set_upserted(obj, values)
+        return objs
+    bulk_upsert.alters_data = True
+
+    def _upsert_fields(self, exclude_auto_field):
+        opts = self.model._meta
+        for parent in opts.get_parent_list():
+            if parent._meta.concrete_model is not opts.concrete_model:
+                raise ValueError("Can't upsert into a multi-table inherited model")
+        if exclude_auto_field:
+            return [field for field in opts.concrete_fields if not isinstance(field, models.AutoField)]
+        return opts.concrete_fields
+
+    def _upsert(self, objs, fields, conflict_fields, update_fields):
+        """
+        Inserts objs through INSERT ... ON CONFLICT, updating update_fields of
+        the rows conflicting on conflict_fields or skipping them if there are
+        none. Returns a list of (values, inserted) of the returned rows where
+        values maps the attnames of the model's fields to their value.
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        query = self.insert_query_class(self.model)
+        query.insert_values(fields, objs)
+        compiler = query.get_compiler(using=self.db)
+        compiler.return_id = False
+        (sql, params), = compiler.as_sql()
+        if update_fields:
+            action = 'DO UPDATE SET %s' % ', '.join(
+                '%s = EXCLUDED.%s' % (quote_name(field.column), quote_name(field.column)) for field in update_fields
+            )
+        else:
+            action = 'DO NOTHING'
+        returned_fields = opts.concrete_fields
+        sql = '%s ON CONFLICT (%s) %s RETURNING %s, (xmax = 0)' % (
+            sql,
+            ', '.join(quote_name(field.column) for field in conflict_fields),
+            action,
+            ', '.join(quote_name(field.column) for field in returned_fields),
+        )
+        with transaction.atomic(using=self.db, savepoint=False):
+            search_path = self.query.get_search_path()
+            if search_path is not None:
+                set_search_path(connection, search_path)
+            with tag_statement(connection, 'insert', [self._table_schemas]), connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            invalidate_tables(connection, [(self._table_schemas.get(opts.db_table), opts.db_table)])
+        if update_fields:
+            evict_schemas([self._table_schemas])
+        upserted = []
+        for row in rows:
+            values = {}
+            for field, value in zip(returned_fields, row):
+                for converter in field.get_db_converters(connection):
+                    value = converter(value, field, connection, {})
+                values[field.attname] = value
+            upserted.append((values, row[-1]))
+        return upserted
+
+    def _set_upserted(self, obj, values):
+        for attname, value in values.items():
+            setattr(obj, attname, value)
+        obj._state.adding = False
+        obj._state.db = self.db
+        obj._state.table_schemas = self._table_schemas
+
+    def copy_from(self, objs, fields=None):
+        """
+        Streams the instances yielded by objs into the database through
+        COPY ... FROM STDIN and returns the number of inserted rows.
+
+        Instances are consumed lazily, no signals are sent and their primary
+        key is not set. Auto-incremented primary keys are only copied when
+        explicitly specified in fields.
+        """
+        self._not_support_across_schemas('copy_from')
+        opts = self.model._meta
+        for parent in opts.get_parent_list():
+            if parent._meta.concrete_model is not opts.concrete_model:
+                raise ValueError("Can't copy into a multi-table inherited model")
+        if fields is None:
+            fields = [field for field in opts.concrete_fields if not isinstance(field, models.AutoField)]
+        else:
+            fields = [opts.get_field(field) for field in fields]
+        if not fields:
+            raise ValueError("Can't copy into %s without fields to copy" % opts.label)
+        self._for_write = True
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        sql = 'COPY %s (%s) FROM STDIN' % (
+            quote_name(self.query.get_meta().db_table),
+            ', '.join(quote_name(field.column) for field in fields),
+        )
+
+        def lines():
+            for obj in objs:
+                yield '\t'.join(
+                    copy_text(field.get_db_prep_save(field.pre_save(obj, True), connection=connection), field)
+                    for field in fields
+                ) + '\n'
+
+        copied = self._copy_expert('insert', sql, None, IterableReader(lines()))
+        invalidate_tables(connections[self.db], [(self._table_schemas.get(opts.db_table), opts.db_table)])
+        return copied
+    copy_from.alters_data = True
+
+    def copy_to(self, fileobj, format='csv', header=False):
+        """
+        Streams the rows of the QuerySet to fileobj through
+        COPY (SELECT ...) TO STDOUT and returns their number.
+
+        Rows are written as they are received without instantiating models;
+        binary format requires fileobj to accept bytes.
+        """
+        if format not in COPY_FORMATS:
+            raise ValueError("Unsupported COPY format %r, must be one of %s" % (format, ', '.join(COPY_FORMATS)))
+        options = ['FORMAT %s' % format]
+        if header:
+            if format != 'csv':
+                raise ValueError("COPY header is only supported with the csv format")
+            options.append('HEADER')
+        try:
+            sql, params = self.query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return 0
+        return self._copy_expert('select', 'COPY (%s) TO STDOUT (%s)' % (sql, ', '.join(options)), params, fileobj)
+
+    def _copy_expert(self, kind, sql, params, fileobj):
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db, savepoint=False):
+            search_path = self.query.get_search_path()
+            if search_path is not None:
+                set_search_path(connection, search_path)
+            with connection.cursor() as cursor:
+                if params:
+                    # COPY doesn't support parameters.
+                    sql = cursor.mogrify(sql, params).decode(encodings[connection.connection.encoding])
+                start = default_timer()
+                cursor.copy_expert(sql, fileobj)
+                if is_instrumented(connection):
+                    # COPY doesn't go through the execute wrappers.
+                    schemas = schemas_of(self.query.get_table_schemas_list())
+                    record_statement(connection, SchemaStatement(
+                        kind, schemas, default_timer() - start, cursor.rowcount, sql,
+                    ))
+                return cursor.rowcount
+
     @property
     def insert_query_class(self):
-        return partial(SchemaInsertQuery, table_schemas=self.query.table_schemas)
+        return partial(
+            SchemaInsertQuery, table_schemas=self.query.table_schemas, search_path=self.query.search_path,
+        )
 
     def _insert(self, objs, fields, return_id=False, raw=False, using=None):
         """
@@ -73,12 +908,18 @@ class SchemaQuerySet(models.QuerySet):
 
     @property
     def delete_query_class(self):
-        return partial(SchemaDeleteQuery, table_schemas=self.query.table_schemas)
+        return partial(
+            SchemaDeleteQuery, table_schemas=self.query.table_schemas, search_path=self.query.search_path,
+        )
 
     @property
     def deletion_collector_class(self):
         return partial(Collector, table_schemas=self._table_schemas)
 
+    @property
+    def set_deletion_collector_class(self):
+        return partial(SetCollector, table_schemas=self._table_schemas)
+
     def delete(self):
         """
         Deletes the records in the current QuerySet.
@@ -91,6 +932,9 @@ class SchemaQuerySet(models.QuerySet):
 
         if self._fields is not None:
             raise TypeError("Cannot call delete() after .values() or .values_list()")
+        if self._is_across_schemas():
+            return self._across_databases_writes('_delete_across_schemas') or self._delete_across_schemas()
+        self._not_support_across_schemas('delete')
 
         del_query = self._clone()
 
@@ -104,9 +948,17 @@ class SchemaQuerySet(models.QuerySet):
         del_query.query.select_related = False
         del_query.query.clear_ordering(force_empty=True)
 
-        collector = self.deletion_collector_class(using=del_query.db)
-        collector.collect(del_query)
+        # Cascade the deletion as a set unless signal receivers or on_delete
+        # handlers require the instances to be loaded.
+        collector = self.set_deletion_collector_class(using=del_query.db)
+        if not collector.collect(del_query):
+            collector = self.deletion_collector_class(using=del_query.db)
+            collector.collect(del_query)
         deleted, _rows_count = collector.delete()
+        if not _rows_count:
+            # Match the count of empty set deletions.
+            _rows_count = {self.model._meta.label: 0}
+        evict_schemas(self.query.get_table_schemas_list())
 
         # Clear the result cache, in case this QuerySet gets reused.
         self._result_cache = None
@@ -114,6 +966,98 @@ class SchemaQuerySet(models.QuerySet):
     delete.alters_data = True
     delete.queryset_only = True
 
+    def _delete_across_schemas(self):
+        del_query = self._without_schema_tag()
+        del_query._for_write = True
+        del_query.query.select_for_update = False
+        del_query.query.select_related = False
+        del_query.query.clear_ordering(force_empty=True)
+
+        collector = self.set_deletion_collector_class(using=del_query.db)
+        if collector.collect(del_query):
+            try:
+                root_sql, params = collector.as_root_sql()
+            except EmptyResultSet:
+                return self._across_schemas_writes('delete', None, ())
+
+            def ctes_for(prefix):
+                ctes, deletes = collector.as_ctes(root_sql, prefix)
+                return ctes, [alias for alias, _ in deletes]
+            tables = {node.model._meta.db_table for node in collector.nodes}
+            return self._across_schemas_writes('delete', ctes_for, params, tables)
+
+        # Signal receivers require the instances of each schema to be loaded.
+        db_table = self.model._meta.db_table
+        deleted_counter = {}
+        with transaction.atomic(using=del_query.db, savepoint=False):
+            for table_schemas in self.query.across_table_schemas:
+                # Collecting the retargeted queryset itself could fast delete
+                # it against the mapping it was built with.
+                objs = list(del_query.retarget(table_schemas))
+                deleted = 0
+                if objs:
+                    collector = Collector(using=del_query.db, table_schemas=table_schemas)
+                    collector.collect(objs)
+                    deleted, _ = collector.delete()
+                deleted_counter[table_schemas.get(db_table)] = deleted
+        evict_schemas(self.query.across_table_schemas)
+        self._result_cache = None
+        return sum(deleted_counter.values()), deleted_counter
+
+    def copy_to_schema(self, target_table_schemas, related=False):
+        """
+        Copies the records in the current QuerySet to the same tables of
+        target_table_schemas through a single INSERT ... SELECT statement and
+        returns the total number of copied records and a dict of the number of
+        copied records per model.
+
+        When related is True the records a deletion of the current QuerySet
+        would cascade to are copied as well. Records keep their primary key.
+        """
+        return self._copy_to_schema('copy_to_schema', target_table_schemas, related, move=False)
+    copy_to_schema.alters_data = True
+
+    def move_to(self, target_table_schemas, related=False):
+        """
+        Moves the records in the current QuerySet to the same tables of
+        target_table_schemas through a single statement deleting them and
+        inserting the deleted rows, and returns the total number of moved
+        records and a dict of the number of moved records per model.
+
+        The nullable relations to the moved records are set to NULL like a
+        deletion would. When related is True the records a deletion of the
+        current QuerySet would cascade to are moved as well, otherwise nothing
+        is moved and ValueError is raised if such records exist. Records keep
+        their primary key and pre_delete and post_delete receivers aren't
+        called.
+        """
+        return self._copy_to_schema('move_to', target_table_schemas, related, move=True)
+    move_to.alters_data = True
+
+    def _copy_to_schema(self, operation_name, target_table_schemas, related, move):
+        assert self.query.can_filter(), \
+            "Cannot use 'limit' or 'offset' with %s." % operation_name
+        if self._fields is not None:
+            raise TypeError("Cannot call %s() after .values() or .values_list()" % operation_name)
+        self._not_support_across_schemas(operation_name)
+        query = self._clone()
+        query._for_write = True
+        query.query.select_for_update = False
+        query.query.select_related = False
+        query.query.clear_ordering(force_empty=True)
+        using = query.db
+        if self._db is None and router.db_for_write(self.model, table_schemas=target_table_schemas) != using:
+            raise ValueError("Cannot call %s() with table schemas of another database." % operation_name)
+        collector = SetCopier(
+            using=using, table_schemas=self._table_schemas, target_table_schemas=target_table_schemas,
+            related=related, move=move,
+        )
+        collector.collect(query)
+        copied = collector.copy()
+        evict_schemas([target_table_schemas, self._table_schemas] if move else [target_table_schemas])
+        self._result_cache = None
+        return copied
+
     def _raw_delete(self, using):
         """
         Deletes objects found from the given queryset in single direct SQL
@@ -0,0 +1,205 @@
+from __future__ import unicode_literals
+
+import threading
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .datastructures import freeze_table_schemas
+
+# Tables, partitioned tables, views, materialized views and foreign tables.
+RELATION_KINDS = ('r', 'p', 'v', 'm', 'f')
+
+CATALOG_SQL = """
+SELECT n.nspname, c.relname
+FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN %s AND c.relname = ANY(%s)
+AND n.nspname <> 'information_schema' AND n.nspname NOT LIKE 'pg\\_%%'
+"""
+
+
+def schema_models():
+    """
+    Return the concrete SchemaModel subclasses of the installed apps.
+    """
+    from .models import SchemaModel
+    return [
+        model for model in apps.get_models()
+        if issubclass(model, SchemaModel) and not model._meta.proxy
+    ]
+
+
+def related_models(models):
+    """
+    Return the models a set of schema models relies on: themselves, their
+    parents, their many-to-many through models and the schema models they are
+    related to.
+    """
+    from .models import SchemaModel
+    seen = set()
+    pending = [model._meta.concrete_model for model in models]
+    while pending:
+        model = pending.pop()
+        if model in seen:
+            continue
+        seen.add(model)
+        opts = model._meta
+        pending.extend(opts.get_parent_list())
+        for field in opts.get_fields(include_hidden=True):
+            if field.many_to_many and not field.auto_created:
+                pending.append(field.remote_field.through)
+            related_model = field.related_model
+            if isinstance(related_model, type) and issubclass(related_model, SchemaModel):
+                pending.append(related_model._meta.concrete_model)
+    return seen
+
+
+def model_tables(models):
+    """
+    Return the tables a set of schema models relies on.
+    """
+    return {model._meta.db_table for model in related_models(models)}
+
+
+class SchemaRegistry(object):
+    """
+    Registry of the schemas holding all the tables a set of schema models
+    relies on, discovered from the catalog through a single query.
+
+    The table schemas mapping of each discovered schema is computed once and
+    shared; call invalidate() once schemas are created, altered or dropped.
+    """
+
+    def __init__(self, models=None, using=DEFAULT_DB_ALIAS):
+        self._models = models
+        self.using = using
+        self.lock = threading.Lock()
+        self._related_models = None
+        self._tables = None
+        self._table_schemas = None
+        self._missing_tables = None
+
+    @property
+    def models(self):
+        if self._related_models is None:
+            self._related_models = frozenset(
+                related_models(schema_models() if self._models is None else self._models)
+            )
+        return self._related_models
+
+    @property
+    def tables(self):
+        if self._tables is None:
+            self._tables = frozenset(model._meta.db_table for model in self.models)
+        return self._tables
+
+    def discover(self, schemas=None):
+        """
+        Discover the schemas holding the registry's tables, or only the ones
+        of schemas when specified.
+        """
+        if self._table_schemas is None:
+            schemas = None
+        tables = sorted(self.tables)
+        sql = CATALOG_SQL
+        params = [RELATION_KINDS, tables]
+        if schemas is not None:
+            sql += 'AND n.nspname = ANY(%s)'
+            params.append(list(schemas))
+        found = {}
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            for schema, table in cursor.fetchall():
+                found.setdefault(schema, set()).add(table)
+        with self.lock:
+            if schemas is None:
+                self._table_schemas = {}
+                self._missing_tables = {}
+            for schema in (found if schemas is None else schemas):
+                self._table_schemas.pop(schema, None)
+                self._missing_tables.pop(schema, None)
+                missing = self.tables.difference(found.get(schema, ()))
+                if not missing:
+                    self._table_schemas[schema] = freeze_table_schemas(dict.fromkeys(tables, schema))
+                elif schema in found:
+                    self._missing_tables[schema] = frozenset(missing)
+
+    def _ensure_discovered(self):
+        if self._table_schemas is None:
+            self.discover()
+
+    def invalidate(self, schema=None):
+        """
+        Invalidate the discovered schema, or all of them, so they are
+        discovered again on next access.
+        """
+        if schema is None:
+            with self.lock:
+                self._table_schemas = self._missing_tables = None
+        elif self._table_schemas is not None:
+            self.discover([schema])
+
+    @property
+    def schemas(self):
+        """
+        Return the sorted names of the schemas holding all the tables.
+        """
+        self._ensure_discovered()
+        return sorted(self._table_schemas)
+
+    @property
+    def missing_tables(self):
+        """
+        Return the tables missing from the schemas holding only some of them.
+        """
+        self._ensure_discovered()
+        return dict(self._missing_tables)
+
+    def __contains__(self, schema):
+        self._ensure_discovered()
+        return schema in self._table_schemas
+
+    def table_schemas(self, schema):
+        """
+        Return the table schemas mapping of schema.
+        """
+        self._ensure_discovered()
+        try:
+            return self._table_schemas[schema]
+        except KeyError:
+            missing = self._missing_tables.get(schema)
+            if missing:
+                raise LookupError(
+                    "Schema %r is missing tables %s." % (schema, ', '.join(sorted(missing)))
+                )
+            raise LookupError("Schema %r isn't registered." % schema)
+
+    def table_schemas_list(self, schemas=None):
+        """
+        Return the table schemas mappings of schemas or of all the discovered
+        ones, e.g. to be passed to across_schemas().
+        """
+        if schemas is None:
+            schemas = self.schemas
+        return [self.table_schemas(schema) for schema in schemas]
+
+    def queryset(self, model, schema):
+        """
+        Return a queryset of model against schema.
+        """
+        return model._base_manager.get_queryset(table_schemas=self.table_schemas(schema))
+
+
+_default_registries = {}
+
+
+def default_registry(using=DEFAULT_DB_ALIAS):
+    """
+    Return the in-process registry of the installed apps' schema models in the
+    using database, kept up to date by provisioning unless specified.
+    """
+    registry = _default_registries.get(using)
+    if registry is None:
+        registry = _default_registries.setdefault(using, SchemaRegistry(using=using))
+    return registry
@@ -0,0 +1,60 @@
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+
+
+def hinted_table_schemas(model, hints):
+    """
+    Return the table schemas mappings of the hints provided to routers by
+    schema querysets and instances.
+    """
+    table_schemas_list = hints.get('table_schemas_list')
+    if table_schemas_list is not None:
+        return table_schemas_list
+    table_schemas = hints.get('table_schemas')
+    if table_schemas is None:
+        instance = hints.get('instance')
+        table_schemas = getattr(getattr(instance, '_state', None), 'table_schemas', None)
+    return (table_schemas,) if table_schemas else ()
+
+
+def group_by_database(model, table_schemas_list, for_write=False):
+    """
+    Return an ordered dict of the table schemas mappings of table_schemas_list
+    keyed by the database routers pick for each of them.
+    """
+    db_for = router.db_for_write if for_write else router.db_for_read
+    groups = OrderedDict()
+    for table_schemas in table_schemas_list:
+        groups.setdefault(db_for(model, table_schemas=table_schemas), []).append(table_schemas)
+    return groups
+
+
+class SchemaRouter(object):
+    """
+    Database router sending the queries of schema models to the database
+    holding the schema of their table according to the SCHEMA_DATABASES
+    setting mapping schemas to database aliases.
+
+    Queries spanning many schemas are only routed when all of them live in
+    the same database; cross-schema querysets evaluate each group of schemas
+    against its own database.
+    """
+
+    def database_for_schema(self, schema):
+        return getattr(settings, 'SCHEMA_DATABASES', {}).get(schema)
+
+    def db_for_model(self, model, **hints):
+        db_table = model._meta.db_table
+        databases = {
+            self.database_for_schema(table_schemas.get(db_table))
+            for table_schemas in hinted_table_schemas(model, hints)
+        }
+        if len(databases) == 1:
+            return databases.pop()
+        return None
+
+    db_for_read = db_for_write = db_for_model
@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+
+
+def search_path_for(table_schemas):
+    """
+    Return the search path resolving the tables of table_schemas to their
+    schema while preserving access to the public one.
+    """
+    schemas = set(table_schemas.values())
+    # A table mapped to a schema would resolve to any other schema of the
+    # search path containing a table of the same name.
+    if len(schemas) > 1:
+        raise ValueError(
+            'Cannot resolve tables through a search path spanning multiple schemas: %s.'
+            % ', '.join(sorted(schemas))
+        )
+    return tuple(schemas) + ('public',)
+
+
+def set_search_path(connection, search_path):
+    """
+    Set the search path of the current transaction unless it was already set
+    to search_path.
+    """
+    # The list of commit hooks is replaced by a new one on commit and rollback
+    # which makes it a cheap way of identifying the current transaction.
+    current_transaction = connection.run_on_commit
+    state = getattr(connection, 'schema_search_path', None)
+    if state is not None and state[0] == search_path and state[1] is current_transaction:
+        return
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL search_path TO %s' % ', '.join(quote_name(schema) for schema in search_path))
+    connection.schema_search_path = (search_path, current_transaction)
@@ -0,0 +1,24 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                'CREATE SCHEMA other',
+                'CREATE TABLE other.foo (id serial PRIMARY KEY)',
+                'CREATE TABLE other.foosubclass (foo_ptr_id integer PRIMARY KEY)',
+                'CREATE TABLE other.bar (id serial PRIMARY KEY, foo_id integer NULL)',
+                'CREATE TABLE other.bar_foos ('
+                'id serial PRIMARY KEY, bar_id integer NOT NULL, foo_id integer NOT NULL, UNIQUE (bar_id, foo_id))',
+            ],
+            ['DROP SCHEMA other CASCADE'],
+        ),
+    ]
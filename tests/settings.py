@@ -8,7 +8,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'schema_query',
-    }
+    },
+    # Holds a copy of the schemas of the default database to test routing.
+    'shard': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': 'schema_query_shard',
+    },
 }
 
 INSTALLED_APPS = [
@@ -1,13 +1,46 @@
 from __future__ import unicode_literals
 
-from unittest import expectedFailure
+import io
+import json
+import pickle
+import threading
+from itertools import islice
+from operator import itemgetter, methodcaller
+from unittest import expectedFailure, skipIf
 
 import django
-from django.db.models import F
+from django.contrib.postgres.fields import ArrayField
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import (
+    DEFAULT_DB_ALIAS, connection, connections, models, transaction,
+)
+from django.db.models import F, Prefetch, signals
 from django.db.models.aggregates import Count
-from django.test.testcases import TestCase
+from django.test.testcases import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 
+from schema_query.cache import LRUCache, ResultCache
+from schema_query.compiler import template_cache
+from schema_query.deletion import SetCollector
+from schema_query.executor import SchemaExecutionError, execute_across_schemas
+from schema_query.explain import (
+    ExplainSampler, explain_slow_queries, fingerprint,
+)
+from schema_query.identity import (
+    IdentityMapDescriptorMixin, IdentityMapMiddleware, current_identity_map,
+    identity_map,
+)
+from schema_query.instrumentation import (
+    SchemaStats, install, instrument, is_instrumented,
+)
+from schema_query.pgcopy import copy_text
+from schema_query.prepared import PreparedStatements, placeholders_sql
+from schema_query.provisioning import (
+    ProvisioningError, claim_schema, provision_schemas, warm_pool,
+)
 from schema_query.queryset import SchemaQuerySet
+from schema_query.registry import SchemaRegistry, default_registry
 
 from .models import (
     Bar, Foo, FooSubclass, UnmanagedBar, UnmanagedFoo, UnmanagedFooSubclass,
@@ -53,6 +86,19 @@ class SchemaQuerySetTests(TestCase):
             self.foo_subclass.pk
         )
 
+    def test_get_meta(self):
+        opts = self.queryset.query.get_meta()
+        self.assertIs(opts, self.queryset.query.get_meta())
+        self.assertEqual(opts.db_table, '"schema"."foo"')
+        self.assertEqual(opts.pk, UnmanagedFoo._meta.pk)
+        # Cached properties are copied again once expired.
+        fields = opts.fields
+        UnmanagedFoo._meta._expire_cache()
+        self.assertIs(self.queryset.query.get_meta(), opts)
+        self.assertIsNot(opts.fields, fields)
+        self.assertEqual(opts.fields, UnmanagedFoo._meta.fields)
+        self.assertEqual(opts.db_table, '"schema"."foo"')
+
     def test_aggregate(self):
         self.assertEqual(self.queryset.count(), 2)
         self.assertEqual(self.queryset[0:1].count(), 1)
@@ -139,3 +185,1941 @@ class SchemaModelTests(TestCase):
     def test_reverse_m2m_access(self):
         foo = self.foo_queryset.get()
         self.assertEqual(foo.m2m_bars.get().pk, self.bar.pk)
+
+
+class TableSchemasMixin(object):
+    """
+    Map the tables of the unmanaged models to the 'schema' and 'other' schemas.
+    """
+    table_schemas = {
+        UnmanagedFoo._meta.db_table: 'schema',
+        UnmanagedBar._meta.db_table: 'schema',
+        UnmanagedBar.foos.through._meta.db_table: 'schema',
+        UnmanagedFooSubclass._meta.db_table: 'schema',
+    }
+    other_table_schemas = {
+        UnmanagedFoo._meta.db_table: 'other',
+        UnmanagedBar._meta.db_table: 'other',
+        UnmanagedBar.foos.through._meta.db_table: 'other',
+        UnmanagedFooSubclass._meta.db_table: 'other',
+    }
+
+    @classmethod
+    def table_schemas_list(cls):
+        return [cls.table_schemas, cls.other_table_schemas]
+
+    @classmethod
+    def querysets(cls, model):
+        """
+        Return a queryset of model in each of the two schemas.
+        """
+        return tuple(
+            SchemaQuerySet(model, table_schemas=table_schemas) for table_schemas in cls.table_schemas_list()
+        )
+
+
+class AcrossSchemasTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        foos, other_foos = cls.querysets(UnmanagedFoo)
+        cls.foo = foos.create()
+        cls.other_foos = [other_foos.create() for _ in range(2)]
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(
+            UnmanagedFoo,
+            table_schemas=self.table_schemas,
+        ).across_schemas(self.table_schemas_list())
+
+    def test_select(self):
+        with self.assertNumQueries(1):
+            foos = list(self.queryset.order_by('pk'))
+        self.assertEqual(
+            [(foo.pk, foo.schema) for foo in foos],
+            [(self.foo.pk, 'schema')] + [(foo.pk, 'other') for foo in self.other_foos],
+        )
+        self.assertEqual(foos[0]._state.table_schemas, self.table_schemas)
+        self.assertEqual(foos[1]._state.table_schemas, self.other_table_schemas)
+
+    def test_values(self):
+        self.assertEqual(
+            sorted(self.queryset.values_list('schema', flat=True)),
+            ['other', 'other', 'schema'],
+        )
+        # Rows of the UNION ALL aren't ordered and primary keys are only
+        # unique per schema.
+        self.assertEqual(
+            sorted(self.queryset.values('pk', 'schema'), key=itemgetter('schema', 'pk')),
+            [{'pk': foo.pk, 'schema': 'other'} for foo in sorted(self.other_foos, key=lambda foo: foo.pk)] +
+            [{'pk': self.foo.pk, 'schema': 'schema'}],
+        )
+        self.assertEqual(
+            list(self.queryset.filter(schema='schema').values('pk', 'schema')),
+            [{'pk': self.foo.pk, 'schema': 'schema'}],
+        )
+
+    def test_join(self):
+        bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).create(foo=self.other_foos[0])
+        self.assertEqual(
+            list(self.queryset.filter(bars=bar).values_list('pk', 'schema')),
+            [(self.other_foos[0].pk, 'other')],
+        )
+
+    def test_aggregate(self):
+        self.assertEqual(self.queryset.count(), 3)
+        self.assertEqual(self.queryset.aggregate(Count('pk')), {'pk__count': 3})
+
+    def test_related_access(self):
+        foo = self.queryset.get(schema='other', pk=self.other_foos[0].pk)
+        SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).create(foo=foo)
+        self.assertEqual(foo.bars.count(), 1)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(list(self.queryset.across_schemas([])), [])
+
+    def test_distinct_schemas(self):
+        with self.assertRaisesMessage(ValueError, 'must target a distinct schema'):
+            self.queryset.across_schemas([self.table_schemas, self.table_schemas])
+
+    def test_update(self):
+        # Primary keys are only unique per schema.
+        other_pks = [foo.pk for foo in self.other_foos]
+        with self.assertNumQueries(1):
+            updated = self.queryset.filter(pk=self.foo.pk).update(id=F('id') + 100)
+        self.assertEqual(updated, (1 + other_pks.count(self.foo.pk), {
+            'schema': 1, 'other': other_pks.count(self.foo.pk),
+        }))
+        self.assertEqual(self.queryset.filter(schema='schema').get().pk, self.foo.pk + 100)
+        self.assertEqual(self.queryset.filter(pk__in=[]).update(id=0), (0, {'schema': 0, 'other': 0}))
+        self.assertEqual(
+            self.queryset.filter(schema='other').update(id=F('id') + 100), (2, {'schema': 0, 'other': 2}),
+        )
+
+    def test_delete(self):
+        other_pks = [foo.pk for foo in self.other_foos]
+        with self.assertNumQueries(1):
+            deleted = self.queryset.filter(pk__in=other_pks).delete()
+        self.assertEqual(deleted, (2 + other_pks.count(self.foo.pk), {
+            'schema': other_pks.count(self.foo.pk), 'other': 2,
+        }))
+        self.assertFalse(self.queryset.filter(schema='other').exists())
+        self.assertEqual(self.queryset.filter(pk__in=[]).delete(), (0, {'schema': 0, 'other': 0}))
+
+    def test_delete_schema(self):
+        self.assertEqual(self.queryset.filter(schema='schema').delete(), (1, {'schema': 1, 'other': 0}))
+        self.assertEqual(self.queryset.count(), 2)
+
+    def test_delete_signal_receivers(self):
+        deleted_pks = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted_pks.append((instance.pk, instance._state.table_schemas[UnmanagedFoo._meta.db_table]))
+        signals.post_delete.connect(receiver, sender=UnmanagedFoo)
+        try:
+            self.assertEqual(self.queryset.delete(), (3, {'schema': 1, 'other': 2}))
+        finally:
+            signals.post_delete.disconnect(receiver, sender=UnmanagedFoo)
+        self.assertEqual(sorted(deleted_pks), sorted(
+            [(self.foo.pk, 'schema')] + [(foo.pk, 'other') for foo in self.other_foos]
+        ))
+        self.assertFalse(self.queryset.exists())
+
+    def test_retarget_write_unsupported(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).retarget(self.other_table_schemas)
+        with self.assertRaisesMessage(TypeError, 'Cannot call update() after across_schemas() or retarget().'):
+            queryset.update(id=F('id'))
+        with self.assertRaisesMessage(TypeError, 'Cannot call delete() after across_schemas() or retarget().'):
+            queryset.delete()
+
+
+class TemplateCacheTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        foos, other_foos = cls.querysets(UnmanagedFoo)
+        cls.foo = foos.create()
+        # Sequences are per schema; the primary keys must differ.
+        cls.other_foo = other_foos.create(pk=cls.foo.pk + 1)
+
+    def setUp(self):
+        template_cache.clear()
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).filter(
+            pk__in=[self.foo.pk, self.other_foo.pk],
+        ).order_by('pk')
+
+    def test_retarget(self):
+        self.assertEqual([foo.pk for foo in self.queryset.retarget(self.other_table_schemas)], [self.other_foo.pk])
+        self.assertEqual(template_cache.info()['misses'], 1)
+        foos = list(self.queryset.retarget(self.table_schemas))
+        self.assertEqual([foo.pk for foo in foos], [self.foo.pk])
+        self.assertEqual(foos[0]._state.table_schemas, self.table_schemas)
+        self.assertEqual(
+            list(self.queryset.values_list('pk', flat=True).retarget(self.other_table_schemas)),
+            [self.other_foo.pk],
+        )
+        self.assertEqual(template_cache.info()['hits'], 1)
+        self.assertEqual(template_cache.info()['misses'], 2)
+
+    def test_template_key(self):
+        retargeted = self.queryset.retarget(self.other_table_schemas)
+        self.assertIsNotNone(retargeted.query.template_key)
+        self.assertIs(self.queryset.retarget(self.table_schemas).query.template_key, retargeted.query.template_key)
+
+    def test_shape_change(self):
+        list(self.queryset.retarget(self.other_table_schemas))
+        self.assertEqual(list(self.queryset.filter(pk=self.foo.pk).retarget(self.other_table_schemas)), [])
+        self.assertEqual(template_cache.info()['hits'], 0)
+
+    def test_writes(self):
+        other_foo = self.queryset.retarget(self.other_table_schemas).get()
+        list(self.queryset.retarget(self.table_schemas))
+        other_foo.save()
+        other_foo.delete()
+        self.assertFalse(self.queryset.retarget(self.other_table_schemas).exists())
+        self.assertTrue(self.queryset.exists())
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.info(), {'hits': 1, 'misses': 1, 'maxsize': 2, 'currsize': 2})
+
+
+class ExecuteAcrossSchemasTests(TableSchemasMixin, TransactionTestCase):
+    def setUp(self):
+        self.queryset, other_queryset = self.querysets(UnmanagedFoo)
+        self.foo = self.queryset.create()
+        self.other_foos = [other_queryset.create() for _ in range(2)]
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE schema.foo, other.foo')
+
+    def execute(self, operation=list, table_schemas_list=None, **kwargs):
+        if table_schemas_list is None:
+            table_schemas_list = self.table_schemas_list()
+        results = execute_across_schemas(self.queryset, table_schemas_list, operation, **kwargs)
+        return {table_schemas['foo']: result for table_schemas, result in results}
+
+    def test_invalid_max_workers(self):
+        for max_workers in (0, -1):
+            with self.assertRaisesMessage(ValueError, 'max_workers must be greater than 0.'):
+                execute_across_schemas(self.queryset, self.table_schemas_list(), max_workers=max_workers)
+
+    def test_iteration(self):
+        results = self.execute(max_workers=1)
+        self.assertEqual([foo.pk for foo in results['schema']], [self.foo.pk])
+        self.assertEqual(sorted(foo.pk for foo in results['other']), [foo.pk for foo in self.other_foos])
+        self.assertEqual(results['other'][0]._state.table_schemas, self.other_table_schemas)
+
+    def test_count(self):
+        self.assertEqual(self.execute(methodcaller('count')), {'schema': 1, 'other': 2})
+
+    def test_aggregate(self):
+        self.assertEqual(
+            self.execute(methodcaller('aggregate', Count('pk'))),
+            {'schema': {'pk__count': 1}, 'other': {'pk__count': 2}},
+        )
+
+    def test_values(self):
+        self.queryset = self.queryset.filter(pk__in=[self.foo.pk, self.other_foos[0].pk]).values('pk')
+        self.assertEqual(self.execute(), {
+            'schema': [{'pk': self.foo.pk}],
+            'other': [{'pk': self.other_foos[0].pk}],
+        })
+
+    def test_error(self):
+        missing_table_schemas = dict(self.table_schemas, foo='missing')
+        with self.assertRaises(SchemaExecutionError) as ctx:
+            self.execute(table_schemas_list=self.table_schemas_list() + [missing_table_schemas])
+        [(table_schemas, exc)] = ctx.exception.errors
+        self.assertEqual(table_schemas, missing_table_schemas)
+        self.assertIn('missing', str(exc))
+
+
+class SearchPathTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        foos, other_foos = cls.querysets(UnmanagedFoo)
+        cls.foo = foos.create()
+        cls.other_foo = other_foos.create()
+        SchemaQuerySet(UnmanagedBar, table_schemas=cls.other_table_schemas).create(foo=cls.other_foo)
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas, search_path=True)
+
+    def test_select(self):
+        queryset = self.queryset.filter(bars__isnull=False)
+        self.assertNotIn('"other"', str(queryset.query))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual([foo.pk for foo in queryset.all()], [self.other_foo.pk])
+            self.assertEqual(queryset.count(), 1)
+            self.assertTrue(queryset.exists())
+        self.assertEqual(ctx.captured_queries[0]['sql'], 'SET LOCAL search_path TO "other", "public"')
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+    def test_retarget(self):
+        foos = list(self.queryset.retarget(self.table_schemas))
+        self.assertEqual([foo.pk for foo in foos], [self.foo.pk])
+        self.assertEqual(foos[0]._state.table_schemas, self.table_schemas)
+        self.assertEqual([foo.pk for foo in self.queryset], [self.other_foo.pk])
+
+    def test_update(self):
+        self.assertEqual(self.queryset.update(id=F('id') + 100), 1)
+        self.assertTrue(self.queryset.filter(pk=self.other_foo.pk + 100).exists())
+
+    def test_delete(self):
+        self.queryset.delete()
+        self.assertFalse(self.queryset.exists())
+        self.assertTrue(SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).exists())
+
+    def test_multiple_schemas(self):
+        # Both schemas contain tables named after foo and bar.
+        table_schemas = dict(self.other_table_schemas, **{UnmanagedBar._meta.db_table: 'schema'})
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas, search_path=True)
+        msg = 'Cannot resolve tables through a search path spanning multiple schemas: other, schema.'
+        with self.assertRaisesMessage(ValueError, msg):
+            list(queryset.filter(bars__isnull=False))
+
+    def test_across_schemas(self):
+        with self.assertRaisesMessage(TypeError, 'Cannot use across_schemas() on a search path queryset.'):
+            self.queryset.across_schemas([self.table_schemas])
+
+
+class SearchPathTransactionTests(TableSchemasMixin, TransactionTestCase):
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE schema.foo')
+
+    def test_autocommit(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas, search_path=True)
+        foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).create()
+        self.assertEqual([obj.pk for obj in queryset], [foo.pk])
+        self.assertEqual([obj.pk for obj in queryset.iterator()], [foo.pk])
+        self.assertEqual(queryset.count(), 1)
+
+    def test_transaction(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas, search_path=True)
+        for _ in range(2):
+            with transaction.atomic(), CaptureQueriesContext(connection) as ctx:
+                queryset.count()
+                queryset.count()
+            self.assertEqual(len(ctx.captured_queries), 3)
+
+
+class BulkInsertTests(TableSchemasMixin, TestCase):
+    def setUp(self):
+        # The managed models have their tables in schema.
+        self.foo_queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas)
+        self.bar_queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas)
+
+    def test_bulk_create(self):
+        with self.assertNumQueries(1):
+            foos = self.foo_queryset.bulk_create([UnmanagedFoo() for _ in range(3)])
+        self.assertEqual(sorted(foo.pk for foo in foos), sorted(self.foo_queryset.values_list('pk', flat=True)))
+        self.assertEqual(foos[0]._state.table_schemas, self.other_table_schemas)
+        self.assertEqual(foos[0].bars.count(), 0)
+        self.assertFalse(Foo.objects.exists())
+
+    def test_bulk_create_batch_size(self):
+        with self.assertNumQueries(2):
+            self.foo_queryset.bulk_create([UnmanagedFoo() for _ in range(3)], batch_size=2)
+        self.assertEqual(self.foo_queryset.count(), 3)
+
+    def test_retargeted(self):
+        # Inserts would be compiled against the mapping the queryset was built
+        # with.
+        queryset = self.foo_queryset.retarget(self.table_schemas)
+        message = 'Cannot call %s() after across_schemas() or retarget().'
+        with self.assertRaisesMessage(TypeError, message % 'bulk_create'):
+            queryset.bulk_create([UnmanagedFoo()])
+        with self.assertRaisesMessage(TypeError, message % 'copy_from'):
+            queryset.copy_from([UnmanagedFoo()])
+        with self.assertRaisesMessage(TypeError, message % 'bulk_create'):
+            self.foo_queryset.across_schemas([self.other_table_schemas]).bulk_create([UnmanagedFoo()])
+        self.assertFalse(self.foo_queryset.exists())
+        self.assertFalse(queryset.exists())
+
+    def test_copy_from(self):
+        foo = self.foo_queryset.create()
+
+        def bars():
+            yield UnmanagedBar(foo=foo)
+            for _ in range(99):
+                yield UnmanagedBar()
+
+        self.assertEqual(self.bar_queryset.copy_from(bars()), 100)
+        self.assertEqual(self.bar_queryset.count(), 100)
+        self.assertEqual(self.bar_queryset.filter(foo=foo).count(), 1)
+        self.assertFalse(Bar.objects.exists())
+
+    def test_copy_from_fields(self):
+        self.assertEqual(self.foo_queryset.copy_from((UnmanagedFoo(pk=pk) for pk in (10, 11)), fields=['id']), 2)
+        self.assertEqual(list(self.foo_queryset.order_by('pk').values_list('pk', flat=True)), [10, 11])
+
+    def test_copy_from_search_path(self):
+        queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas, search_path=True)
+        self.assertEqual(queryset.copy_from([UnmanagedBar()]), 1)
+        self.assertEqual(self.bar_queryset.count(), 1)
+
+    def test_copy_from_no_fields(self):
+        with self.assertRaisesMessage(ValueError, "Can't copy into tests.UnmanagedFoo without fields to copy"):
+            self.foo_queryset.copy_from([UnmanagedFoo()])
+
+    def test_copy_text(self):
+        self.assertEqual(copy_text(None), '\\N')
+        self.assertEqual(copy_text(True), 't')
+        self.assertEqual(copy_text('a\tb\\c\n'), 'a\\tb\\\\c\\n')
+        # Native strings of Python 2 are text unless the field is binary.
+        self.assertEqual(copy_text(str('abc'), models.CharField()), 'abc')
+        self.assertEqual(copy_text(b'caf\xc3\xa9', models.TextField()), 'caf\xe9')
+        binary_field = models.BinaryField()
+        self.assertEqual(
+            copy_text(binary_field.get_db_prep_save(b'\x00\xff', connection), binary_field), '\\\\x00ff',
+        )
+        array_field = ArrayField(models.CharField(max_length=10))
+        self.assertEqual(
+            copy_text(array_field.get_db_prep_save(['a', None, 'b"c'], connection), array_field),
+            '{"a",NULL,"b\\\\"c"}',
+        )
+
+    def test_copy_text_round_trip(self):
+        binary_field = models.BinaryField()
+        array_field = ArrayField(ArrayField(models.TextField()))
+        text_field = models.TextField()
+        values = [
+            (binary_field, b'\x00\\\xff'),
+            (array_field, [['a\tb', None], ['"c"', '\\d']]),
+            (text_field, str('abc')),
+        ]
+        line = '\t'.join(copy_text(field.get_db_prep_save(value, connection), field) for field, value in values)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE copy_text (b bytea, a text[], t text)')
+            cursor.copy_expert('COPY copy_text FROM STDIN', io.StringIO(line + '\n'))
+            cursor.execute('SELECT b, a, t FROM copy_text')
+            b, a, t = cursor.fetchone()
+        self.assertEqual((bytes(b), a, t), tuple(value for _, value in values))
+
+    def test_copy_from_multi_table_inheritance(self):
+        queryset = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.other_table_schemas)
+        with self.assertRaisesMessage(ValueError, "Can't copy into a multi-table inherited model"):
+            queryset.copy_from([])
+
+
+class CopyToTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        foos, other_foos = cls.querysets(UnmanagedFoo)
+        cls.foos = other_foos.bulk_create([UnmanagedFoo() for _ in range(3)])
+        cls.bars = SchemaQuerySet(UnmanagedBar, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedBar(foo=foo) for foo in cls.foos] + [UnmanagedBar()]
+        )
+        foos.create()
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).order_by('pk')
+
+    def copy_to(self, queryset, **kwargs):
+        fileobj = io.BytesIO()
+        count = queryset.copy_to(fileobj, **kwargs)
+        return count, fileobj.getvalue().decode()
+
+    def test_csv(self):
+        self.assertEqual(self.copy_to(self.queryset, header=True), (4, 'id,foo_id\n%s%d,\n' % (
+            ''.join('%d,%d\n' % (bar.pk, bar.foo_id) for bar in self.bars[:3]), self.bars[3].pk,
+        )))
+
+    def test_text(self):
+        queryset = self.queryset.filter(foo__in=self.foos[:2]).values_list('foo_id', 'foo__id')
+        self.assertEqual(self.copy_to(queryset, format='text'), (2, '%d\t%d\n%d\t%d\n' % (
+            self.foos[0].pk, self.foos[0].pk, self.foos[1].pk, self.foos[1].pk,
+        )))
+
+    def test_binary(self):
+        fileobj = io.BytesIO()
+        self.assertEqual(self.queryset.filter(pk=self.bars[0].pk).copy_to(fileobj, format='binary'), 1)
+        self.assertTrue(fileobj.getvalue().startswith(b'PGCOPY\n\xff\r\n\x00'))
+
+    def test_search_path(self):
+        queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas, search_path=True)
+        self.assertEqual(self.copy_to(queryset.filter(foo=None).values('pk')), (1, '%d\n' % self.bars[3].pk))
+
+    def test_across_schemas(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).values('pk').across_schemas(
+            [self.table_schemas, self.other_table_schemas]
+        )
+        count, data = self.copy_to(queryset)
+        self.assertEqual(count, 4)
+        self.assertEqual(sorted(line.split(',')[1] for line in data.splitlines()), ['other'] * 3 + ['schema'])
+
+    def test_empty(self):
+        self.assertEqual(self.copy_to(self.queryset.filter(pk__in=[])), (0, ''))
+
+    def test_invalid_format(self):
+        with self.assertRaisesMessage(ValueError, "Unsupported COPY format 'xml'"):
+            self.queryset.copy_to(io.BytesIO(), format='xml')
+        with self.assertRaisesMessage(ValueError, 'COPY header is only supported with the csv format'):
+            self.queryset.copy_to(io.BytesIO(), format='text', header=True)
+
+
+class ChunkedIterationTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.foos = SchemaQuerySet(UnmanagedFoo, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedFoo() for _ in range(5)]
+        )
+        cls.bars = SchemaQuerySet(UnmanagedBar, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedBar(foo=foo) for foo in cls.foos]
+        )
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+
+    def iterator(self, queryset):
+        if django.VERSION >= (2, 0):
+            return queryset.iterator(chunk_size=2)
+        return queryset.iterator()
+
+    def test_iterator(self):
+        bars = list(self.iterator(self.queryset.retarget(self.other_table_schemas).order_by('pk')))
+        self.assertEqual(bars, self.bars)
+        # All the instances share the same immutable mapping.
+        self.assertEqual(len({id(bar._state.table_schemas) for bar in bars}), 1)
+        self.assertEqual(bars[0]._state.table_schemas, self.other_table_schemas)
+
+    def test_values_list(self):
+        queryset = self.queryset.retarget(self.other_table_schemas).order_by('pk').values_list('pk', flat=True)
+        self.assertEqual(list(self.iterator(queryset)), [bar.pk for bar in self.bars])
+
+    def test_select_related(self):
+        queryset = self.queryset.retarget(self.other_table_schemas).select_related('foo')
+        with self.assertNumQueries(1):
+            bars = list(self.iterator(queryset))
+            self.assertEqual(len(bars), 5)
+            for bar in bars:
+                self.assertIs(bar.foo._state.table_schemas, bar._state.table_schemas)
+
+    def test_across_schemas_select_related(self):
+        queryset = self.queryset.across_schemas([self.table_schemas, self.other_table_schemas]).select_related('foo')
+        for bar in self.iterator(queryset):
+            self.assertEqual(bar.schema, 'other')
+            self.assertEqual(bar.foo._state.table_schemas, self.other_table_schemas)
+
+    def test_table_schemas_immutable(self):
+        table_schemas = self.queryset._table_schemas
+        self.assertEqual(table_schemas, self.table_schemas)
+        with self.assertRaisesMessage(TypeError, "'TableSchemas' object is immutable."):
+            table_schemas[UnmanagedFoo._meta.db_table] = 'other'
+        self.assertEqual(pickle.loads(pickle.dumps(table_schemas)), table_schemas)
+
+
+class SetDeletionTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # The managed models have their tables in schema.
+        foos = SchemaQuerySet(UnmanagedFoo, table_schemas=cls.other_table_schemas)
+        cls.foos = foos.bulk_create([UnmanagedFoo() for _ in range(3)])
+        cls.foo_subclass = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=cls.other_table_schemas).create(
+            foo_ptr=cls.foos[0],
+        )
+        cls.bars = SchemaQuerySet(UnmanagedBar, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedBar(foo=foo) for foo in cls.foos]
+        )
+        SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedBar.foos.through(bar=bar, foo=foo) for bar, foo in zip(cls.bars, cls.foos)]
+        )
+
+    def setUp(self):
+        self.foo_queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas)
+        self.bar_queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas)
+        self.through_queryset = SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=self.other_table_schemas)
+
+    def test_queryset_delete(self):
+        with self.assertNumQueries(1):
+            deleted = self.foo_queryset.filter(pk__in=[foo.pk for foo in self.foos[:2]]).delete()
+        self.assertEqual(deleted, (5, {
+            UnmanagedFoo._meta.label: 2,
+            UnmanagedFooSubclass._meta.label: 1,
+            UnmanagedBar.foos.through._meta.label: 2,
+        }))
+        self.assertEqual(list(self.foo_queryset.values_list('pk', flat=True)), [self.foos[2].pk])
+        self.assertFalse(SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.other_table_schemas).exists())
+        self.assertEqual(
+            list(self.bar_queryset.order_by('pk').values_list('foo', flat=True)), [None, None, self.foos[2].pk]
+        )
+        self.assertEqual(self.through_queryset.count(), 1)
+
+    def test_queryset_delete_joins(self):
+        # The rows to delete are selected before the cascades are applied.
+        with self.assertNumQueries(1):
+            deleted, _ = self.foo_queryset.filter(m2m_bars__in=self.bars[1:]).delete()
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(self.foo_queryset.values_list('pk', flat=True)), [self.foos[0].pk])
+
+    def test_queryset_delete_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.foo_queryset.filter(pk__in=[]).delete(), (0, {UnmanagedFoo._meta.label: 0}))
+
+    def test_model_delete(self):
+        foo_subclass = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.other_table_schemas).get()
+        with self.assertNumQueries(1):
+            deleted = foo_subclass.delete()
+        self.assertEqual(deleted, (3, {
+            UnmanagedFoo._meta.label: 1,
+            UnmanagedFooSubclass._meta.label: 1,
+            UnmanagedBar.foos.through._meta.label: 1,
+        }))
+        self.assertIsNone(foo_subclass.pk)
+        self.assertFalse(self.foo_queryset.filter(pk=self.foos[0].pk).exists())
+        self.assertIsNone(self.bar_queryset.get(pk=self.bars[0].pk).foo_id)
+
+    def test_model_delete_deleted(self):
+        foo = self.foo_queryset.get(pk=self.foos[2].pk)
+        self.foo_queryset.filter(pk=foo.pk).delete()
+        self.assertEqual(foo.delete(), (0, {
+            UnmanagedFoo._meta.label: 0,
+            UnmanagedFooSubclass._meta.label: 0,
+            UnmanagedBar.foos.through._meta.label: 0,
+        }))
+        self.assertIsNone(foo.pk)
+
+    def test_model_delete_instances_required(self):
+        def receiver(sender, **kwargs):
+            pass
+        signals.pre_delete.connect(receiver, sender=UnmanagedFoo)
+        try:
+            foo = self.foo_queryset.get(pk=self.foos[2].pk)
+            self.assertEqual(foo.delete()[0], 2)
+            self.assertIsNone(foo.pk)
+            empty = self.foo_queryset.filter(pk__in=[self.foos[2].pk]).delete()
+        finally:
+            signals.pre_delete.disconnect(receiver, sender=UnmanagedFoo)
+        self.assertEqual(empty, (0, {UnmanagedFoo._meta.label: 0}))
+
+    def test_model_delete_keep_parents(self):
+        foo_subclass = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.other_table_schemas).get()
+        self.assertEqual(foo_subclass.delete(keep_parents=True), (1, {UnmanagedFooSubclass._meta.label: 1}))
+        self.assertTrue(self.foo_queryset.filter(pk=self.foos[0].pk).exists())
+        self.assertEqual(self.bar_queryset.get(pk=self.bars[0].pk).foo_id, self.foos[0].pk)
+
+    def test_signal_receivers(self):
+        deleted_pks = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted_pks.append(instance.pk)
+        signals.post_delete.connect(receiver, sender=UnmanagedFooSubclass)
+        try:
+            deleted, _ = self.foo_queryset.filter(pk=self.foos[0].pk).delete()
+        finally:
+            signals.post_delete.disconnect(receiver, sender=UnmanagedFooSubclass)
+        self.assertEqual(deleted, 3)
+        self.assertEqual(deleted_pks, [self.foos[0].pk])
+        self.assertIsNone(self.bar_queryset.get(pk=self.bars[0].pk).foo_id)
+
+    def test_m2m_changed_receivers(self):
+        def receiver(sender, **kwargs):
+            pass
+        through = UnmanagedBar.foos.through
+        queryset = self.foo_queryset.filter(pk=self.foos[1].pk)
+        signals.m2m_changed.connect(receiver, sender=through)
+        try:
+            self.assertFalse(SetCollector(using='default', table_schemas=self.other_table_schemas).collect(queryset))
+            with CaptureQueriesContext(connection) as queries:
+                deleted = queryset.delete()
+        finally:
+            signals.m2m_changed.disconnect(receiver, sender=through)
+        self.assertGreater(len(queries), 1)
+        self.assertEqual(deleted, (2, {UnmanagedFoo._meta.label: 1, through._meta.label: 1}))
+        self.assertTrue(SetCollector(using='default', table_schemas=self.other_table_schemas).collect(queryset))
+
+
+class PrefetchRelatedTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bars = {}
+        for table_schemas in cls.table_schemas_list():
+            foos = SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).bulk_create(
+                [UnmanagedFoo() for _ in range(2)]
+            )
+            bars = SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).bulk_create(
+                [UnmanagedBar(foo=foo) for foo in foos]
+            )
+            SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=table_schemas).bulk_create(
+                [UnmanagedBar.foos.through(bar=bar, foo=foo) for bar, foo in zip(bars, foos)]
+            )
+            cls.bars[table_schemas[UnmanagedBar._meta.db_table]] = bars
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas).across_schemas(
+            self.table_schemas_list()
+        )
+
+    def assertRelatedSchemas(self, bars, attr):
+        for bar in bars:
+            related = getattr(bar, attr)
+            if hasattr(related, 'all'):
+                related = related.all()
+            elif not isinstance(related, list):
+                related = [related]
+            self.assertEqual(len(related), 1)
+            self.assertEqual(related[0]._state.table_schemas[UnmanagedFoo._meta.db_table], bar.schema)
+
+    def test_many_to_many(self):
+        with self.assertNumQueries(3):
+            bars = list(self.queryset.prefetch_related('foos'))
+            self.assertRelatedSchemas(bars, 'foos')
+        self.assertEqual(
+            sorted((bar.schema, bar.foos.all()[0].pk) for bar in bars),
+            sorted((schema, bar.foo_id) for schema, schema_bars in self.bars.items() for bar in schema_bars),
+        )
+
+    def test_foreign_key(self):
+        with self.assertNumQueries(3):
+            bars = list(self.queryset.prefetch_related('foo'))
+            self.assertRelatedSchemas(bars, 'foo')
+
+    def test_reverse_foreign_key(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).across_schemas(
+            self.table_schemas_list()
+        )
+        with self.assertNumQueries(3):
+            for foo in queryset.prefetch_related('bars'):
+                self.assertEqual(
+                    [bar._state.table_schemas[UnmanagedBar._meta.db_table] for bar in foo.bars.all()],
+                    [foo.schema],
+                )
+
+    def test_nested(self):
+        with self.assertNumQueries(5):
+            bars = list(self.queryset.prefetch_related('foo__m2m_bars'))
+            for bar in bars:
+                self.assertEqual([m2m_bar.pk for m2m_bar in bar.foo.m2m_bars.all()], [bar.pk])
+
+    def test_prefetch_queryset(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).order_by('-pk')
+        with self.assertNumQueries(3):
+            bars = list(self.queryset.prefetch_related(Prefetch('foos', queryset=queryset, to_attr='foo_list')))
+            self.assertRelatedSchemas(bars, 'foo_list')
+
+    def test_prefetch_queryset_without_table_schemas(self):
+        # The queryset adopts the table schemas of each group in turn.
+        queryset = SchemaQuerySet(UnmanagedFoo)
+        bars = list(self.queryset.prefetch_related(Prefetch('foos', queryset=queryset, to_attr='foo_list')))
+        self.assertRelatedSchemas(bars, 'foo_list')
+        self.assertEqual(queryset._table_schemas, {})
+        self.assertEqual(queryset.query.table_schemas, {})
+        self.assertNotIn('instance', queryset._hints)
+
+
+@skipIf(django.VERSION < (2, 0), 'Execute wrappers were added in Django 2.0.')
+class InstrumentationTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.foos = SchemaQuerySet(UnmanagedFoo, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedFoo() for _ in range(3)]
+        )
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas)
+
+    def test_stats(self):
+        stats = SchemaStats()
+        with instrument(stats):
+            list(self.queryset)
+            self.queryset.filter(pk=self.foos[0].pk).update(id=F('id'))
+            self.queryset.create()
+            Foo.objects.count()
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot[('other', 'select')]['count'], 1)
+        self.assertEqual(snapshot[('other', 'select')]['rows'], 3)
+        self.assertEqual(sum(snapshot[('other', 'select')]['histogram']), 1)
+        self.assertEqual(snapshot[('other', 'update')]['rows'], 1)
+        self.assertEqual(snapshot[('other', 'insert')]['count'], 1)
+        self.assertEqual(snapshot[(None, 'select')]['count'], 1)
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_callback(self):
+        statements = []
+        with instrument(statements.append):
+            list(self.queryset.across_schemas(self.table_schemas_list()))
+            self.queryset.filter(pk=self.foos[0].pk).delete()
+        self.assertEqual([(statement.kind, statement.schemas) for statement in statements], [
+            ('select', ('schema', 'other')),
+            ('delete', ('other',)),
+        ])
+        self.assertEqual(statements[0].rows, 3)
+        self.assertGreater(statements[0].duration, 0)
+        self.assertFalse(is_instrumented(connection))
+        self.assertIsNone(getattr(connection, 'schema_statement', None))
+
+    def test_install(self):
+        statements = []
+        executed, uninstalled = threading.Event(), threading.Event()
+        thread_instrumented = []
+
+        def run():
+            thread_connection = connections[DEFAULT_DB_ALIAS]
+            try:
+                with thread_connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                executed.set()
+                uninstalled.wait()
+                thread_instrumented.append(is_instrumented(thread_connection))
+            finally:
+                thread_connection.close()
+        uninstall = install(statements.append)
+        thread = threading.Thread(target=run)
+        try:
+            list(self.queryset)
+            thread.start()
+            executed.wait()
+        finally:
+            uninstall()
+            uninstalled.set()
+        thread.join()
+        self.assertEqual([statement.kind for statement in statements], ['select', 'select'])
+        # The connection of the other thread is left uninstrumented too.
+        self.assertFalse(is_instrumented(connection))
+        self.assertEqual(thread_instrumented, [False])
+
+    def test_copy(self):
+        statements = []
+        with instrument(statements.append):
+            self.queryset.copy_from([UnmanagedFoo(pk=1000)], fields=['id'])
+            self.queryset.copy_to(io.BytesIO())
+        self.assertEqual([(statement.kind, statement.schemas, statement.rows) for statement in statements], [
+            ('insert', ('other',), 1),
+            ('select', ('other',), 4),
+        ])
+
+    def test_search_path(self):
+        statements = []
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas, search_path=True)
+        with transaction.atomic(), instrument(statements.append):
+            queryset.count()
+        self.assertEqual([(statement.kind, statement.schemas) for statement in statements], [
+            ('set', ()),
+            ('select', ('other',)),
+        ])
+
+
+@skipIf(django.VERSION < (2, 0), 'Execute wrappers were added in Django 2.0.')
+class ExplainSamplerTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.foo = SchemaQuerySet(UnmanagedFoo, table_schemas=cls.table_schemas).create()
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas)
+        self.other_queryset = self.queryset.retarget(self.other_table_schemas)
+
+    def test_explain(self):
+        with explain_slow_queries(threshold=0, interval=0) as sampler:
+            self.assertEqual(list(self.queryset.filter(pk=self.foo.pk)), [self.foo])
+            self.queryset.filter(pk=self.foo.pk).update(id=F('id'))
+            Foo.objects.count()
+        select, update = sampler.snapshot()
+        self.assertEqual((select.kind, select.schemas, select.analyzed), ('select', ('schema',), True))
+        self.assertIn('actual time=', select.plan)
+        self.assertEqual((update.kind, update.schemas, update.analyzed), ('update', ('schema',), False))
+        self.assertTrue(update.plan.startswith('Update on foo'))
+        self.assertNotIn('actual time=', update.plan)
+        # Writes aren't performed again.
+        self.assertEqual(self.queryset.get().pk, self.foo.pk)
+        self.assertFalse(is_instrumented(connection))
+
+    def test_threshold(self):
+        with explain_slow_queries(threshold=60) as sampler:
+            list(self.queryset)
+        self.assertEqual(sampler.snapshot(), [])
+
+    def test_rate_limits(self):
+        with explain_slow_queries(threshold=0, interval=0, maxlen=2) as sampler:
+            for _ in range(2):
+                list(self.queryset.all())
+                list(self.other_queryset.all())
+        statements = sampler.snapshot()
+        self.assertEqual([statement.schemas for statement in statements], [('schema',), ('other',)])
+        # Statements of the same shape share their fingerprint across schemas.
+        self.assertEqual(statements[0].fingerprint, statements[1].fingerprint)
+        self.assertEqual(sampler.skipped, 2)
+        sampler = ExplainSampler(threshold=0, interval=60)
+        sampler.install(connection)
+        try:
+            list(self.queryset.all())
+            list(self.other_queryset.all())
+        finally:
+            sampler.uninstall(connection)
+        self.assertEqual(len(sampler.snapshot()), 1)
+        sampler = ExplainSampler(threshold=0, interval=0, sample_rate=0)
+        sampler.install(connection)
+        try:
+            list(self.queryset.all())
+        finally:
+            sampler.uninstall(connection)
+        self.assertEqual(sampler.snapshot(), [])
+
+    def test_across_schemas(self):
+        queryset = self.queryset.across_schemas(self.table_schemas_list())
+        with transaction.atomic(), explain_slow_queries(threshold=0) as sampler:
+            self.assertEqual(len(queryset), 1)
+        statement, = sampler.snapshot()
+        self.assertEqual(statement.schemas, ('schema', 'other'))
+        self.assertIn('Append', statement.plan)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT "schema"."foo"."id" FROM "schema"."foo"', ('schema',)),
+            fingerprint('SELECT "other"."foo"."id" FROM "other"."foo"', ('other',)),
+        )
+
+    def test_dump(self):
+        with explain_slow_queries(threshold=0) as sampler:
+            list(self.queryset)
+        fileobj = io.StringIO()
+        sampler.dump(fileobj)
+        statement = json.loads(fileobj.getvalue())
+        self.assertEqual(statement['schemas'], ['schema'])
+        self.assertEqual(statement['plan'], sampler.snapshot()[0].plan)
+        sampler.reset()
+        self.assertEqual(sampler.snapshot(), [])
+
+
+class SchemaRegistryTests(TableSchemasMixin, TestCase):
+    def setUp(self):
+        self.registry = SchemaRegistry([UnmanagedBar])
+
+    def test_tables(self):
+        self.assertEqual(self.registry.tables, {
+            UnmanagedFoo._meta.db_table,
+            UnmanagedFooSubclass._meta.db_table,
+            UnmanagedBar._meta.db_table,
+            UnmanagedBar.foos.through._meta.db_table,
+        })
+        self.assertEqual(SchemaRegistry().tables, self.registry.tables)
+
+    def test_discover(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.registry.schemas, ['other', 'schema'])
+            table_schemas = self.registry.table_schemas('other')
+            self.assertEqual(table_schemas, self.other_table_schemas)
+            self.assertIs(self.registry.table_schemas('other'), table_schemas)
+            self.assertIn('schema', self.registry)
+            self.assertEqual(self.registry.table_schemas_list(), [self.other_table_schemas, self.table_schemas])
+        self.assertEqual(self.registry.queryset(UnmanagedFoo, 'other').query.get_meta().db_table, '"other"."foo"')
+
+    def test_unknown_schema(self):
+        with self.assertRaisesMessage(LookupError, "Schema 'unknown' isn't registered."):
+            self.registry.table_schemas('unknown')
+
+    def test_missing_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA partial')
+            cursor.execute('CREATE TABLE partial.foo (id serial PRIMARY KEY)')
+        self.assertEqual(self.registry.missing_tables, {
+            'partial': {'bar', 'bar_foos', 'foosubclass'},
+        })
+        with self.assertRaisesMessage(LookupError, "Schema 'partial' is missing tables bar, bar_foos, foosubclass."):
+            self.registry.table_schemas('partial')
+
+    def test_invalidate(self):
+        self.assertNotIn('tenant', self.registry)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA tenant')
+            for table in sorted(self.registry.tables):
+                cursor.execute('CREATE TABLE tenant.%s (LIKE other.%s INCLUDING ALL)' % (table, table))
+        self.assertNotIn('tenant', self.registry)
+        with self.assertNumQueries(1):
+            self.registry.invalidate('tenant')
+        self.assertEqual(self.registry.schemas, ['other', 'schema', 'tenant'])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP SCHEMA tenant CASCADE')
+        self.registry.invalidate()
+        self.assertEqual(self.registry.schemas, ['other', 'schema'])
+
+
+class ProvisioningTests(TestCase):
+    def setUp(self):
+        self.registry = SchemaRegistry([UnmanagedBar])
+
+    def catalog(self, schema):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relkind, c.relname FROM pg_catalog.pg_class c "
+                "INNER JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = %s ORDER BY 1, 2", [schema]
+            )
+            relations = cursor.fetchall()
+            cursor.execute(
+                "SELECT con.contype, pg_catalog.pg_get_constraintdef(con.oid) FROM pg_catalog.pg_constraint con "
+                "INNER JOIN pg_catalog.pg_namespace n ON n.oid = con.connamespace "
+                "WHERE n.nspname = %s ORDER BY 1, 2", [schema]
+            )
+            # Constraints referencing tables of their own schema.
+            constraints = [
+                (contype, definition.replace('%s.' % schema, '')) for contype, definition in cursor.fetchall()
+            ]
+            return relations, constraints
+
+    def search_path(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_catalog.current_setting('search_path')")
+            return cursor.fetchone()[0]
+
+    def assertProvisioned(self, schema, table_schemas):
+        self.assertEqual(table_schemas, dict.fromkeys(self.registry.tables, schema))
+        self.assertIn(schema, self.registry)
+        foo = SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).create()
+        bar = SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).create(foo=foo)
+        self.assertEqual(foo.pk, 1)
+        self.assertEqual(bar.foo_id, foo.pk)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", ['"%s"."foo"' % schema])
+            self.assertEqual(cursor.fetchone()[0], '%s.foo_id_seq' % schema)
+
+    def test_from_models(self):
+        search_path = self.search_path()
+        with CaptureQueriesContext(connection) as ctx:
+            table_schemas_list = provision_schemas(['tenant1', 'tenant2'], registry=self.registry, batch_size=2)
+        self.assertEqual(len([query for query in ctx.captured_queries if 'CREATE SCHEMA' in query['sql']]), 1)
+        self.assertEqual(self.search_path(), search_path)
+        self.assertProvisioned('tenant1', table_schemas_list[0])
+        self.assertProvisioned('tenant2', table_schemas_list[1])
+        self.assertEqual(self.catalog('tenant1'), self.catalog('tenant2'))
+        relations, constraints = self.catalog('tenant1')
+        self.assertIn(('S', 'foo_id_seq'), relations)
+        self.assertIn('f', [contype for contype, _ in constraints])
+
+    def test_from_template(self):
+        provision_schemas(['template'], registry=self.registry)
+        search_path = self.search_path()
+        table_schemas_list = provision_schemas(
+            ['tenant1', 'tenant2'], template='template', registry=self.registry, batch_size=1
+        )
+        self.assertEqual(self.search_path(), search_path)
+        self.assertProvisioned('tenant1', table_schemas_list[0])
+        self.assertProvisioned('tenant2', table_schemas_list[1])
+        template_relations, template_constraints = self.catalog('template')
+        relations, constraints = self.catalog('tenant1')
+        self.assertEqual(constraints, template_constraints)
+        self.assertEqual(
+            [relation for relation in relations if relation[0] != 'i'],
+            [relation for relation in template_relations if relation[0] != 'i'],
+        )
+        self.assertEqual(len(relations), len(template_relations))
+
+    def test_claim_schema(self):
+        pool = warm_pool(2, template='schema', registry=self.registry)
+        self.assertEqual([schema in self.registry for schema in pool], [True, True])
+        table_schemas = claim_schema('tenant', registry=self.registry)
+        self.assertEqual(table_schemas, dict.fromkeys(self.registry.tables, 'tenant'))
+        self.assertEqual(len([schema for schema in pool if schema in self.registry]), 1)
+        # Provisioned when the pool is exhausted.
+        claim_schema('tenant2', registry=self.registry)
+        claim_schema('tenant3', registry=self.registry)
+        self.assertEqual([schema for schema in pool if schema in self.registry], [])
+        self.assertIn('tenant3', self.registry)
+
+    def test_claim_existing_schema(self):
+        pool = warm_pool(1, template='schema', registry=self.registry)
+        with self.assertRaisesMessage(ValueError, "Schema 'other' already exists."):
+            claim_schema('other', registry=self.registry)
+        self.assertIn(pool[0], self.registry)
+        self.assertEqual(claim_schema('tenant', registry=self.registry)['foo'], 'tenant')
+
+
+class ProvisioningTransactionTests(TransactionTestCase):
+    schemas = ['tenant%d' % index for index in range(4)]
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP SCHEMA IF EXISTS %s CASCADE' % ', '.join(self.schemas))
+        default_registry().invalidate()
+
+    def test_concurrent(self):
+        registry = SchemaRegistry([UnmanagedBar])
+        table_schemas_list = provision_schemas(
+            self.schemas, template='schema', registry=registry, batch_size=1, max_workers=2
+        )
+        self.assertEqual(table_schemas_list, [dict.fromkeys(registry.tables, schema) for schema in self.schemas])
+
+    def test_failure(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA tenant1')
+        with self.assertRaises(ProvisioningError) as ctx:
+            provision_schemas(self.schemas, template='schema', batch_size=2, max_workers=2)
+        self.assertEqual([schemas for schemas, _ in ctx.exception.errors], [['tenant0', 'tenant1']])
+        # The failed batch was rolled back.
+        self.assertNotIn('tenant0', SchemaRegistry())
+
+    def test_command(self):
+        registry = default_registry()
+        self.assertNotIn(self.schemas[0], registry)
+        stdout = io.StringIO()
+        call_command('provision_schemas', *self.schemas[:2], template='schema', workers=2, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'Provisioned 2 schema(s).\n')
+        # The default registry is kept up to date.
+        self.assertEqual([schema in registry for schema in self.schemas], [True, True, False, False])
+        with self.assertRaisesMessage(CommandError, 'Specify schemas to create or a --warm-pool size.'):
+            call_command('provision_schemas')
+
+
+class MergeAcrossSchemasTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.foos = [
+            (foo.pk, schema)
+            for table_schemas in cls.table_schemas_list()
+            for schema in [table_schemas[UnmanagedFoo._meta.db_table]]
+            for foo in SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).bulk_create(
+                [UnmanagedFoo() for _ in range(4)]
+            )
+        ]
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas)
+        # Primary keys are only unique per schema and ties are broken by schema.
+        self.descending = sorted(self.foos, key=lambda foo: (-foo[0], foo[1]))
+
+    def positions(self, foos):
+        return [(foo.pk, foo.schema) for foo in foos]
+
+    def test_slicing(self):
+        merged = self.queryset.order_by('-pk').merge_across_schemas(self.table_schemas_list())
+        with self.assertNumQueries(1) as ctx:
+            foos = merged[:3]
+        self.assertEqual(self.positions(foos), self.descending[:3])
+        self.assertEqual(ctx.captured_queries[0]['sql'].count('LIMIT 3'), 2)
+        self.assertEqual(
+            [foo._state.table_schemas[UnmanagedFoo._meta.db_table] for foo in foos], [foo.schema for foo in foos]
+        )
+        self.assertEqual(self.positions(merged[2:5]), self.descending[2:5])
+        self.assertEqual(self.positions(merged[6:]), self.descending[6:])
+        self.assertEqual(self.positions(merged), self.descending)
+        self.assertEqual((merged[1].pk, merged[1].schema), self.descending[1])
+        self.assertEqual(merged[3:3], [])
+        with self.assertRaises(IndexError):
+            merged[8]
+
+    def test_default_ordering(self):
+        merged = self.queryset.merge_across_schemas(self.table_schemas_list())
+        self.assertEqual(self.positions(merged[:8]), sorted(self.foos))
+
+    def test_pages(self):
+        merged = self.queryset.order_by('-pk').merge_across_schemas(self.table_schemas_list())
+        pages = []
+        token = None
+        while True:
+            with self.assertNumQueries(1):
+                page = merged.page(3, token)
+            pages.append(self.positions(page.objects))
+            token = page.next_token
+            if token is None:
+                break
+        self.assertEqual(pages, [self.descending[:3], self.descending[3:6], self.descending[6:]])
+        self.assertEqual(merged.page(8).next_token, None)
+
+    def test_iteration(self):
+        merged = self.queryset.order_by('-pk').merge_across_schemas(self.table_schemas_list())
+        merged.chunk_size = 3
+        iterator = iter(merged)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.positions(islice(iterator, 3)), self.descending[:3])
+        with self.assertNumQueries(2):
+            self.assertEqual(self.positions(iterator), self.descending[3:])
+
+    def test_nulls(self):
+        bars = []
+        for table_schemas in self.table_schemas_list():
+            foos = list(SchemaQuerySet(UnmanagedFoo, table_schemas=table_schemas).order_by('pk')[:2])
+            created = SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).bulk_create(
+                [UnmanagedBar(foo=foo) for foo in [None, foos[0], None, foos[1]]]
+            )
+            bars.extend((bar.foo_id, bar.pk, table_schemas[UnmanagedBar._meta.db_table]) for bar in created)
+        queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+        # Nulls sort last in ascending order and first in descending order.
+        for ordering, key in [
+            ('foo_id', lambda bar: (bar[0] is None, bar[0] or 0, bar[1], bar[2])),
+            ('-foo_id', lambda bar: (bar[0] is not None, -(bar[0] or 0), bar[1], bar[2])),
+        ]:
+            merged = queryset.order_by(ordering).merge_across_schemas(self.table_schemas_list())
+            expected = sorted(bars, key=key)
+            positions = []
+            token = None
+            while True:
+                page = merged.page(3, token)
+                positions.extend((bar.foo_id, bar.pk, bar.schema) for bar in page.objects)
+                token = page.next_token
+                if token is None:
+                    break
+            self.assertEqual(positions, expected)
+            merged.chunk_size = 3
+            self.assertEqual([(bar.foo_id, bar.pk, bar.schema) for bar in merged], expected)
+
+    def test_invalid_token(self):
+        merged = self.queryset.merge_across_schemas(self.table_schemas_list())
+        for token in ('invalid', merged.encode_token(merged[0])[:-2]):
+            with self.assertRaisesMessage(ValueError, 'Invalid pagination token.'):
+                merged.page(3, token)
+
+    def test_unsupported(self):
+        with self.assertRaisesMessage(ValueError, "Cannot merge across schemas on ordering '?'."):
+            self.queryset.order_by('?').merge_across_schemas(self.table_schemas_list())
+        with self.assertRaisesMessage(ValueError, "Cannot merge across schemas on ordering 'foo'."):
+            SchemaQuerySet(UnmanagedBar).order_by('foo').merge_across_schemas(self.table_schemas_list())
+        with self.assertRaisesMessage(TypeError, 'Cannot merge across schemas after .values() or .values_list().'):
+            self.queryset.values('pk').merge_across_schemas(self.table_schemas_list())
+
+
+class ResultCacheTests(TableSchemasMixin, TransactionTestCase):
+    def setUp(self):
+        self.result_cache = ResultCache()
+        foos, other_foos = self.querysets(UnmanagedFoo)
+        self.foo = foos.create()
+        self.other_foo = other_foos.create()
+        self.queryset = foos.cache(self.result_cache)
+        self.other_queryset = self.queryset.retarget(self.other_table_schemas)
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE schema.foo, schema.bar, other.foo, other.bar')
+
+    def assertCached(self, queryset, expected):
+        with self.assertNumQueries(0):
+            self.assertEqual([foo.pk for foo in queryset.all()], expected)
+
+    def assertNotCached(self, queryset, expected):
+        with self.assertNumQueries(1):
+            self.assertEqual([foo.pk for foo in queryset.all()], expected)
+
+    def test_hit(self):
+        self.assertNotCached(self.queryset, [self.foo.pk])
+        self.assertCached(self.queryset.all(), [self.foo.pk])
+        self.assertEqual(self.queryset.all()[0]._state.table_schemas, self.table_schemas)
+        self.assertNotCached(self.other_queryset, [self.other_foo.pk])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.queryset.count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.queryset.count(), 1)
+        self.assertNotCached(self.queryset.filter(pk=self.foo.pk + 1), [])
+        self.assertNotCached(SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas), [self.foo.pk])
+
+    def test_write_invalidation(self):
+        self.assertNotCached(self.queryset, [self.foo.pk])
+        self.assertNotCached(self.other_queryset, [self.other_foo.pk])
+        foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).create()
+        self.assertNotCached(self.queryset, [self.foo.pk, foo.pk])
+        # Other schemas are unaffected.
+        self.assertCached(self.other_queryset, [self.other_foo.pk])
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).filter(pk=foo.pk).update(id=foo.pk + 10)
+        self.assertNotCached(self.queryset, [self.foo.pk, foo.pk + 10])
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).filter(pk=foo.pk + 10).delete()
+        self.assertNotCached(self.queryset, [self.foo.pk])
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).copy_from([UnmanagedFoo(pk=100)], ['id'])
+        self.assertNotCached(self.queryset, [self.foo.pk, 100])
+        self.assertCached(self.other_queryset, [self.other_foo.pk])
+
+    def test_copy_invalidation(self):
+        queryset = self.queryset.order_by('pk')
+        other_queryset = self.other_queryset.order_by('pk')
+        pk = max(self.foo.pk, self.other_foo.pk) + 1
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).create(pk=pk)
+        self.assertNotCached(queryset, [self.foo.pk, pk])
+        self.assertNotCached(other_queryset, [self.other_foo.pk])
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).filter(pk=pk).move_to(self.other_table_schemas)
+        self.assertNotCached(queryset, [self.foo.pk])
+        self.assertNotCached(other_queryset, [self.other_foo.pk, pk])
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas).filter(pk=pk).copy_to_schema(
+            self.table_schemas
+        )
+        self.assertNotCached(queryset, [self.foo.pk, pk])
+        self.assertCached(other_queryset, [self.other_foo.pk, pk])
+
+    def test_related_table_invalidation(self):
+        queryset = self.queryset.filter(bars__isnull=False)
+        self.assertNotCached(queryset, [])
+        bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas).create(foo=self.foo)
+        self.assertNotCached(queryset, [self.foo.pk])
+        bar.foo = None
+        bar.save()
+        self.assertNotCached(queryset, [])
+        bar.foo = self.foo
+        bar.save()
+        self.assertNotCached(queryset, [self.foo.pk])
+        bar.delete()
+        self.assertNotCached(queryset, [])
+        SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).create(foo=self.other_foo)
+        self.assertCached(queryset, [])
+
+    def test_across_schemas(self):
+        queryset = self.queryset.across_schemas(self.table_schemas_list())
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(queryset.values_list('schema', 'pk')), [
+                ('other', self.other_foo.pk), ('schema', self.foo.pk),
+            ])
+        with self.assertNumQueries(0):
+            list(queryset.values_list('schema', 'pk'))
+        queryset.update(id=F('id') + 10)
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(queryset.values_list('schema', 'pk')), [
+                ('other', self.other_foo.pk + 10), ('schema', self.foo.pk + 10),
+            ])
+
+    def test_transaction(self):
+        self.assertNotCached(self.queryset, [self.foo.pk])
+        with transaction.atomic():
+            foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).create()
+            # The write of the transaction isn't committed yet.
+            self.assertNotCached(self.queryset, [self.foo.pk, foo.pk])
+            self.assertNotCached(self.queryset, [self.foo.pk, foo.pk])
+            self.assertCached(self.other_queryset.none(), [])
+            transaction.set_rollback(True)
+        self.assertCached(self.queryset, [self.foo.pk])
+        with transaction.atomic():
+            foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).create()
+        self.assertNotCached(self.queryset, [self.foo.pk, foo.pk])
+
+    def test_maxbytes(self):
+        result_cache = ResultCache(maxbytes=1)
+        queryset = self.queryset.cache(result_cache)
+        self.assertNotCached(queryset, [self.foo.pk])
+        self.assertNotCached(queryset, [self.foo.pk])
+        self.assertEqual(result_cache.info()['currsize'], 0)
+
+    def test_backend(self):
+        result_cache = ResultCache(backend='default')
+        self.assertNotCached(self.queryset.cache(result_cache), [self.foo.pk])
+        # Shared with the caches of other processes.
+        self.assertCached(self.queryset.cache(ResultCache(backend='default')), [self.foo.pk])
+        SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).filter(pk=self.foo.pk).delete()
+        self.assertNotCached(self.queryset.cache(ResultCache(backend='default')), [])
+
+    def test_search_path(self):
+        queryset = SchemaQuerySet(
+            UnmanagedFoo, table_schemas=self.table_schemas, search_path=True
+        ).cache(self.result_cache)
+        for table_schemas, foo in [(self.table_schemas, self.foo), (self.other_table_schemas, self.other_foo)]:
+            # The search path is set on misses.
+            with self.assertNumQueries(2):
+                self.assertEqual([obj.pk for obj in queryset.retarget(table_schemas)], [foo.pk])
+        self.assertCached(queryset, [self.foo.pk])
+
+
+class IdentityMapTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        foos, other_foos = cls.querysets(UnmanagedFoo)
+        bars, other_bars = cls.querysets(UnmanagedBar)
+        cls.foo = foos.create()
+        cls.bars = bars.bulk_create([UnmanagedBar(foo=cls.foo) for _ in range(2)])
+        cls.foo_subclass = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=cls.table_schemas).create()
+        # Same primary key in another schema.
+        cls.other_foo = other_foos.create(pk=cls.foo.pk)
+        other_bars.create(foo=cls.other_foo)
+
+    def setUp(self):
+        self.foos = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas)
+        self.bars = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+
+    def test_descriptors(self):
+        for descriptor in (UnmanagedBar.foo, UnmanagedFooSubclass.foo_ptr):
+            self.assertIsInstance(descriptor, IdentityMapDescriptorMixin)
+        self.assertNotIsInstance(Bar.foo, IdentityMapDescriptorMixin)
+
+    def test_forward_many_to_one(self):
+        with identity_map() as current:
+            bars = list(self.bars.all())
+            with self.assertNumQueries(1):
+                foo = bars[0].foo
+            with self.assertNumQueries(0):
+                self.assertIs(bars[1].foo, foo)
+            self.assertIn(foo, current)
+            other_bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).get()
+            with self.assertNumQueries(1):
+                self.assertEqual(other_bar.foo._state.table_schemas, self.other_table_schemas)
+        bars = list(self.bars.all())
+        with self.assertNumQueries(2):
+            self.assertIsNot(bars[0].foo, bars[1].foo)
+
+    def test_iteration(self):
+        with identity_map():
+            foo = self.foos.get(pk=self.foo.pk)
+            # Instances are registered but not shared by iteration.
+            self.assertIsNot(self.foos.get(pk=self.foo.pk), foo)
+            with self.assertNumQueries(1):
+                self.assertIs(self.bars.first().foo, foo)
+            bar = self.bars.select_related('foo').get(pk=self.bars[0].pk)
+            self.assertIsNot(bar.foo, foo)
+
+    def test_parent_link(self):
+        with identity_map():
+            foo = self.foos.get(pk=self.foo_subclass.pk)
+            foo_subclass = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.table_schemas).get()
+            with self.assertNumQueries(0):
+                self.assertIs(foo_subclass.foo_ptr, foo)
+
+    def test_save(self):
+        with identity_map() as current:
+            foo = self.foos.get(pk=self.foo.pk)
+            bar = self.bars.first()
+            foo.save()
+            self.assertIs(bar.foo, foo)
+            other_foo = UnmanagedFoo(pk=self.foo.pk)
+            other_foo.save(table_schemas=self.table_schemas)
+            self.assertIn(other_foo, current)
+            self.assertNotIn(foo, current)
+
+    def test_writes_eviction(self):
+        with identity_map() as current:
+            foo = self.foos.get(pk=self.foo.pk)
+            other_foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas).get()
+            self.bars.update(foo=None)
+            self.assertNotIn(foo, current)
+            self.assertIn(other_foo, current)
+            foo = self.foos.get(pk=self.foo.pk)
+            self.foos.filter(pk=self.foo_subclass.pk).delete()
+            self.assertNotIn(foo, current)
+            foo = self.foos.get(pk=self.foo.pk)
+            foo.delete()
+            self.assertEqual(len(current), 1)
+            current.clear()
+            self.assertEqual(len(current), 0)
+
+    def test_maxsize(self):
+        with identity_map(maxsize=1) as current:
+            foos = list(self.foos)
+            self.assertEqual(len(current), 1)
+            self.assertIn(foos[-1], current)
+
+    def test_middleware(self):
+        def get_response(request):
+            self.assertIsNotNone(current_identity_map())
+            return 'response'
+        self.assertEqual(IdentityMapMiddleware(get_response)(None), 'response')
+        self.assertIsNone(current_identity_map())
+
+
+@override_settings(DATABASE_ROUTERS=['schema_query.routers.SchemaRouter'], SCHEMA_DATABASES={'other': 'shard'})
+class SchemaRouterTests(TableSchemasMixin, TestCase):
+    multi_db = True
+
+    def setUp(self):
+        foos, other_foos = self.querysets(UnmanagedFoo)
+        self.foo = foos.create()
+        self.other_foo = other_foos.create()
+        self.queryset = foos
+
+    def rows(self, using, table):
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT id FROM %s ORDER BY id' % table)
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_writes(self):
+        self.assertEqual(self.rows('shard', 'other.foo'), [self.other_foo.pk])
+        self.assertEqual(self.rows('default', 'other.foo'), [])
+        self.assertEqual(self.rows('default', 'schema.foo'), [self.foo.pk])
+        self.assertEqual(self.other_foo._state.db, 'shard')
+        bar = UnmanagedBar(foo=self.other_foo)
+        bar.save(table_schemas=self.other_table_schemas)
+        self.assertEqual(self.rows('shard', 'other.bar'), [bar.pk])
+        # Related rows are collected from the same database.
+        self.other_foo.delete()
+        self.assertEqual(self.rows('shard', 'other.foo'), [])
+        with connections['shard'].cursor() as cursor:
+            cursor.execute('SELECT foo_id FROM other.bar')
+            self.assertEqual(cursor.fetchall(), [(None,)])
+
+    def test_reads(self):
+        other_foo = self.queryset.retarget(self.other_table_schemas).get()
+        self.assertEqual(other_foo.pk, self.other_foo.pk)
+        self.assertEqual(other_foo._state.db, 'shard')
+        bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).create(foo=other_foo)
+        self.assertEqual(list(other_foo.bars.all()), [bar])
+        self.assertEqual(bar.foo, other_foo)
+
+    def test_across_schemas(self):
+        queryset = self.queryset.across_schemas(self.table_schemas_list())
+        with self.assertNumQueries(1), self.assertNumQueries(1, using='shard'):
+            foos = list(queryset)
+        self.assertEqual(
+            [(foo.schema, foo.pk, foo._state.db) for foo in foos],
+            [('schema', self.foo.pk, 'default'), ('other', self.other_foo.pk, 'shard')],
+        )
+        self.assertEqual(queryset.count(), 2)
+        self.assertTrue(queryset.filter(schema='other').exists())
+        self.assertEqual(sorted(foo.pk for foo in queryset.iterator()), sorted([self.foo.pk, self.other_foo.pk]))
+        merged = self.queryset.merge_across_schemas(self.table_schemas_list())
+        self.assertEqual(len(merged[:2]), 2)
+        with self.assertRaisesMessage(TypeError, 'Cannot aggregate across schemas of many databases.'):
+            queryset.aggregate(Count('pk'))
+        self.assertEqual(queryset.update(id=F('id') + 10), (2, {'schema': 1, 'other': 1}))
+        self.assertEqual(self.rows('shard', 'other.foo'), [self.other_foo.pk + 10])
+        self.assertEqual(queryset.delete(), (2, {'schema': 1, 'other': 1}))
+        self.assertEqual(self.rows('shard', 'other.foo'), [])
+        self.assertEqual(self.rows('default', 'schema.foo'), [])
+
+    def test_bulk_update(self):
+        bars = [
+            SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).create()
+            for table_schemas in self.table_schemas_list()
+        ]
+        bars[0].foo, bars[1].foo = self.foo, self.other_foo
+        with self.assertNumQueries(1), self.assertNumQueries(1, using='shard'):
+            queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+            self.assertEqual(queryset.bulk_update(bars, ['foo']), 2)
+        with connections['shard'].cursor() as cursor:
+            cursor.execute('SELECT foo_id FROM other.bar')
+            self.assertEqual(cursor.fetchall(), [(self.other_foo.pk,)])
+
+    def test_single_database(self):
+        queryset = self.queryset.across_schemas([self.other_table_schemas])
+        self.assertEqual(queryset.db, 'shard')
+        self.assertEqual([foo.pk for foo in queryset], [self.other_foo.pk])
+        self.assertEqual(queryset.count(), 1)
+
+
+class PreparedStatementsTests(TableSchemasMixin, TransactionTestCase):
+    def setUp(self):
+        self.prepared_statements = PreparedStatements(maxsize=2, threshold=2)
+        foos, other_foos = self.querysets(UnmanagedFoo)
+        self.foo = foos.create()
+        self.other_foo = other_foos.create()
+        self.queryset = foos.prepare(self.prepared_statements)
+
+    def tearDown(self):
+        self.prepared_statements.clear()
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE schema.foo, schema.bar, other.foo, other.bar')
+
+    def prepared(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT statement FROM pg_prepared_statements WHERE name LIKE 'schema_query_%%'")
+            return sorted(statement for statement, in cursor.fetchall())
+
+    def test_placeholders_sql(self):
+        self.assertEqual(
+            placeholders_sql("SELECT %s, '%%' WHERE a LIKE %s"), ("SELECT $1, '%' WHERE a LIKE $2", 2),
+        )
+        self.assertEqual(placeholders_sql('SELECT 1'), ('SELECT 1', 0))
+
+    def test_prepare(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.queryset.get(pk=self.foo.pk), self.foo)
+        self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.queryset.get(pk=self.foo.pk), self.foo)
+        self.assertTrue(queries[0]['sql'].startswith('PREPARE schema_query_'))
+        self.assertTrue(queries[-1]['sql'].startswith('EXECUTE schema_query_'))
+        with CaptureQueriesContext(connection) as queries:
+            foo = self.queryset.get(pk=self.foo.pk)
+        self.assertEqual([query['sql'][:8] for query in queries], ['EXECUTE '])
+        self.assertEqual(foo._state.table_schemas, self.table_schemas)
+        self.assertEqual(len(self.prepared()), 1)
+        other_queryset = self.queryset.retarget(self.other_table_schemas)
+        for _ in range(2):
+            self.assertEqual(other_queryset.get(pk=self.other_foo.pk), self.other_foo)
+        self.assertEqual(len(self.prepared()), 2)
+        self.assertEqual(self.queryset.filter(pk=self.foo.pk + 1).first(), None)
+        info = self.prepared_statements.info()
+        self.assertEqual(info['prepared'], 2)
+        self.assertEqual(info['executions'], 3)
+
+    def test_eviction(self):
+        for lookup in ('pk', 'pk__gt', 'pk__lt'):
+            for _ in range(2):
+                list(self.queryset.filter(**{lookup: self.foo.pk}))
+        self.assertEqual(len(self.prepared()), 2)
+        info = self.prepared_statements.info()
+        self.assertEqual((info['prepared'], info['deallocated'], info['currsize']), (3, 1, 2))
+
+    def test_eviction_deallocated(self):
+        for lookup in ('pk', 'pk__gt'):
+            for _ in range(2):
+                list(self.queryset.filter(**{lookup: self.foo.pk}))
+        with connection.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+        with transaction.atomic():
+            for _ in range(2):
+                self.assertEqual(list(self.queryset.filter(pk__lt=self.foo.pk + 1)), [self.foo])
+            self.assertEqual(self.queryset.count(), 1)
+        info = self.prepared_statements.info()
+        self.assertEqual((info['prepared'], info['deallocated'], info['currsize']), (3, 0, 2))
+
+    def test_explain_failure(self):
+        with transaction.atomic():
+            for _ in range(2):
+                self.assertIsNone(self.prepared_statements.prepare(connection, 'SELECT %s::integer', ['a']))
+            self.assertEqual(self.queryset.count(), 1)
+        # The statement prepared before EXPLAIN failed was deallocated.
+        self.assertEqual(self.prepared(), [])
+        self.assertEqual(self.prepared_statements.info()['failures'], 1)
+
+    def test_search_path(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas, search_path=True).prepare(
+            self.prepared_statements
+        )
+        other_queryset = queryset.retarget(self.other_table_schemas)
+        for _ in range(3):
+            self.assertEqual(queryset.get(pk=self.foo.pk), self.foo)
+            self.assertEqual(other_queryset.get(pk=self.other_foo.pk), self.other_foo)
+        # The same statement text is prepared once per search path.
+        self.assertEqual(len(self.prepared()), 2)
+
+    def test_unpreparable(self):
+        queryset = self.queryset.extra(where=['%s IS NULL'], params=[None])
+        with transaction.atomic():
+            for _ in range(3):
+                self.assertEqual(list(queryset.all()), [self.foo])
+        self.assertEqual(self.prepared(), [])
+        self.assertEqual(self.prepared_statements.info()['failures'], 1)
+
+    def test_connection_recycling(self):
+        for _ in range(2):
+            self.queryset.get(pk=self.foo.pk)
+        self.assertEqual(self.prepared_statements.info()['currsize'], 1)
+        connection.close()
+        self.assertEqual(self.prepared_statements.info()['currsize'], 0)
+        for _ in range(2):
+            self.assertEqual(self.queryset.get(pk=self.foo.pk), self.foo)
+        self.assertEqual(len(self.prepared()), 1)
+
+    def test_planning_time_saved(self):
+        for _ in range(10):
+            self.queryset.get(pk=self.foo.pk)
+        info = self.prepared_statements.info()
+        self.assertGreater(info['generic_plans'], 0)
+        self.assertGreater(info['planning_time_saved'], 0)
+
+
+class BulkUpdateTests(TableSchemasMixin, TestCase):
+    def setUp(self):
+        self.foos = {
+            table_schemas[UnmanagedFoo._meta.db_table]: SchemaQuerySet(
+                UnmanagedFoo, table_schemas=table_schemas
+            ).create()
+            for table_schemas in self.table_schemas_list()
+        }
+        self.bars = [
+            SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).create()
+            for table_schemas in self.table_schemas_list() for _ in range(3)
+        ]
+        self.queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+
+    def test_bulk_update(self):
+        for bar in self.bars:
+            bar.foo = self.foos[bar._state.table_schemas[UnmanagedBar._meta.db_table]]
+        # Two batches per schema.
+        with self.assertNumQueries(4):
+            self.assertEqual(self.queryset.bulk_update(self.bars, ['foo'], batch_size=2), 6)
+        for table_schemas in self.table_schemas_list():
+            schema = table_schemas[UnmanagedFoo._meta.db_table]
+            self.assertEqual(
+                list(SchemaQuerySet(UnmanagedBar, table_schemas=table_schemas).values_list('foo', flat=True)),
+                [self.foos[schema].pk] * 3,
+            )
+        for bar in self.bars:
+            bar.foo = None
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.queryset.bulk_update(self.bars, ['foo']), 6)
+        self.assertEqual(len(queries), 2)
+        self.assertIn('UPDATE "other"."bar" SET "foo_id" = "v"."foo_id" FROM (VALUES', queries[1]['sql'])
+        self.assertFalse(SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).exclude(
+            foo=None,
+        ).exists())
+
+    def test_unsaved_table_schemas(self):
+        bar = UnmanagedBar(pk=self.bars[0].pk, foo=self.foos['schema'])
+        self.assertEqual(self.queryset.bulk_update([bar], ['foo']), 1)
+        self.assertEqual(self.queryset.get(pk=bar.pk).foo_id, self.foos['schema'].pk)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.queryset.bulk_update([], ['foo']), 0)
+
+    def test_invalid(self):
+        with self.assertRaisesMessage(ValueError, 'Field names must be given to bulk_update().'):
+            self.queryset.bulk_update(self.bars, [])
+        with self.assertRaisesMessage(ValueError, 'Batch size must be a positive integer.'):
+            self.queryset.bulk_update(self.bars, ['foo'], batch_size=0)
+        with self.assertRaisesMessage(ValueError, 'All bulk_update() objects must have a primary key set.'):
+            self.queryset.bulk_update([UnmanagedBar()], ['foo'])
+        with self.assertRaisesMessage(ValueError, 'bulk_update() can only be used with concrete fields.'):
+            self.queryset.bulk_update(self.bars, ['foos'])
+        with self.assertRaisesMessage(ValueError, 'bulk_update() cannot be used with primary key fields.'):
+            self.queryset.bulk_update(self.bars, ['id'])
+
+
+class CopyToSchemaTests(TableSchemasMixin, TestCase):
+    def setUp(self):
+        self.foos = [SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).create() for _ in range(3)]
+        self.subclass = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.table_schemas).create()
+        self.bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas).create(foo=self.foos[0])
+        self.through = SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=self.table_schemas).create(
+            bar=self.bar, foo=self.foos[0],
+        )
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas)
+
+    def pks(self, model, table_schemas):
+        return sorted(SchemaQuerySet(model, table_schemas=table_schemas).values_list('pk', flat=True))
+
+    def test_copy_to_schema(self):
+        pks = [self.foos[0].pk, self.foos[1].pk]
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                self.queryset.filter(pk__in=pks).copy_to_schema(self.other_table_schemas),
+                (2, {'tests.UnmanagedFoo': 2}),
+            )
+        self.assertEqual(self.pks(UnmanagedFoo, self.other_table_schemas), pks)
+        self.assertEqual(len(self.pks(UnmanagedFoo, self.table_schemas)), 4)
+        # Sequences of the target tables are advanced past the copied keys.
+        foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas).create()
+        self.assertGreater(foo.pk, max(pks))
+
+    def test_copy_to_schema_related(self):
+        copied = self.queryset.filter(pk__in=[self.foos[0].pk, self.subclass.pk]).copy_to_schema(
+            self.other_table_schemas, related=True,
+        )
+        self.assertEqual(copied, (4, {
+            'tests.UnmanagedFoo': 2, 'tests.UnmanagedFooSubclass': 1, 'tests.UnamanagedBarFoos': 1,
+        }))
+        self.assertEqual(self.pks(UnmanagedFooSubclass, self.other_table_schemas), [self.subclass.pk])
+        self.assertEqual(self.pks(UnmanagedBar.foos.through, self.other_table_schemas), [self.through.pk])
+        # Relations set to NULL by deletions don't follow along.
+        self.assertEqual(self.pks(UnmanagedBar, self.other_table_schemas), [])
+
+    def test_move_to(self):
+        moved = self.queryset.filter(pk=self.foos[0].pk).move_to(self.other_table_schemas, related=True)
+        self.assertEqual(moved, (2, {
+            'tests.UnmanagedFoo': 1, 'tests.UnmanagedFooSubclass': 0, 'tests.UnamanagedBarFoos': 1,
+        }))
+        self.assertEqual(self.pks(UnmanagedFoo, self.other_table_schemas), [self.foos[0].pk])
+        self.assertEqual(self.pks(UnmanagedBar.foos.through, self.other_table_schemas), [self.through.pk])
+        self.assertNotIn(self.foos[0].pk, self.pks(UnmanagedFoo, self.table_schemas))
+        self.assertEqual(self.pks(UnmanagedBar.foos.through, self.table_schemas), [])
+        self.assertIsNone(SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas).get().foo_id)
+
+    def test_move_to_dependents(self):
+        message = 'Cannot move tests.UnmanagedFoo rows referenced by %s without related=True.'
+        with self.assertRaisesMessage(ValueError, message % 'tests.UnamanagedBarFoos.foo'):
+            self.queryset.filter(pk=self.foos[0].pk).move_to(self.other_table_schemas)
+        with self.assertRaisesMessage(ValueError, message % 'tests.UnmanagedFooSubclass.foo_ptr'):
+            self.queryset.filter(pk=self.subclass.pk).move_to(self.other_table_schemas)
+        self.assertEqual(self.pks(UnmanagedFoo, self.other_table_schemas), [])
+        self.assertEqual(len(self.pks(UnmanagedFoo, self.table_schemas)), 4)
+        self.assertEqual(self.pks(UnmanagedBar.foos.through, self.table_schemas), [self.through.pk])
+        bars = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+        self.assertEqual(bars.get().foo_id, self.foos[0].pk)
+        # Nullable relations are set to NULL.
+        bar = bars.create(foo=self.foos[1])
+        self.assertEqual(
+            self.queryset.filter(pk=self.foos[1].pk).move_to(self.other_table_schemas),
+            (1, {'tests.UnmanagedFoo': 1}),
+        )
+        self.assertEqual(self.pks(UnmanagedFoo, self.other_table_schemas), [self.foos[1].pk])
+        self.assertIsNone(bars.get(pk=bar.pk).foo_id)
+
+    def test_move_to_subclass(self):
+        queryset = SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.table_schemas)
+        self.assertEqual(queryset.move_to(self.other_table_schemas), (2, {
+            'tests.UnmanagedFooSubclass': 1, 'tests.UnmanagedFoo': 1,
+        }))
+        self.assertEqual(self.pks(UnmanagedFooSubclass, self.other_table_schemas), [self.subclass.pk])
+        self.assertEqual(self.pks(UnmanagedFoo, self.other_table_schemas), [self.subclass.pk])
+        self.assertFalse(queryset.exists())
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.queryset.none().move_to(self.other_table_schemas), (0, {'tests.UnmanagedFoo': 0}),
+            )
+
+    def test_invalid(self):
+        with self.assertRaisesMessage(ValueError, "Cannot copy 'foo' rows to their own schema."):
+            self.queryset.copy_to_schema(self.table_schemas)
+        with self.assertRaisesMessage(ValueError, "The target table schemas don't map 'foosubclass'."):
+            self.queryset.move_to({UnmanagedFoo._meta.db_table: 'other'}, related=True)
+        with self.assertRaisesMessage(TypeError, 'Cannot call move_to() after across_schemas() or retarget().'):
+            self.queryset.retarget(self.other_table_schemas).move_to(self.table_schemas)
+
+
+class UpsertTests(TableSchemasMixin, TestCase):
+    def setUp(self):
+        self.foos = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas).bulk_create(
+            [UnmanagedFoo() for _ in range(2)]
+        )
+        self.bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas).create(foo=self.foos[0])
+        self.queryset = SchemaQuerySet(UnmanagedBar, table_schemas=self.table_schemas)
+
+    def test_upsert(self):
+        with self.assertNumQueries(1):
+            bar, created = self.queryset.upsert(id=self.bar.pk, defaults={'foo': self.foos[1]})
+        self.assertFalse(created)
+        self.assertEqual((bar.pk, bar.foo_id), (self.bar.pk, self.foos[1].pk))
+        self.assertEqual(bar._state.table_schemas, self.table_schemas)
+        self.assertFalse(bar._state.adding)
+        self.assertEqual(self.queryset.get().foo_id, self.foos[1].pk)
+        bar, created = self.queryset.upsert(id=self.bar.pk + 1, defaults={'foo': self.foos[0]})
+        self.assertTrue(created)
+        self.assertEqual(self.queryset.get(pk=bar.pk).foo_id, self.foos[0].pk)
+
+    def test_upsert_without_defaults(self):
+        through = SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=self.other_table_schemas)
+        foo = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas).create()
+        bar = SchemaQuerySet(UnmanagedBar, table_schemas=self.other_table_schemas).create()
+        obj, created = through.upsert(bar=bar, foo=foo)
+        self.assertTrue(created)
+        self.assertIsNotNone(obj.pk)
+        xmin_sql = 'SELECT xmin::text FROM other.bar_foos WHERE id = %s'
+        with connection.cursor() as cursor:
+            cursor.execute(xmin_sql, [obj.pk])
+            xmin = cursor.fetchone()
+        with self.assertNumQueries(2):
+            existing, created = through.upsert(bar=bar, foo=foo)
+        self.assertFalse(created)
+        self.assertEqual(existing.pk, obj.pk)
+        # The existing row isn't updated.
+        with connection.cursor() as cursor:
+            cursor.execute(xmin_sql, [obj.pk])
+            self.assertEqual(cursor.fetchone(), xmin)
+        self.assertEqual(existing._state.table_schemas, self.other_table_schemas)
+        self.assertEqual(through.count(), 1)
+
+    def test_bulk_upsert(self):
+        bars = [UnmanagedBar(pk=self.bar.pk, foo=self.foos[1])] + [
+            UnmanagedBar(pk=pk, foo=self.foos[0]) for pk in range(self.bar.pk + 1, self.bar.pk + 4)
+        ]
+        with self.assertNumQueries(2):
+            upserted = self.queryset.bulk_upsert(bars, ['id'], ['foo'], batch_size=2)
+        self.assertEqual(upserted, bars)
+        self.assertEqual(
+            list(self.queryset.order_by('pk').values_list('pk', 'foo')),
+            [(bar.pk, bar.foo_id) for bar in bars],
+        )
+        self.assertTrue(all(bar._state.table_schemas == self.table_schemas for bar in bars))
+
+    def test_retargeted(self):
+        # Inserts would be compiled against the mapping the queryset was built
+        # with.
+        queryset = self.queryset.retarget(self.other_table_schemas)
+        message = 'Cannot call %s() after across_schemas() or retarget().'
+        with self.assertRaisesMessage(TypeError, message % 'upsert'):
+            queryset.upsert(pk=self.bar.pk)
+        with self.assertRaisesMessage(TypeError, message % 'bulk_upsert'):
+            queryset.bulk_upsert([UnmanagedBar(pk=self.bar.pk)], ['pk'])
+        self.assertFalse(queryset.exists())
+
+    def test_bulk_upsert_batch_size_per_group(self):
+        bars = [UnmanagedBar(foo=self.foos[0])] + [
+            UnmanagedBar(pk=pk, foo=self.foos[1]) for pk in (self.bar.pk, self.bar.pk + 100, self.bar.pk + 101)
+        ]
+        # Each group is upserted by a single statement.
+        with self.assertNumQueries(2):
+            self.queryset.bulk_upsert(bars, ['id'], ['foo'])
+        self.assertEqual(self.queryset.count(), 4)
+        self.assertEqual(self.queryset.filter(foo=self.foos[1]).count(), 3)
+
+    def test_bulk_upsert_do_nothing(self):
+        through = SchemaQuerySet(UnmanagedBar.foos.through, table_schemas=self.table_schemas)
+        existing = through.create(bar=self.bar, foo=self.foos[0])
+        objs = [through.model(bar=self.bar, foo=foo) for foo in self.foos]
+        with CaptureQueriesContext(connection) as queries:
+            through.bulk_upsert(objs, ['bar', 'foo'])
+        self.assertIn('ON CONFLICT ("bar_id", "foo_id") DO NOTHING', queries[0]['sql'])
+        self.assertIsNone(objs[0].pk)
+        self.assertIsNotNone(objs[1].pk)
+        self.assertEqual(sorted(through.values_list('pk', flat=True)), [existing.pk, objs[1].pk])
+
+    def test_invalid(self):
+        with self.assertRaisesMessage(ValueError, 'Conflict fields must be given to upsert().'):
+            self.queryset.upsert(defaults={'foo': self.foos[0]})
+        with self.assertRaisesMessage(ValueError, 'Conflict fields must be given to bulk_upsert().'):
+            self.queryset.bulk_upsert([UnmanagedBar()], [])
+        with self.assertRaisesMessage(ValueError, "Can't upsert into a multi-table inherited model"):
+            SchemaQuerySet(UnmanagedFooSubclass, table_schemas=self.table_schemas).upsert(pk=1)
+        self.assertEqual(self.queryset.bulk_upsert([], ['id']), [])
+
+
+class EstimatedCountTests(TableSchemasMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        SchemaQuerySet(UnmanagedFoo, table_schemas=cls.table_schemas).copy_from(
+            (UnmanagedFoo(pk=pk) for pk in range(1, 2001)), fields=['id']
+        )
+        SchemaQuerySet(UnmanagedFoo, table_schemas=cls.other_table_schemas).bulk_create(
+            [UnmanagedFoo(pk=pk) for pk in range(1, 4)]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE schema.foo')
+            cursor.execute('ANALYZE other.foo')
+
+    def setUp(self):
+        self.queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.table_schemas)
+        self.other_queryset = self.queryset.retarget(self.other_table_schemas)
+
+    def test_estimated_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.queryset.estimated_count(), 2000)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('pg_class', queries[0]['sql'])
+        self.assertIn('"schema"."foo"', queries[0]['sql'])
+        # Small tables are counted exactly.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.queryset.estimated_count(threshold=5000), 2000)
+        # Filtered querysets are counted exactly.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.queryset.filter(pk__lte=10).estimated_count(), 10)
+        self.assertEqual(self.queryset.none().estimated_count(), 0)
+
+    def fresh_bar_queryset(self):
+        # Statistics written by ANALYZE outlive the test transaction.
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA estimated')
+            cursor.execute('CREATE TABLE estimated.bar (LIKE other.bar INCLUDING ALL)')
+        return SchemaQuerySet(UnmanagedBar, table_schemas={UnmanagedBar._meta.db_table: 'estimated'})
+
+    def test_not_analyzed(self):
+        queryset = self.fresh_bar_queryset()
+        queryset.bulk_create([UnmanagedBar() for _ in range(2)])
+        self.assertEqual(queryset.estimated_count(threshold=0), 2)
+
+    def test_analyzed_empty(self):
+        # Tables which were never vacuumed nor analyzed before PostgreSQL 14
+        # have no pages nor rows recorded, like empty analyzed tables.
+        queryset = self.fresh_bar_queryset()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE estimated.bar')
+        queryset.bulk_create([UnmanagedBar() for _ in range(2)])
+        self.assertEqual(queryset.estimated_count(threshold=0), 2)
+
+    def test_grouped(self):
+        queryset = self.fresh_bar_queryset()
+        queryset.bulk_create([UnmanagedBar(foo_id=foo_id) for foo_id in (None, None, 1, 1)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE estimated.bar')
+        self.assertEqual(queryset.estimated_count(threshold=0), 4)
+        # Groups, distinct rows and annotated rows are counted exactly.
+        self.assertEqual(queryset.values('foo').annotate(count=Count('id')).estimated_count(threshold=0), 2)
+        self.assertEqual(queryset.values('foo').distinct().estimated_count(threshold=0), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(queryset.annotate(count=Count('id')).estimated_count(threshold=0), 4)
+        self.assertNotIn('pg_class', queries[0]['sql'])
+
+    def test_across_schemas(self):
+        queryset = self.queryset.across_schemas(self.table_schemas_list())
+        with self.assertNumQueries(2):
+            self.assertEqual(queryset.estimated_count(), (2003, {'schema': 2000, 'other': 3}))
+        self.assertEqual(
+            queryset.filter(pk__lte=2).estimated_count(), (4, {'schema': 2, 'other': 2}),
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(queryset.estimated_count(threshold=0), (2003, {'schema': 2000, 'other': 3}))
+
+    def test_search_path(self):
+        queryset = SchemaQuerySet(UnmanagedFoo, table_schemas=self.other_table_schemas, search_path=True)
+        self.assertEqual(queryset.estimated_count(), 3)
+        self.assertEqual(queryset.filter(pk__gt=1).estimated_count(), 2)